@@ -0,0 +1,92 @@
+"""Mediciones de rendimiento de piezas internas del bot
+
+Uso:
+    python benchmarks.py
+"""
+import random
+import string
+import timeit
+import tracemalloc
+
+from juegos import JuegoAhorcado, JuegoPiedraPapelTijeras, JuegoTrivia
+from keyword_matcher import KeywordMatcher
+
+
+MENSAJES = [
+    "hola, alguien sabe a qué hora empieza el evento de hoy?",
+    "me ayudan con un script en python para ordenar una lista",
+    "jajaja buenísimo ese meme, mandalo al canal general",
+    "mañana juego al ahorcado con los chicos del servidor",
+]
+
+
+def _palabras_aleatorias(cantidad: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    return [
+        ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 12)))
+        for _ in range(cantidad)
+    ]
+
+
+def bench_keyword_matcher(tamanos=(300, 1000, 3000, 10000), repeticiones: int = 2000):
+    """Costo por mensaje del matcher compilado frente a buscar palabra por palabra"""
+    print("Palabras clave | ingenuo (µs/msg) | compilado (µs/msg) | compilar (ms)")
+    for tamano in tamanos:
+        palabras = ['python', 'script'] + _palabras_aleatorias(tamano - 2)
+        inicio = timeit.default_timer()
+        matcher = KeywordMatcher(palabras)
+        compilar = (timeit.default_timer() - inicio) * 1000
+
+        def ingenuo():
+            for mensaje in MENSAJES:
+                texto = mensaje.lower()
+                any(palabra in texto for palabra in palabras)
+
+        def compilado():
+            for mensaje in MENSAJES:
+                matcher.search(mensaje)
+
+        por_msg = repeticiones * len(MENSAJES) / 1e6
+        t_ingenuo = timeit.timeit(ingenuo, number=repeticiones) / por_msg
+        t_compilado = timeit.timeit(compilado, number=repeticiones) / por_msg
+        print(f"{tamano:>14} | {t_ingenuo:>16.1f} | {t_compilado:>18.1f} | {compilar:>12.1f}")
+
+
+def _bytes_por_partida(crear, cantidad: int) -> float:
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    partidas = [crear(i) for i in range(cantidad)]
+    despues = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del partidas
+    return (despues - antes) / cantidad
+
+
+def bench_juegos(partidas: int = 10000):
+    """Memoria por partida y velocidad de los intentos del ahorcado"""
+    palabras = [p.upper() for p in _palabras_aleatorias(200, seed=2)]
+    crear = {
+        'JuegoAhorcado': lambda i: JuegoAhorcado(palabras[i % len(palabras)], ["pista 1", "pista 2"]),
+        'JuegoPiedraPapelTijeras': lambda i: JuegoPiedraPapelTijeras(),
+        'JuegoTrivia': lambda i: JuegoTrivia("¿Pregunta?", ["a", "b", "c", "d"], i % 4),
+    }
+    print("Juego                   | bytes/partida")
+    for nombre, fabrica in crear.items():
+        print(f"{nombre:<23} | {_bytes_por_partida(fabrica, partidas):>13.0f}")
+
+    letras = string.ascii_uppercase
+    mejor = float('inf')
+    for _ in range(20):
+        # Solo se mide el costo de los intentos, no la creación de las partidas
+        juegos = [JuegoAhorcado(palabra) for palabra in palabras]
+        inicio = timeit.default_timer()
+        for juego in juegos:
+            for letra in letras:
+                juego.intentar_letra(letra)
+        mejor = min(mejor, timeit.default_timer() - inicio)
+    print(f"Intentos de letra por segundo: {len(palabras) * len(letras) / mejor:,.0f}")
+
+
+if __name__ == '__main__':
+    bench_keyword_matcher()
+    bench_juegos()
@@ -0,0 +1,157 @@
+from typing import Any, Dict, Iterable, List
+
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, UpdateResult
+
+from query import equality_value, upsert_document
+
+# Código de MongoDB para las claves duplicadas
+DUPLICATE_KEY = 11000
+
+
+class DuplicateKeyError(ValueError):
+    code = DUPLICATE_KEY
+
+
+def normalize_requests(requests: Iterable[Any]) -> List[tuple]:
+    """Convierte las operaciones de PyMongo (``InsertOne``, ``UpdateOne``...) en tuplas
+
+    Cada tupla es ``(tipo, filtro, documento, upsert, multi)``, con tipo
+    ``insert``, ``update``, ``replace`` o ``delete``.
+    """
+    normalized = []
+    for request in requests:
+        if isinstance(request, InsertOne):
+            normalized.append(('insert', None, request._doc, False, False))
+        elif isinstance(request, (UpdateOne, UpdateMany)):
+            normalized.append(('update', request._filter, request._doc, bool(request._upsert),
+                               isinstance(request, UpdateMany)))
+        elif isinstance(request, ReplaceOne):
+            normalized.append(('replace', request._filter, request._doc, bool(request._upsert), False))
+        elif isinstance(request, (DeleteOne, DeleteMany)):
+            normalized.append(('delete', request._filter, None, False, isinstance(request, DeleteMany)))
+        else:
+            raise TypeError(f"Operación no soportada en bulk_write: {request!r}")
+    return normalized
+
+
+class BulkTarget:
+    """Primitivas de una colección local que usa ``execute``
+
+    Cada almacenamiento implementa estas operaciones solo en memoria y deja
+    toda la persistencia para ``commit()``, que se llama una única vez al final.
+    """
+
+    def insert(self, doc: Dict[str, Any]) -> Any:
+        """Inserta el documento (asignando ``_id`` si falta) y devuelve su ``_id``"""
+        raise NotImplementedError
+
+    def match(self, filter: Dict[str, Any], multi: bool) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, doc: Dict[str, Any], update: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    def replace(self, doc: Dict[str, Any], replacement: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    def delete(self, docs: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def commit(self) -> None:
+        raise NotImplementedError
+
+
+def execute(requests: Iterable[Any], target: BulkTarget, ordered: bool = True) -> BulkWriteResult:
+    """Ejecuta un ``bulk_write`` sobre un almacenamiento local
+
+    Con ``ordered=True`` se detiene en el primer error; si no, sigue con el
+    resto. Lo aplicado se persiste igual y los errores se informan al final con
+    un ``BulkWriteError``, como hace PyMongo.
+    """
+    result = {
+        'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0,
+        'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': [], 'insertedIds': {},
+    }
+    try:
+        for index, (kind, filter, doc, upsert, multi) in enumerate(normalize_requests(requests)):
+            try:
+                _execute_one(target, result, index, kind, filter or {}, doc, upsert, multi)
+            except ValueError as e:
+                result['writeErrors'].append({
+                    'index': index, 'code': getattr(e, 'code', 2), 'errmsg': str(e), 'op': doc or filter,
+                })
+                if ordered:
+                    break
+    finally:
+        target.commit()
+
+    if result['writeErrors']:
+        raise BulkWriteError(result)
+    return BulkWriteResult(result, True)
+
+
+def _execute_one(target: BulkTarget, result: dict, index: int, kind: str,
+                 filter: dict, doc: Any, upsert: bool, multi: bool) -> None:
+    if kind == 'insert':
+        result['insertedIds'][index] = target.insert(doc)
+        result['nInserted'] += 1
+        return
+
+    matches = target.match(filter, multi)
+    if kind == 'delete':
+        target.delete(matches)
+        result['nRemoved'] += len(matches)
+        return
+
+    if not matches:
+        if upsert:
+            if kind == 'update':
+                new_doc = upsert_document(filter, doc)
+            else:
+                new_doc = dict(doc)
+                found, doc_id = equality_value(filter, '_id')
+                if found and '_id' not in new_doc:
+                    new_doc['_id'] = doc_id
+            result['upserted'].append({'index': index, '_id': target.insert(new_doc)})
+            result['nUpserted'] += 1
+        return
+
+    result['nMatched'] += len(matches)
+    for match in matches:
+        changed = target.update(match, doc) if kind == 'update' else target.replace(match, doc)
+        result['nModified'] += int(changed)
+
+
+class BulkOperations:
+    """``insert_many``, ``update_many`` y ``delete_many`` sobre ``bulk_write``
+
+    Los almacenamientos solo tienen que implementar
+    ``bulk_write(collection, requests, ordered)``; cada llamada hace una sola
+    pasada de persistencia y devuelve los mismos objetos de resultado que PyMongo.
+    """
+
+    def bulk_write(self, collection: str, requests: Iterable[Any], ordered: bool = True) -> BulkWriteResult:
+        raise NotImplementedError
+
+    def insert_many(self, collection: str, documents: Iterable[Dict[str, Any]],
+                    ordered: bool = True) -> InsertManyResult:
+        result = self.bulk_write(collection, [InsertOne(doc) for doc in documents], ordered)
+        return InsertManyResult(list(result.bulk_api_result['insertedIds'].values()), True)
+
+    def update_many(self, collection: str, filter: Dict[str, Any], update: Dict[str, Any],
+                    upsert: bool = False) -> UpdateResult:
+        result = self.bulk_write(collection, [UpdateMany(filter, update, upsert=upsert)])
+        return update_result(result)
+
+    def delete_many(self, collection: str, filter: Dict[str, Any]) -> DeleteResult:
+        result = self.bulk_write(collection, [DeleteMany(filter)])
+        return DeleteResult({'n': result.deleted_count}, True)
+
+
+def update_result(result: BulkWriteResult) -> UpdateResult:
+    raw = {'n': result.matched_count + result.upserted_count, 'nModified': result.modified_count}
+    if result.upserted_ids:
+        raw['upserted'] = result.upserted_ids[0]
+    return UpdateResult(raw, True)
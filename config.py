@@ -1,12 +1,30 @@
 import os
+import re
 import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Any, Optional, List
-from pymongo import MongoClient
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, Optional, List
+from pymongo import DESCENDING, InsertOne
 from pymongo.database import Database
 
-class DataStore:
-    """Clase base para el almacenamiento de datos"""
+import mongo_pool
+from bulk import BulkOperations, BulkTarget, DuplicateKeyError, execute
+from retention import DEFAULT_RETENTION, RetentionPolicy, apply_mongo_retention
+from query import Cursor, apply_modifiers, apply_update, compile_query, equality_value, query_shape
+from storage_io import GroupCommitWriter, atomic_write, get_codec, quarantine, read_file
+
+class DataStore(BulkOperations):
+    """Clase base para el almacenamiento de datos
+    
+    ``insert_many``, ``update_many`` y ``delete_many`` vienen de
+    ``BulkOperations`` y se apoyan en ``bulk_write``.
+    """
+    
+    retention: Dict[str, RetentionPolicy] = {}
     
     def __init__(self):
         self.using_mongodb = False
@@ -17,93 +35,785 @@ class DataStore:
     def insert_one(self, collection: str, document: dict) -> None:
         raise NotImplementedError
     
-    def find(self, collection: str, query: dict = None) -> List[Dict[str, Any]]:
+    def find(self, collection: str, query: dict = None, projection=None,
+             sort=None, skip: int = 0, limit: int = 0) -> Iterable[Dict[str, Any]]:
+        """Devuelve un cursor perezoso con soporte de sort/skip/limit/projection"""
+        raise NotImplementedError
+    
+    def update_one(self, collection: str, filter: dict, update: dict) -> Any:
         raise NotImplementedError
+    
+    def _ttl_timestamp(self) -> Any:
+        return datetime.now(timezone.utc).isoformat()
+    
+    def _stamp_ttl(self, collection: str, document: dict) -> Optional[RetentionPolicy]:
+        """Agrega la fecha de creación si la colección expira por TTL; devuelve la política"""
+        policy = self.retention.get(collection)
+        if policy and policy.ttl_seconds and policy.ttl_field not in document:
+            document[policy.ttl_field] = self._ttl_timestamp()
+        return policy
 
 
 class MongoDataStore(DataStore):
-    """Implementación de DataStore usando MongoDB"""
+    """Implementación de DataStore usando MongoDB
+    
+    Usa el cliente compartido de ``mongo_pool`` y no toca el servidor hasta la
+    primera operación, cuando crea las colecciones que falten.
+    """
     
-    def __init__(self, mongo_uri: str, db_name: str):
+    def __init__(self, mongo_uri: str, db_name: str,
+                 retention: Dict[str, RetentionPolicy] = None):
         super().__init__()
-        self.client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
-        self.db = self.client[db_name]
+        self.client = mongo_pool.get_client(mongo_uri)
+        self._db = self.client[db_name]
+        self._prepared = False
+        self._prepare_lock = threading.Lock()
         self.using_mongodb = True
+        self.retention = DEFAULT_RETENTION if retention is None else retention
+    
+    @property
+    def db(self) -> Database:
+        if not self._prepared:
+            with self._prepare_lock:
+                if not self._prepared:
+                    self._prepare()
+                    self._prepared = True
+        return self._db
+    
+    def _prepare(self) -> None:
+        # Las colecciones con política se crean capped o con índice TTL
+        apply_mongo_retention(self._db, self.retention)
         
         # Crear colecciones necesarias si no existen
+        existing = set(self._db.list_collection_names())
         for collection in ['server_settings', 'preguntas', 'logs']:
-            if collection not in self.db.list_collection_names():
-                self.db.create_collection(collection)
+            if collection not in existing:
+                self._db.create_collection(collection)
     
     def find_one(self, collection: str, query: dict) -> Optional[Dict[str, Any]]:
         return self.db[collection].find_one(query)
     
+    def _ttl_timestamp(self) -> Any:
+        # El índice TTL solo expira fechas BSON
+        return datetime.now(timezone.utc)
+    
     def insert_one(self, collection: str, document: dict) -> None:
+        self._stamp_ttl(collection, document)
         return self.db[collection].insert_one(document)
     
-    def find(self, collection: str, query: dict = None) -> List[Dict[str, Any]]:
+    def insert_many(self, collection: str, documents: Iterable[dict], ordered: bool = True) -> Any:
+        documents = list(documents)
+        for document in documents:
+            self._stamp_ttl(collection, document)
+        return self.db[collection].insert_many(documents, ordered=ordered)
+    
+    def update_many(self, collection: str, filter: dict, update: dict, upsert: bool = False) -> Any:
+        return self.db[collection].update_many(filter, update, upsert=upsert)
+    
+    def delete_many(self, collection: str, filter: dict) -> Any:
+        return self.db[collection].delete_many(filter)
+    
+    def bulk_write(self, collection: str, requests: Iterable[Any], ordered: bool = True) -> Any:
+        requests = list(requests)
+        for request in requests:
+            if isinstance(request, InsertOne):
+                self._stamp_ttl(collection, request._doc)
+        return self.db[collection].bulk_write(requests, ordered=ordered)
+    
+    def find(self, collection: str, query: dict = None, projection=None,
+             sort=None, skip: int = 0, limit: int = 0) -> Iterable[Dict[str, Any]]:
         if query is None:
             query = {}
-        return list(self.db[collection].find(query))
+        # El cursor de PyMongo ya es perezoso y resuelve todo en el servidor
+        return self.db[collection].find(query, projection, sort=sort or None, skip=skip, limit=limit)
+    
+    def update_one(self, collection: str, filter: dict, update: dict) -> Any:
+        return self.db[collection].update_one(filter, update)
 
 
 class FileDataStore(DataStore):
-    """Implementación de DataStore usando archivos JSON"""
+    """Implementación de DataStore usando archivos JSON
+    
+    Las colecciones se guardan parseadas en memoria (indexadas por ``_id``) y
+    solo se vuelven a leer cuando cambian el mtime o el tamaño del archivo. Si
+    el tamaño en disco de las colecciones cargadas supera ``max_cache_bytes`` se
+    descartan enteras las usadas hace más tiempo.
+    
+    Las escrituras se agrupan durante ``write_window`` segundos y se hacen de
+    forma atómica (temporal + fsync + rename); ``flush()`` fuerza las pendientes.
+    El formato lo decide ``codec`` (ver ``storage_io.get_codec``) y al leer se
+    detecta por el contenido. Las políticas de ``retention`` se aplican al insertar.
+    
+    ``partitions`` (``{colección: campo}``, opcional) reparte una colección en un
+    archivo por valor del campo, ``data/<colección>/<valor>.json``: una escritura
+    solo reescribe su partición, las consultas con igualdad sobre el campo leen
+    una sola y las demás recorren las particiones de a una. Internamente cada
+    partición se cachea y se escribe como si fuera una colección ``colección/valor``.
+    Si al activar ``partitions`` todavía existe ``data/<colección>.json``, su
+    contenido se reparte en las particiones al primer uso y el archivo queda
+    apartado como ``<colección>.json.migrado``.
+    """
     
-    def __init__(self, data_dir: str = 'data'):
+    def __init__(self, data_dir: str = 'data', max_cache_bytes: int = 64 * 1024 * 1024,
+                 write_window: float = 0.2, retention: Dict[str, RetentionPolicy] = None,
+                 codec: str = None, partitions: Dict[str, str] = None):
         super().__init__()
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
         self.using_mongodb = False
+        self.max_cache_bytes = max_cache_bytes
+        # colección -> (firma del archivo, bytes en disco, documentos)
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.RLock()
+        self._writer = GroupCommitWriter(write_window, name='file-datastore-writer')
+        self.retention = DEFAULT_RETENTION if retention is None else retention
+        self.codec = get_codec(codec)
+        self.partitions = partitions or {}
+        # Colecciones particionadas cuyo archivo único ya se revisó
+        self._migrated = set()
     
     def _get_collection_path(self, collection: str) -> Path:
         return self.data_dir / f"{collection}.json"
     
+    def _partition_of(self, collection: str, document: dict) -> str:
+        """Archivo donde se guarda el documento"""
+        field = self.partitions.get(collection)
+        if field is None:
+            return collection
+        self._migrate_legacy(collection)
+        return self._partition_name(collection, document.get(field))
+    
+    @staticmethod
+    def _partition_name(collection: str, value: Any) -> str:
+        return collection + '/' + re.sub(r'[^\w.-]', '_', str(value))
+    
+    def _units(self, collection: str, query: dict) -> List[str]:
+        """Archivos que puede tocar una consulta: uno si filtra por la clave, si no todos"""
+        field = self.partitions.get(collection)
+        if field is None:
+            return [collection]
+        self._migrate_legacy(collection)
+        found, value = equality_value(query, field)
+        if found and not isinstance(value, (dict, list)):
+            return [self._partition_name(collection, value)]
+        
+        directory = self.data_dir / collection
+        names = {f"{collection}/{p.stem}" for p in directory.glob('*.json')} if directory.is_dir() else set()
+        # Particiones nuevas que todavía no llegaron al disco
+        prefix = collection + '/'
+        names.update(name for name in self._cache if name.startswith(prefix))
+        return sorted(names)
+    
+    def _migrate_legacy(self, collection: str) -> None:
+        """Reparte en particiones el archivo único escrito antes de activar ``partitions``
+        
+        Se llama con el lock tomado. Las particiones se escriben en el momento
+        y recién después se aparta el archivo original.
+        """
+        if collection in self._migrated:
+            return
+        self._migrated.add(collection)
+        legacy = self._get_collection_path(collection)
+        if not legacy.exists():
+            return
+        
+        field = self.partitions[collection]
+        units = {}
+        for doc_id, doc in self._load_collection(collection).items():
+            unit = self._partition_name(collection, doc.get(field))
+            if unit not in units:
+                units[unit] = self._load_collection(unit)
+            # Lo que ya estaba en una partición es más nuevo que el archivo único
+            units[unit].setdefault(doc_id, doc)
+        for unit, data in units.items():
+            path = self._get_collection_path(unit)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(str(path), self.codec.encode(data))
+            self._remember(unit, self._file_signature(path), data)
+        self._forget(collection)
+        destino = legacy.with_name(legacy.name + '.migrado')
+        os.replace(legacy, destino)
+        safe_print(f"Colección {collection} repartida en {len(units)} particiones; original en {destino}")
+    
+    @staticmethod
+    def _file_signature(path: Path) -> Optional[tuple]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+    
+    def _remember(self, collection: str, signature: Optional[tuple], data: Dict[str, Any]) -> None:
+        """Guarda la colección en la caché y expulsa las menos usadas si hace falta"""
+        self._forget(collection)
+        size = signature[1] if signature else 0
+        self._cache[collection] = (signature, size, data)
+        self._cache_bytes += size
+        # Las colecciones con escrituras pendientes no se pueden descartar
+        if self._cache_bytes > self.max_cache_bytes:
+            dirty = self._writer.pending()
+            for candidate in list(self._cache)[:-1]:
+                if self._cache_bytes <= self.max_cache_bytes:
+                    break
+                if str(self._get_collection_path(candidate)) not in dirty:
+                    self._forget(candidate)
+    
+    def _forget(self, collection: str) -> None:
+        cached = self._cache.pop(collection, None)
+        if cached is not None:
+            self._cache_bytes -= cached[1]
+    
     def _load_collection(self, collection: str) -> Dict[str, Any]:
         path = self._get_collection_path(collection)
-        if not path.exists():
-            return {}
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
+        signature = self._file_signature(path)
+        cached = self._cache.get(collection)
+        # Con una escritura pendiente o en curso la copia en memoria es la más nueva: el
+        # archivo puede cambiar de firma (rename de _write_collection) antes de que se re-firme
+        if cached is not None and (cached[0] == signature or str(path) in self._writer.pending()):
+            self._cache.move_to_end(collection)
+            return cached[2]
+        
+        data = {}
+        if signature is not None:
+            try:
+                data = read_file(path)
+            except ValueError as e:
+                safe_print(f"Colección {collection} ilegible ({e}); apartada en {quarantine(str(path))}")
+                signature = None
+            except FileNotFoundError:
+                signature = None
+        self._remember(collection, signature, data)
+        return data
     
     def _save_collection(self, collection: str, data: Dict[str, Any]) -> None:
+        """Marca la colección como sucia; el escritor la persiste agrupada"""
+        path = self._get_collection_path(collection)
+        self._writer.schedule(str(path), lambda: self._write_collection(collection))
+    
+    def _write_collection(self, collection: str) -> None:
         path = self._get_collection_path(collection)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with self._lock:
+            cached = self._cache.get(collection)
+            if cached is None:
+                return
+            contenido = self.codec.encode(cached[2])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(str(path), contenido)
+        with self._lock:
+            cached = self._cache.get(collection)
+            if cached is not None:
+                self._remember(collection, self._file_signature(path), cached[2])
+    
+    def flush(self) -> None:
+        """Escribe en disco todas las colecciones pendientes"""
+        self._writer.flush()
+    
+    @staticmethod
+    def _matching(data: Dict[str, Any], query: dict):
+        """Recorre los documentos que coinciden, buscando directo por _id si se puede"""
+        matches = compile_query(query)
+        doc_id = query.get('_id')
+        if isinstance(doc_id, str):
+            doc = data.get(doc_id)
+            docs = [doc] if doc is not None else []
+        else:
+            docs = data.values()
+        return (doc for doc in docs if matches(doc))
     
     def find_one(self, collection: str, query: dict) -> Optional[Dict[str, Any]]:
         if not query:
             return None
+        
+        with self._lock:
+            for unit in self._units(collection, query):
+                doc = next(self._matching(self._load_collection(unit), query), None)
+                if doc is not None:
+                    return dict(doc)
+            return None
+    
+    def insert_one(self, collection: str, document: dict) -> None:
+        from bson import ObjectId
+        
+        policy = self._stamp_ttl(collection, document)
+        
+        with self._lock:
+            unit = self._partition_of(collection, document)
+            data = self._load_collection(unit)
+            doc_id = str(ObjectId())
+            document['_id'] = doc_id
+            data[doc_id] = dict(document)
+            if policy:
+                # En colecciones particionadas el límite rige por partición
+                self._prune(data, policy)
+            self._save_collection(unit, data)
+            return {'inserted_id': doc_id}
+    
+    @staticmethod
+    def _prune(data: Dict[str, Any], policy: RetentionPolicy) -> None:
+        """Descarta los documentos más viejos según la política (el dict conserva el orden)"""
+        for doc_id in list(islice(data, policy.prune_count(data.values(), len(data)))):
+            del data[doc_id]
+    
+    def find(self, collection: str, query: dict = None, projection=None,
+             sort=None, skip: int = 0, limit: int = 0) -> Iterable[Dict[str, Any]]:
+        if query is None:
+            query = {}
+        
+        def matching():
+            with self._lock:
+                units = self._units(collection, query)
+            # Las particiones se cargan de a una, a medida que se itera
+            for unit in units:
+                with self._lock:
+                    # Se copia bajo el lock: update_one modifica los documentos en el lugar
+                    docs = [dict(doc) for doc in self._matching(self._load_collection(unit), query)]
+                yield from docs
+        
+        def fetch(sort, skip, limit):
+            return apply_modifiers(matching(), sort, skip, limit)
+        
+        return Cursor(fetch, projection, sort, skip, limit)
+    
+    def update_one(self, collection: str, filter: dict, update: dict) -> Dict[str, int]:
+        with self._lock:
+            for unit in self._units(collection, filter):
+                data = self._load_collection(unit)
+                doc = next(self._matching(data, filter), None)
+                if doc is not None:
+                    break
+            else:
+                return {'matched_count': 0, 'modified_count': 0}
+            if '$set' not in update:
+                return {'matched_count': 0, 'modified_count': 0}
             
-        data = self._load_collection(collection)
-        for doc in data.values():
-            if all(doc.get(k) == v for k, v in query.items()):
-                return doc
-        return None
+            field = self.partitions.get(collection)
+            if field is not None and field in update['$set']:
+                # Cambiar la clave mueve el documento a otra partición
+                del data[doc['_id']]
+                self._save_collection(unit, data)
+                doc.update(update['$set'])
+                unit = self._partition_of(collection, doc)
+                data = self._load_collection(unit)
+                data[doc['_id']] = doc
+            else:
+                doc.update(update['$set'])
+            self._save_collection(unit, data)
+            return {'matched_count': 1, 'modified_count': 1}
+    
+    def bulk_write(self, collection: str, requests: Iterable[Any], ordered: bool = True) -> Any:
+        """Aplica varias operaciones de PyMongo y reescribe cada archivo tocado una vez"""
+        with self._lock:
+            return execute(requests, _FileBulk(self, collection), ordered)
+
+
+class _FileBulk(BulkTarget):
+    """Ejecuta un bulk_write sobre las colecciones (o particiones) en caché"""
+    
+    def __init__(self, store: FileDataStore, collection: str):
+        self.store = store
+        self.collection = collection
+        # Cada unidad se carga una sola vez por lote aunque salga de la caché
+        self.units = {}
+        self.unit_of = {}
+        self.dirty = set()
+    
+    def _load(self, unit: str) -> Dict[str, Any]:
+        data = self.units.get(unit)
+        if data is None:
+            data = self.units[unit] = self.store._load_collection(unit)
+        return data
+    
+    def _relocate(self, doc: dict) -> None:
+        """Mueve el documento si cambió su clave de partición"""
+        unit = self.unit_of[id(doc)]
+        self.dirty.add(unit)
+        new_unit = self.store._partition_of(self.collection, doc)
+        if new_unit != unit:
+            del self._load(unit)[doc['_id']]
+            self._load(new_unit)[doc['_id']] = doc
+            self.unit_of[id(doc)] = new_unit
+            self.dirty.add(new_unit)
+    
+    def insert(self, doc):
+        from bson import ObjectId
+        
+        self.store._stamp_ttl(self.collection, doc)
+        explicit_id = '_id' in doc
+        doc.setdefault('_id', str(ObjectId()))
+        unit = self.store._partition_of(self.collection, doc)
+        data = self._load(unit)
+        # Un _id elegido por el llamador puede existir en otra partición
+        duplicated = doc['_id'] in data or (
+            explicit_id and unit != self.collection and self.match({'_id': doc['_id']}, False)
+        )
+        if duplicated:
+            raise DuplicateKeyError(f"_id duplicado: {doc['_id']}")
+        data[doc['_id']] = dict(doc)
+        self.unit_of[id(data[doc['_id']])] = unit
+        self.dirty.add(unit)
+        return doc['_id']
+    
+    def match(self, filter, multi):
+        units = self.store._units(self.collection, filter)
+        if len(units) > 1:
+            # Particiones creadas en este lote que pudieron salir de la caché
+            prefix = self.collection + '/'
+            units = sorted(set(units).union(u for u in self.units if u.startswith(prefix)))
+        found = []
+        for unit in units:
+            for doc in self.store._matching(self._load(unit), filter):
+                self.unit_of[id(doc)] = unit
+                found.append(doc)
+                if not multi:
+                    return found
+        return found
+    
+    def update(self, doc, update):
+        changed = apply_update(doc, update)
+        if changed:
+            self._relocate(doc)
+        return changed
+    
+    def replace(self, doc, replacement):
+        nuevo = {**replacement, '_id': doc['_id']}
+        if nuevo == doc:
+            return False
+        doc.clear()
+        doc.update(nuevo)
+        self._relocate(doc)
+        return True
+    
+    def delete(self, docs):
+        for doc in docs:
+            unit = self.unit_of[id(doc)]
+            del self._load(unit)[doc['_id']]
+            self.dirty.add(unit)
+    
+    def commit(self):
+        policy = self.store.retention.get(self.collection)
+        for unit in sorted(self.dirty):
+            data = self.units[unit]
+            if policy:
+                self.store._prune(data, policy)
+            cached = self.store._cache.get(unit)
+            if cached is None or cached[2] is not data:
+                path = self.store._get_collection_path(unit)
+                self.store._remember(unit, self.store._file_signature(path), data)
+            self.store._save_collection(unit, data)
+
+
+class SqliteDataStore(DataStore):
+    """Implementación de DataStore usando SQLite
+    
+    Cada colección es una tabla ``(id, doc)`` con el documento serializado en
+    JSON. La base trabaja en modo WAL y ``create_index`` agrega índices de
+    expresión sobre ``json_extract`` para los campos consultados a menudo. Las
+    consultas se arman siempre con el mismo texto por forma de consulta y con
+    parámetros, así sqlite3 reutiliza sus sentencias preparadas.
+    """
+    
+    def __init__(self, path: str = 'data/bot.db', retention: Dict[str, RetentionPolicy] = None):
+        super().__init__()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.using_mongodb = False
+        self.retention = DEFAULT_RETENTION if retention is None else retention
+        # Cantidad de filas de las colecciones con max_docs, para no hacer COUNT(*) por inserción
+        self._counts = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                     cached_statements=256)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._lock = threading.RLock()
+        self._tables = set()
+    
+    @staticmethod
+    def _quote(name: str) -> str:
+        return '"' + name.replace('"', '""') + '"'
+    
+    @staticmethod
+    def _json_path(field: str) -> str:
+        if '"' in field or "'" in field:
+            raise ValueError(f"Nombre de campo no soportado: {field!r}")
+        return '$' + ''.join(
+            f'[{part}]' if part.isdigit() else f'."{part}"' for part in field.split('.')
+        )
+    
+    @classmethod
+    def _field_expr(cls, field: str) -> str:
+        """Expresión SQL de un campo; debe coincidir con la del índice para usarlo"""
+        if field == '_id':
+            return 'id'
+        return f"json_extract(doc, '{cls._json_path(field)}')"
+    
+    @classmethod
+    def _exists_expr(cls, field: str) -> str:
+        # json_type distingue un null explícito ('null') de un campo ausente (NULL)
+        if field == '_id':
+            return 'id'
+        return f"json_type(doc, '{cls._json_path(field)}')"
+    
+    @staticmethod
+    def _param(value: Any) -> Any:
+        """Convierte un valor de la consulta al que devuelve json_extract"""
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+        return str(value)
+    
+    def _table(self, collection: str) -> str:
+        table = self._quote(collection)
+        if collection not in self._tables:
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, doc TEXT NOT NULL)'
+            )
+            self._tables.add(collection)
+        return table
+    
+    _SQL_OPERATORS = {'$eq': 'IS', '$ne': 'IS NOT', '$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+    
+    @staticmethod
+    def _comparable_types(value: Any) -> str:
+        """Valores de json_type que un rango puede comparar con ``value``
+        
+        SQLite ordena entre tipos distintos (números < texto < blobs), pero
+        query.compile_query solo compara números con números (bool incluido,
+        como en Python), texto con texto y listas con listas. Las listas se
+        comparan por su texto JSON, que no siempre coincide con el orden de
+        Python; los subdocumentos nunca coinciden.
+        """
+        if isinstance(value, (bool, int, float)):
+            return "'integer', 'real', 'true', 'false'"
+        if isinstance(value, list):
+            return "'array'"
+        if isinstance(value, dict):
+            return ''
+        return "'text'"
+    
+    def _where(self, query: dict):
+        """Traduce la consulta (con los operadores de query.compile_query) a SQL"""
+        if not query:
+            return '1', []
+        
+        shape, values = query_shape(query)
+        clauses = []
+        params = []
+        for (field, op), value in zip(shape, values):
+            expr = self._field_expr(field)
+            if op in ('$in', '$nin'):
+                # IN nunca coincide con NULL: los None se tratan aparte como campo ausente
+                items = [v for v in value if v is not None]
+                has_null = len(items) != len(value)
+                placeholders = ', '.join('?' * len(items))
+                if op == '$in':
+                    clause = f'{expr} IN ({placeholders})'
+                    if has_null:
+                        clause = f'({clause} OR {expr} IS NULL)'
+                elif has_null:
+                    clause = f'({expr} IS NOT NULL AND {expr} NOT IN ({placeholders}))'
+                else:
+                    clause = f'({expr} IS NULL OR {expr} NOT IN ({placeholders}))'
+                params.extend(self._param(v) for v in items)
+            elif op == '$exists':
+                clause = f"{self._exists_expr(field)} IS {'NOT ' if value else ''}NULL"
+            elif op in ('$eq', '$ne') or field == '_id':
+                clause = f'{expr} {self._SQL_OPERATORS[op]} ?'
+                params.append(self._param(value))
+            else:
+                types = self._comparable_types(value)
+                if not types:
+                    clause = '0'
+                else:
+                    clause = (f'({self._exists_expr(field)} IN ({types}) '
+                              f'AND {expr} {self._SQL_OPERATORS[op]} ?)')
+                    params.append(self._param(value))
+            clauses.append(clause)
+        return ' AND '.join(clauses), params
+    
+    def create_index(self, collection: str, fields) -> str:
+        """Crea un índice de expresión sobre uno o varios campos del documento"""
+        if isinstance(fields, str):
+            fields = [fields]
+        fields = [f[0] if isinstance(f, (tuple, list)) else f for f in fields]
+        name = f"ix_{collection}_{'_'.join(fields)}"
+        with self._lock:
+            table = self._table(collection)
+            columns = ', '.join(self._field_expr(f) for f in fields)
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS {self._quote(name)} ON {table} ({columns})')
+        return name
+    
+    def find_one(self, collection: str, query: dict) -> Optional[Dict[str, Any]]:
+        if not query:
+            return None
+        
+        where, params = self._where(query)
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT doc FROM {self._table(collection)} WHERE {where} ORDER BY rowid LIMIT 1',
+                params
+            ).fetchone()
+        return json.loads(row[0]) if row else None
     
     def insert_one(self, collection: str, document: dict) -> None:
         from bson import ObjectId
         
-        data = self._load_collection(collection)
+        policy = self._stamp_ttl(collection, document)
+        
         doc_id = str(ObjectId())
         document['_id'] = doc_id
-        data[doc_id] = document
-        self._save_collection(collection, data)
+        contenido = json.dumps(document, ensure_ascii=False, default=str)
+        with self._lock:
+            table = self._table(collection)
+            self._conn.execute(f'INSERT INTO {table} (id, doc) VALUES (?, ?)', (doc_id, contenido))
+            if policy:
+                self._prune(collection, table, policy, inserted=1)
         return {'inserted_id': doc_id}
     
-    def find(self, collection: str, query: dict = None) -> List[Dict[str, Any]]:
-        if query is None:
-            query = {}
-            
-        data = self._load_collection(collection)
-        results = []
-        for doc in data.values():
-            if all(doc.get(k) == v for k, v in query.items()):
-                results.append(doc)
-        return results
+    def _prune(self, collection: str, table: str, policy: RetentionPolicy, inserted: int) -> None:
+        """Borra las filas más viejas (menor rowid) que excedan la política"""
+        if collection in self._counts:
+            self._counts[collection] += inserted
+        else:
+            self._counts[collection] = self._conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        
+        ttl_expr = self._field_expr(policy.ttl_field)
+        while True:
+            total = self._counts[collection]
+            excess = max(0, total - policy.max_docs) if policy.max_docs else 0
+            if not excess and not policy.ttl_seconds:
+                return
+            rows = self._conn.execute(
+                f'SELECT rowid, {ttl_expr} FROM {table} ORDER BY rowid LIMIT ?', (excess + 16,)
+            ).fetchall()
+            count = policy.prune_count(({policy.ttl_field: value} for _, value in rows), total)
+            if count:
+                self._conn.execute(f'DELETE FROM {table} WHERE rowid <= ?', (rows[count - 1][0],))
+                self._counts[collection] -= count
+            if count < len(rows) or not rows:
+                return
+    
+    def find(self, collection: str, query: dict = None, projection=None,
+             sort=None, skip: int = 0, limit: int = 0) -> Iterable[Dict[str, Any]]:
+        where, params = self._where(query)
+        
+        def fetch(sort, skip, limit):
+            order = ''.join(
+                f"{self._field_expr(field)} {'DESC' if direction == DESCENDING else 'ASC'}, "
+                for field, direction in sort
+            )
+            sql = (f'SELECT doc FROM {self._table(collection)} WHERE {where} '
+                   f'ORDER BY {order}rowid LIMIT ? OFFSET ?')
+            with self._lock:
+                rows = self._conn.execute(sql, [*params, limit or -1, skip])
+            while True:
+                with self._lock:
+                    batch = rows.fetchmany(256)
+                if not batch:
+                    break
+                for row in batch:
+                    yield json.loads(row[0])
+        
+        return Cursor(fetch, projection, sort, skip, limit)
+    
+    def update_one(self, collection: str, filter: dict, update: dict) -> Dict[str, int]:
+        where, params = self._where(filter)
+        with self._lock:
+            table = self._table(collection)
+            row = self._conn.execute(
+                f'SELECT id, doc FROM {table} WHERE {where} ORDER BY rowid LIMIT 1', params
+            ).fetchone()
+            if row is None or '$set' not in update:
+                return {'matched_count': 0, 'modified_count': 0}
+            doc = json.loads(row[1])
+            doc.update(update['$set'])
+            self._conn.execute(
+                f'UPDATE {table} SET doc = ? WHERE id = ?',
+                (json.dumps(doc, ensure_ascii=False, default=str), row[0])
+            )
+            return {'matched_count': 1, 'modified_count': 1}
+    
+    def bulk_write(self, collection: str, requests: Iterable[Any], ordered: bool = True) -> Any:
+        """Aplica varias operaciones de PyMongo dentro de una sola transacción"""
+        with self._lock:
+            return execute(requests, _SqliteBulk(self, collection), ordered)
+    
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class _SqliteBulk(BulkTarget):
+    """Ejecuta un bulk_write en una transacción que se confirma al final"""
+    
+    def __init__(self, store: SqliteDataStore, collection: str):
+        self.store = store
+        self.collection = collection
+        self.table = store._table(collection)
+        self.conn = store._conn
+        self.ids = {}
+        self.inserted = 0
+        self.conn.execute('BEGIN')
+    
+    @staticmethod
+    def _dumps(doc: dict) -> str:
+        return json.dumps(doc, ensure_ascii=False, default=str)
+    
+    def insert(self, doc):
+        from bson import ObjectId
+        
+        self.store._stamp_ttl(self.collection, doc)
+        doc.setdefault('_id', str(ObjectId()))
+        try:
+            self.conn.execute(f'INSERT INTO {self.table} (id, doc) VALUES (?, ?)',
+                              (str(doc['_id']), self._dumps(doc)))
+        except sqlite3.IntegrityError:
+            raise DuplicateKeyError(f"_id duplicado: {doc['_id']}")
+        self.inserted += 1
+        return doc['_id']
+    
+    def match(self, filter, multi):
+        where, params = self.store._where(filter)
+        rows = self.conn.execute(
+            f"SELECT id, doc FROM {self.table} WHERE {where} ORDER BY rowid{'' if multi else ' LIMIT 1'}",
+            params
+        ).fetchall()
+        docs = []
+        for row_id, contenido in rows:
+            doc = json.loads(contenido)
+            self.ids[id(doc)] = row_id
+            docs.append(doc)
+        return docs
+    
+    def _write(self, doc: dict) -> None:
+        self.conn.execute(f'UPDATE {self.table} SET doc = ? WHERE id = ?', (self._dumps(doc), self.ids[id(doc)]))
+    
+    def update(self, doc, update):
+        changed = apply_update(doc, update)
+        if changed:
+            self._write(doc)
+        return changed
+    
+    def replace(self, doc, replacement):
+        nuevo = {**replacement, '_id': doc['_id']}
+        if nuevo == doc:
+            return False
+        doc.clear()
+        doc.update(nuevo)
+        self._write(doc)
+        return True
+    
+    def delete(self, docs):
+        self.conn.executemany(f'DELETE FROM {self.table} WHERE id = ?', [(self.ids[id(doc)],) for doc in docs])
+        if self.collection in self.store._counts:
+            self.store._counts[self.collection] -= len(docs)
+    
+    def commit(self):
+        policy = self.store.retention.get(self.collection)
+        if policy and self.inserted:
+            self.store._prune(self.collection, self.table, policy, inserted=self.inserted)
+        self.conn.execute('COMMIT')
 
 
 def safe_print(*args, **kwargs):
@@ -129,17 +839,34 @@ def get_datastore() -> DataStore:
     if mongo_uri and mongo_uri != 'mongodb://localhost:27017/':
         try:
             safe_print("Intentando conectar a MongoDB...")
+            mongo_pool.ping(mongo_uri)
             store = MongoDataStore(mongo_uri, db_name)
             safe_print("Conectado a MongoDB (Almacenamiento Principal)")
             return store
         except Exception as e:
             safe_print(f"No se pudo conectar a MongoDB: {str(e)}")
-            safe_print("Usando almacenamiento local en archivos")
+            safe_print("Usando almacenamiento local")
     else:
-        safe_print("MongoDB no configurado. Usando almacenamiento local en archivos")
+        safe_print("MongoDB no configurado. Usando almacenamiento local")
     
     # Si falla o no está configurado, usar almacenamiento local
-    return FileDataStore()
+    # (LOCAL_DATASTORE=sqlite para SQLite, por defecto archivos JSON)
+    if os.getenv('LOCAL_DATASTORE', 'file').lower() == 'sqlite':
+        return SqliteDataStore(os.getenv('SQLITE_PATH', 'data/bot.db'))
+    # FILE_PARTITIONS="server_settings:guild_id,logs:guild_id" para particionar por servidor
+    partitions = dict(
+        item.split(':', 1) for item in os.getenv('FILE_PARTITIONS', '').split(',') if ':' in item
+    )
+    return FileDataStore(partitions=partitions)
+
+_datastore = None
+
 
-# Inicializar el almacenamiento
-datastore = get_datastore()
+def __getattr__(name: str):
+    """``config.datastore`` se resuelve en el primer acceso y no al importar el módulo"""
+    global _datastore
+    if name == 'datastore':
+        if _datastore is None:
+            _datastore = get_datastore()
+        return _datastore
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,14 +1,108 @@
 import os
 import json
+import time
+import asyncio
+import threading
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
-from pymongo import MongoClient
+from typing import Dict, Any, Iterable, Optional, Tuple
+from pymongo.write_concern import WriteConcern
 from dotenv import load_dotenv
 
+import mongo_pool
+from config_notifier import ConfigNotifier, create_notifier
+from keyword_matcher import KeywordMatcher, get_matcher
+
 # Cargar variables de entorno
 load_dotenv()
 
+# Configuración inicial: se usa hasta que termina la conexión a MongoDB y para
+# sembrar el documento ``bot_config`` la primera vez
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    'bloquear_programacion': True,
+    'palabras_clave_programacion': [
+        'programa', 'código', 'script', 'python', 'javascript',
+        'java', 'c++', 'c#', 'php', 'html', 'css', 'desarrollar',
+        'desarrollo', 'aplicación', 'app', 'web', 'página web',
+        'página', 'sitio web', 'backend', 'frontend', 'fullstack',
+        'base de datos', 'sql', 'mysql', 'mongodb', 'api', 'endpoint',
+        'función', 'método', 'clase', 'objeto', 'variable', 'constante',
+        'bucle', 'ciclo', 'condicional', 'if', 'else', 'for', 'while',
+        'switch', 'case', 'break', 'continue', 'return', 'import',
+        'from', 'as', 'def', 'function', 'class', 'try', 'except',
+        'finally', 'raise', 'throw', 'catch', 'debug', 'depurar',
+        'compilar', 'compilación', 'ejecutar', 'ejecución', 'correr',
+        'terminal', 'consola', 'comando', 'línea de comandos', 'cli',
+        'sdk', 'framework', 'librería', 'biblioteca', 'módulo',
+        'paquete', 'dependencia', 'instalar', 'instalación', 'gestor',
+        'gestión de paquetes', 'pip', 'npm', 'yarn', 'composer',
+        'git', 'github', 'gitlab', 'bitbucket', 'repositorio', 'fork',
+        'pull request', 'merge', 'commit', 'push', 'pull', 'clonar',
+        'descargar', 'subir', 'actualizar', 'actualización', 'versión',
+        'release', 'rama', 'branch', 'tag', 'versión estable', 'beta',
+        'alfa', 'desarrollo', 'producción', 'entorno', 'ambiente',
+        'dev', 'prod', 'staging', 'testing', 'pruebas', 'test',
+        'unittest', 'pytest', 'cobertura', 'coverage', 'integración',
+        'continua', 'ci/cd', 'devops', 'despliegue', 'deploy',
+        'servidor', 'servicio', 'contenedor', 'docker', 'kubernetes',
+        'nube', 'cloud', 'aws', 'azure', 'google cloud', 'firebase',
+        'autenticación', 'autorización', 'jwt', 'oauth', 'openid',
+        'token', 'sesión', 'cookie', 'cache', 'caché', 'memoria',
+        'procesamiento', 'hilo', 'thread', 'proceso', 'process',
+        'asíncrono', 'asincrónico', 'síncrono', 'sincrónico',
+        'paralelo', 'paralelismo', 'concurrencia', 'concurrente',
+        'event loop', 'bucle de eventos', 'callback', 'promesa',
+        'futuro', 'async/await', 'then/catch', 'then/finally',
+        'then/catch/finally', 'try/catch', 'try/except', 'try/finally',
+        'try/except/finally', 'throw', 'throws', 'raise', 'raise from',
+        'except as', 'except Exception as e', 'except (Exception1, Exception2) as e',
+        'finally', 'else', 'pass', 'continue', 'break', 'return',
+        'yield', 'yield from', 'generator', 'generador', 'iterador',
+        'iterable', 'iteración', 'recursión', 'recursivo', 'recursiva',
+        'algoritmo', 'estructura de datos', 'lista', 'array', 'arreglo',
+        'tupla', 'diccionario', 'conjunto', 'hash', 'tabla hash',
+        'árbol', 'grafo', 'nodo', 'hoja', 'raíz', 'padre', 'hijo',
+        'hermano', 'hermana', 'ancestro', 'descendiente', 'hoja',
+        'nodo hoja', 'nodo interno', 'nodo raíz', 'nodo padre',
+        'nodo hijo', 'nodo hermano', 'nodo hoja', 'nodo interno',
+        'nodo raíz', 'nodo padre', 'nodo hijo', 'nodo hermano',
+        'nodo hoja', 'nodo interno', 'nodo raíz', 'nodo padre',
+        'nodo hijo', 'nodo hermano', 'nodo hoja', 'nodo interno',
+        'nodo raíz', 'nodo padre', 'nodo hijo', 'nodo hermano',
+        'nodo hoja', 'nodo interno', 'nodo raíz', 'nodo padre',
+        'nodo hijo', 'nodo hermano', 'nodo hoja', 'nodo interno',
+        'nodo raíz', 'nodo padre', 'nodo hijo', 'nodo hermano',
+        'nodo hoja', 'nodo interno', 'nodo raíz', 'nodo padre',
+        'nodo hijo', 'nodo hermano', 'nodo hoja', 'nodo interno',
+        'nodo raíz', 'nodo padre', 'nodo hijo', 'nodo hermano'
+    ],
+    'mensaje_bloqueo_programacion': (
+        "🚫 *Mensaje bloqueado por el sistema de seguridad de Ansagrado Intelligence Pro+*\n\n"
+        "🔒 **¡Esta función está disponible solo en la versión premium!**\n"
+        "*Desbloquea la versión premium de Ansagrado Intelligence Pro+ para poder utilizar esta función.\n"
+        "AntiBlocker by Vestá Technologies*"
+    )
+}
+
+
 class ConfigManager:
+    """Configuración del bot guardada en MongoDB (documento ``bot_config``)
+    
+    Arranca al instante con ``DEFAULT_SETTINGS``; ``start()`` conecta y siembra
+    la base en segundo plano y, mientras tanto, las lecturas usan esos valores.
+    
+    Las lecturas salen de una copia en memoria de ``settings``. La copia se
+    refresca en segundo plano cuando pasan ``CONFIG_TTL`` segundos (mientras
+    tanto se sigue sirviendo la anterior), al llamar a ``reload_config`` o,
+    con ``CONFIG_CHANGE_STREAM=1``, cuando un change stream avisa de un cambio.
+    
+    Cada servidor puede sobrescribir valores en ``server_settings`` (un
+    documento por servidor con ``settings`` y, por canal, ``channels``). Las
+    lecturas con ``guild_id``/``channel_id`` resuelven global → servidor →
+    canal y guardan la vista combinada; ``preload_guilds`` trae todos los
+    servidores en una sola consulta y ``set_config`` solo invalida las vistas
+    del servidor afectado.
+    """
+    
     _instance = None
     
     def __new__(cls):
@@ -22,7 +116,69 @@ class ConfigManager:
         self.local_config = {}
         self.last_update = datetime.now(timezone.utc)
         self.db = None
-        self._init_database()
+        self.client = None
+        # La conexión se abre en start() (o en el primer uso), no al importar el módulo
+        self._db_checked = False
+        self._db_lock = threading.Lock()
+        self._start_task = None
+        
+        # Copia en memoria de settings; hasta conectar son los valores por defecto
+        self.ttl = float(os.getenv('CONFIG_TTL', '60'))
+        self._settings = dict(DEFAULT_SETTINGS)
+        self._loaded_at = 0.0
+        self._refresh_lock = None
+        self._refresh_task = None
+        
+        # Aviso de cambios a los demás procesos: 'mongo' (change stream) o 'file'
+        self._notifier_kind = os.getenv('CONFIG_NOTIFIER') or (
+            'mongo' if os.getenv('CONFIG_CHANGE_STREAM') == '1' else '')
+        self._notifier: Optional[ConfigNotifier] = None
+        self._loop = None
+        
+        # guild_id -> {'settings': {...}, 'channels': {str(channel_id): {...}}}
+        self._guild_overlays: Dict[int, Dict[str, Any]] = {}
+        # (guild_id, channel_id) -> vista combinada; se descarta si cambia la global
+        self._resolved: Dict[Tuple[int, Optional[int]], Dict[str, Any]] = {}
+        self._resolved_base = self._settings
+        # Servidores pedidos antes de conectar; se cargan al terminar _connect
+        self._pending_preload = set()
+        # guild_id -> momento en que se puede reintentar una lectura que falló
+        self._guild_retry_at: Dict[int, float] = {}
+    
+    def _get_db(self, retry: bool = False):
+        """Devuelve la base de datos, conectando la primera vez que se necesita"""
+        with self._db_lock:
+            if not self._db_checked or (retry and self.db is None):
+                self._db_checked = True
+                self._init_database()
+        return self.db
+    
+    async def start(self):
+        """Conecta a MongoDB y carga la configuración sin bloquear al llamador
+        
+        Vuelve enseguida; la conexión, la siembra y la primera carga corren en
+        una tarea de fondo. Si la conexión falla se reintenta cada ``ttl``
+        segundos desde las lecturas.
+        """
+        self._loop = asyncio.get_running_loop()
+        if self._notifier_kind == 'file':
+            self._start_notifier()
+        if self._start_task is None or self._start_task.done():
+            self._start_task = asyncio.create_task(self._connect())
+    
+    async def _connect(self):
+        try:
+            if await asyncio.to_thread(self._get_db, True) is not None:
+                await self._refresh()
+                if self._pending_preload:
+                    pending, self._pending_preload = self._pending_preload, set()
+                    await self.preload_guilds(pending)
+        except Exception as e:
+            print(f"[!] Error al iniciar la configuración: {e}")
+        finally:
+            if self.db is None:
+                # Próximo intento cuando venza el TTL
+                self._loaded_at = time.monotonic()
     
     def _init_database(self):
         """Inicializa la conexión a MongoDB"""
@@ -32,21 +188,14 @@ class ConfigManager:
                 print("[!] No se encontro MONGODB_URI en las variables de entorno")
                 return
                 
-            # Configuración de conexión con tiempo de espera más corto
-            self.client = MongoClient(
-                mongo_uri,
-                serverSelectionTimeoutMS=5000,  # 5 segundos de timeout
-                connectTimeoutMS=10000,        # 10 segundos para conectar
-                socketTimeoutMS=30000,         # 30 segundos para operaciones
-                retryWrites=True,
-                w='majority'
-            )
+            # Cliente compartido (pool y timeouts comunes en mongo_pool)
+            self.client = mongo_pool.get_client(mongo_uri)
             
             # Forzar una conexión para verificar
-            self.client.admin.command('ping')
+            mongo_pool.ping(mongo_uri)
             
             # Configurar la base de datos
-            self.db = self.client.get_database('ansagrado_bot')
+            self.db = self.client.get_database('ansagrado_bot', write_concern=WriteConcern(w='majority'))
             
             # Crear colección de configuración si no existe
             if 'config' not in self.db.list_collection_names():
@@ -54,71 +203,7 @@ class ConfigManager:
                 self.db.config.insert_one({
                     '_id': 'bot_config',
                     'last_updated': datetime.now(timezone.utc),
-                    'settings': {
-                        'bloquear_programacion': True,
-                        'palabras_clave_programacion': [
-                            'programa', 'código', 'script', 'python', 'javascript',
-                            'java', 'c++', 'c#', 'php', 'html', 'css', 'desarrollar',
-                            'desarrollo', 'aplicación', 'app', 'web', 'página web',
-                            'página', 'sitio web', 'backend', 'frontend', 'fullstack',
-                            'base de datos', 'sql', 'mysql', 'mongodb', 'api', 'endpoint',
-                            'función', 'método', 'clase', 'objeto', 'variable', 'constante',
-                            'bucle', 'ciclo', 'condicional', 'if', 'else', 'for', 'while',
-                            'switch', 'case', 'break', 'continue', 'return', 'import',
-                            'from', 'as', 'def', 'function', 'class', 'try', 'except',
-                            'finally', 'raise', 'throw', 'catch', 'debug', 'depurar',
-                            'compilar', 'compilación', 'ejecutar', 'ejecución', 'correr',
-                            'terminal', 'consola', 'comando', 'línea de comandos', 'cli',
-                            'sdk', 'framework', 'librería', 'biblioteca', 'módulo',
-                            'paquete', 'dependencia', 'instalar', 'instalación', 'gestor',
-                            'gestión de paquetes', 'pip', 'npm', 'yarn', 'composer',
-                            'git', 'github', 'gitlab', 'bitbucket', 'repositorio', 'fork',
-                            'pull request', 'merge', 'commit', 'push', 'pull', 'clonar',
-                            'descargar', 'subir', 'actualizar', 'actualización', 'versión',
-                            'release', 'rama', 'branch', 'tag', 'versión estable', 'beta',
-                            'alfa', 'desarrollo', 'producción', 'entorno', 'ambiente',
-                            'dev', 'prod', 'staging', 'testing', 'pruebas', 'test',
-                            'unittest', 'pytest', 'cobertura', 'coverage', 'integración',
-                            'continua', 'ci/cd', 'devops', 'despliegue', 'deploy',
-                            'servidor', 'servicio', 'contenedor', 'docker', 'kubernetes',
-                            'nube', 'cloud', 'aws', 'azure', 'google cloud', 'firebase',
-                            'autenticación', 'autorización', 'jwt', 'oauth', 'openid',
-                            'token', 'sesión', 'cookie', 'cache', 'caché', 'memoria',
-                            'procesamiento', 'hilo', 'thread', 'proceso', 'process',
-                            'asíncrono', 'asincrónico', 'síncrono', 'sincrónico',
-                            'paralelo', 'paralelismo', 'concurrencia', 'concurrente',
-                            'event loop', 'bucle de eventos', 'callback', 'promesa',
-                            'futuro', 'async/await', 'then/catch', 'then/finally',
-                            'then/catch/finally', 'try/catch', 'try/except', 'try/finally',
-                            'try/except/finally', 'throw', 'throws', 'raise', 'raise from',
-                            'except as', 'except Exception as e', 'except (Exception1, Exception2) as e',
-                            'finally', 'else', 'pass', 'continue', 'break', 'return',
-                            'yield', 'yield from', 'generator', 'generador', 'iterador',
-                            'iterable', 'iteración', 'recursión', 'recursivo', 'recursiva',
-                            'algoritmo', 'estructura de datos', 'lista', 'array', 'arreglo',
-                            'tupla', 'diccionario', 'conjunto', 'hash', 'tabla hash',
-                            'árbol', 'grafo', 'nodo', 'hoja', 'raíz', 'padre', 'hijo',
-                            'hermano', 'hermana', 'ancestro', 'descendiente', 'hoja',
-                            'nodo hoja', 'nodo interno', 'nodo raíz', 'nodo padre',
-                            'nodo hijo', 'nodo hermano', 'nodo hoja', 'nodo interno',
-                            'nodo raíz', 'nodo padre', 'nodo hijo', 'nodo hermano',
-                            'nodo hoja', 'nodo interno', 'nodo raíz', 'nodo padre',
-                            'nodo hijo', 'nodo hermano', 'nodo hoja', 'nodo interno',
-                            'nodo raíz', 'nodo padre', 'nodo hijo', 'nodo hermano',
-                            'nodo hoja', 'nodo interno', 'nodo raíz', 'nodo padre',
-                            'nodo hijo', 'nodo hermano', 'nodo hoja', 'nodo interno',
-                            'nodo raíz', 'nodo padre', 'nodo hijo', 'nodo hermano',
-                            'nodo hoja', 'nodo interno', 'nodo raíz', 'nodo padre',
-                            'nodo hijo', 'nodo hermano', 'nodo hoja', 'nodo interno',
-                            'nodo raíz', 'nodo padre', 'nodo hijo', 'nodo hermano'
-                        ],
-                        'mensaje_bloqueo_programacion': (
-                            "🚫 *Mensaje bloqueado por el sistema de seguridad de Ansagrado Intelligence Pro+*\n\n"
-                            "🔒 **¡Esta función está disponible solo en la versión premium!**\n"
-                            "*Desbloquea la versión premium de Ansagrado Intelligence Pro+ para poder utilizar esta función.\n"
-                            "AntiBlocker by Vestá Technologies*"
-                        )
-                    }
+                    'settings': DEFAULT_SETTINGS
                 })
             
             print("[+] Configuracion de MongoDB inicializada correctamente")
@@ -130,50 +215,300 @@ class ConfigManager:
             self.db = None
             return False
     
-    async def get_config(self, key: str, default: Any = None) -> Any:
-        """Obtiene un valor de configuración"""
+    def _fetch(self) -> Optional[Dict[str, Any]]:
+        """Lee el documento de configuración (bloqueante, se llama desde un hilo)"""
+        db = self.db
+        if db is None:
+            return None
+        return db.config.find_one({'_id': 'bot_config'}, {'settings': 1, 'last_updated': 1})
+    
+    def _apply_snapshot(self, config: Optional[Dict[str, Any]]) -> bool:
+        self._loaded_at = time.monotonic()
+        if not config or 'settings' not in config:
+            return False
+        # Se reemplaza la referencia completa: los lectores nunca ven una copia a medias
+        self._settings = {**DEFAULT_SETTINGS, **config['settings']}
+        self.last_update = config.get('last_updated', datetime.now(timezone.utc))
+        return True
+    
+    async def _refresh(self) -> bool:
+        """Recarga la copia en memoria; las recargas simultáneas se agrupan en una"""
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._refresh_lock:
+            if self._loaded_at > started:
+                # Otra tarea recargó mientras se esperaba el lock
+                return bool(self._settings)
+            config = await asyncio.to_thread(self._fetch)
+            if self._notifier_kind == 'mongo' and self.db is not None:
+                self._start_notifier()
+            return self._apply_snapshot(config)
+    
+    async def _refresh_in_background(self):
+        try:
+            await self._refresh()
+        except Exception as e:
+            print(f"Error al recargar configuración: {e}")
+    
+    async def _snapshot(self) -> Dict[str, Any]:
+        if time.monotonic() - self._loaded_at <= self.ttl:
+            return self._settings
+        # Se sirve la copia vigente mientras se conecta o se recarga en segundo plano
+        if self.db is None:
+            if os.getenv('MONGODB_URI'):
+                await self.start()
+        elif self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_in_background())
+        return self._settings
+    
+    @staticmethod
+    def _guild_doc_id(guild_id: int) -> str:
+        return f'guild:{guild_id}'
+    
+    def _fetch_guilds(self, guild_ids: Iterable[int]) -> Optional[Dict[int, Dict[str, Any]]]:
+        """Lee las configuraciones de varios servidores con una sola consulta
+        
+        Devuelve None si todavía no hay conexión: un servidor sin documento y
+        uno que no se pudo leer no son lo mismo, y solo lo primero se cachea.
+        """
+        overlays = {guild_id: {} for guild_id in guild_ids}
+        if self.db is None:
+            return None
+        if not overlays:
+            return overlays
+        cursor = self.db.server_settings.find(
+            {'_id': {'$in': [self._guild_doc_id(g) for g in overlays]}},
+            {'guild_id': 1, 'settings': 1, 'channels': 1}
+        )
+        for doc in cursor:
+            overlays[doc['guild_id']] = doc
+        return overlays
+    
+    def _set_guild_overlays(self, overlays: Dict[int, Dict[str, Any]]) -> None:
+        for guild_id, doc in overlays.items():
+            self._guild_overlays[guild_id] = {
+                'settings': doc.get('settings', {}),
+                'channels': doc.get('channels', {}),
+            }
+            self._invalidate_guild(guild_id)
+    
+    def _invalidate_guild(self, guild_id: int) -> None:
+        for key in [key for key in self._resolved if key[0] == guild_id]:
+            del self._resolved[key]
+    
+    async def preload_guilds(self, guild_ids: Iterable[int]) -> int:
+        """Carga de una vez la configuración de todos los servidores indicados
+        
+        Si la conexión todavía no terminó (``on_ready`` suele llegar antes),
+        los servidores quedan anotados y se cargan al final de ``_connect``.
+        """
+        guild_ids = list(guild_ids)
         try:
-            if self.db:
-                config = self.db.config.find_one({'_id': 'bot_config'})
-                if config and key in config.get('settings', {}):
-                    return config['settings'][key]
+            overlays = await asyncio.to_thread(self._fetch_guilds, guild_ids)
+        except Exception as e:
+            print(f"Error al cargar la configuración de los servidores: {e}")
+            return 0
+        if overlays is None:
+            self._pending_preload.update(guild_ids)
+            return 0
+        self._set_guild_overlays(overlays)
+        return len(overlays)
+    
+    async def _resolve(self, guild_id: int, channel_id: Optional[int]) -> Dict[str, Any]:
+        """Vista combinada global → servidor → canal, cacheada hasta que cambie algo"""
+        settings = await self._snapshot()
+        if self._resolved_base is not settings:
+            self._resolved.clear()
+            self._resolved_base = settings
+        
+        view = self._resolved.get((guild_id, channel_id))
+        if view is not None:
+            return view
+        if guild_id not in self._guild_overlays:
+            # Servidor que no entró en la precarga (por ejemplo, recién agregado)
+            if time.monotonic() < self._guild_retry_at.get(guild_id, 0):
+                return settings
+            try:
+                overlays = await asyncio.to_thread(self._fetch_guilds, [guild_id])
+            except Exception as e:
+                # No reintentar la lectura bloqueante en cada mensaje mientras MongoDB no responde
+                self._guild_retry_at[guild_id] = time.monotonic() + self.ttl
+                print(f"Error al cargar la configuración del servidor {guild_id}: {e}")
+                return settings
+            if overlays is None:
+                # Sin conexión todavía: la vista global, sin cachear nada del servidor
+                return settings
+            self._guild_retry_at.pop(guild_id, None)
+            self._set_guild_overlays(overlays)
+        
+        overlay = self._guild_overlays[guild_id]
+        view = {**settings, **overlay['settings']}
+        if channel_id is not None:
+            view.update(overlay['channels'].get(str(channel_id), {}))
+        self._resolved[(guild_id, channel_id)] = view
+        return view
+    
+    async def get_config(self, key: str, default: Any = None, guild_id: Optional[int] = None,
+                         channel_id: Optional[int] = None) -> Any:
+        """Obtiene un valor de configuración, opcionalmente para un servidor o canal"""
+        try:
+            if guild_id is not None:
+                settings = await self._resolve(guild_id, channel_id)
+            else:
+                settings = await self._snapshot()
+            if key in settings:
+                return settings[key]
             return self.local_config.get(key, default)
         except Exception as e:
             print(f"Error al obtener configuración: {e}")
-            return default
+            # La copia global en memoria antes que el valor por defecto del llamador
+            if key in self._settings:
+                return self._settings[key]
+            return self.local_config.get(key, default)
+    
+    async def get_keyword_matcher(self, key: str = 'palabras_clave_programacion') -> KeywordMatcher:
+        """Matcher compilado para una lista de palabras de la configuración
+        
+        Se recompila solo cuando la lista cambia (recarga, ``set_config`` o
+        change stream); entre cambios cada llamada devuelve el mismo objeto.
+        """
+        return get_matcher(await self.get_config(key, []), name=key)
     
-    async def set_config(self, key: str, value: Any) -> bool:
-        """Establece un valor de configuración"""
+    async def set_config(self, key: str, value: Any, guild_id: Optional[int] = None,
+                         channel_id: Optional[int] = None) -> bool:
+        """Establece un valor de configuración global, de un servidor o de un canal"""
+        if guild_id is not None:
+            return await self._set_guild_config(key, value, guild_id, channel_id)
         try:
             self.local_config[key] = value
-            if self.db:
-                self.db.config.update_one(
-                    {'_id': 'bot_config'},
-                    {'$set': {
-                        f'settings.{key}': value,
-                        'last_updated': datetime.now(timezone.utc)
-                    }},
-                    upsert=True
-                )
+            self._settings = {**self._settings, key: value}
+            await asyncio.to_thread(self._store_value, key, value)
             self.last_update = datetime.now(timezone.utc)
+            self._publish({'scope': 'global', 'key': key, 'value': value})
             return True
         except Exception as e:
             print(f"Error al actualizar configuración: {e}")
             return False
     
+    def _store_value(self, key: str, value: Any) -> None:
+        db = self._get_db()
+        if db is not None:
+            db.config.update_one(
+                {'_id': 'bot_config'},
+                {'$set': {
+                    f'settings.{key}': value,
+                    'last_updated': datetime.now(timezone.utc),
+                    'updated_by': self._origin()
+                }},
+                upsert=True
+            )
+    
+    async def _set_guild_config(self, key: str, value: Any, guild_id: int,
+                                channel_id: Optional[int]) -> bool:
+        try:
+            if guild_id not in self._guild_overlays:
+                # Conectar antes de leer, para no tapar lo guardado con una copia vacía
+                await asyncio.to_thread(self._get_db)
+                overlays = await asyncio.to_thread(self._fetch_guilds, [guild_id])
+                self._set_guild_overlays(overlays if overlays is not None else {guild_id: {}})
+            path = self._apply_guild_value(guild_id, channel_id, key, value)
+            await asyncio.to_thread(self._store_guild_value, guild_id, path, value)
+            self._publish({'scope': 'guild', 'guild_id': guild_id, 'channel_id': channel_id,
+                           'key': key, 'value': value})
+            return True
+        except Exception as e:
+            print(f"Error al actualizar configuración del servidor {guild_id}: {e}")
+            return False
+    
+    def _apply_guild_value(self, guild_id: int, channel_id: Optional[int], key: str, value: Any) -> str:
+        """Actualiza la copia en memoria de un servidor y devuelve la ruta del campo"""
+        overlay = self._guild_overlays[guild_id]
+        if channel_id is None:
+            overlay['settings'] = {**overlay['settings'], key: value}
+            path = f'settings.{key}'
+        else:
+            channel = str(channel_id)
+            overlay['channels'] = {
+                **overlay['channels'], channel: {**overlay['channels'].get(channel, {}), key: value}
+            }
+            path = f'channels.{channel}.{key}'
+        self._invalidate_guild(guild_id)
+        return path
+    
+    def _store_guild_value(self, guild_id: int, path: str, value: Any) -> None:
+        db = self._get_db()
+        if db is not None:
+            db.server_settings.update_one(
+                {'_id': self._guild_doc_id(guild_id)},
+                {'$set': {
+                    'guild_id': guild_id,
+                    path: value,
+                    'last_updated': datetime.now(timezone.utc),
+                    'updated_by': self._origin()
+                }},
+                upsert=True
+            )
+    
     async def reload_config(self):
         """Recarga la configuración desde la base de datos"""
         try:
-            if self.db:
-                config = self.db.config.find_one({'_id': 'bot_config'})
-                if config and 'settings' in config:
-                    self.local_config.update(config['settings'])
-                    self.last_update = config.get('last_updated', datetime.now(timezone.utc))
-                    return True
+            if await self._refresh():
+                self.local_config.update(self._settings)
+                return True
             return False
         except Exception as e:
             print(f"Error al recargar configuración: {e}")
             return False
+    
+    def _start_notifier(self) -> None:
+        if self._notifier is None:
+            self._notifier = create_notifier(self._notifier_kind, self.db)
+            if self._notifier is not None:
+                self._notifier.start(self._on_remote_change)
+    
+    def _origin(self) -> Optional[str]:
+        # Con change streams permite reconocer (y saltear) los cambios propios
+        return self._notifier.origin if self._notifier is not None else None
+    
+    def _publish(self, delta: Dict[str, Any]) -> None:
+        if self._notifier is None:
+            return
+        try:
+            self._notifier.publish(delta)
+        except Exception as e:
+            print(f"[!] No se pudo avisar el cambio de configuración: {e}")
+    
+    def _on_remote_change(self, delta: Dict[str, Any]) -> None:
+        """Llega desde el hilo del notificador; se aplica en el loop del bot"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._apply_delta, delta)
+        else:
+            self._apply_delta(delta)
+    
+    def _apply_delta(self, delta: Dict[str, Any]) -> None:
+        """Aplica un cambio hecho por otro proceso sin volver a leer la base"""
+        if delta.get('scope') == 'global':
+            if 'key' in delta:
+                self.local_config[delta['key']] = delta['value']
+                self._settings = {**self._settings, delta['key']: delta['value']}
+                self.last_update = datetime.now(timezone.utc)
+            else:
+                self._apply_snapshot(delta)
+        elif delta.get('scope') == 'guild':
+            guild_id = delta['guild_id']
+            if 'key' not in delta:
+                self._set_guild_overlays({guild_id: delta})
+            elif guild_id in self._guild_overlays:
+                self._apply_guild_value(guild_id, delta.get('channel_id'), delta['key'], delta['value'])
+            # Un servidor sin copia local se leerá completo en su primer uso
+    
+    async def close(self):
+        """Detiene el aviso de cambios (al apagar el bot)"""
+        if self._notifier is not None:
+            notifier, self._notifier = self._notifier, None
+            await asyncio.to_thread(notifier.close)
 
 # Instancia global del gestor de configuración
 config_manager = ConfigManager()
@@ -0,0 +1,190 @@
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from storage_io import JSON
+
+Delta = Dict[str, Any]
+
+
+class ConfigNotifier:
+    """Canal para avisar a los demás procesos del bot que cambió la configuración
+
+    Un delta es un dict con ``scope`` (``global`` o ``guild``) y, o bien un
+    valor puntual (``key``/``value``, con ``guild_id``/``channel_id`` si
+    corresponde), o bien el documento completo (``settings``/``channels``).
+    ``start(callback)`` entrega los deltas recibidos desde un hilo propio.
+    """
+
+    def __init__(self):
+        # Identifica a este proceso para no procesar sus propios avisos
+        self.origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._callback: Optional[Callable[[Delta], None]] = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, callback: Callable[[Delta], None]) -> None:
+        if self._thread is not None:
+            return
+        self._callback = callback
+        self._thread = threading.Thread(target=self._run, name=f'config-{type(self).__name__}', daemon=True)
+        self._thread.start()
+
+    def publish(self, delta: Delta) -> None:
+        raise NotImplementedError
+
+    def _run(self) -> None:
+        raise NotImplementedError
+
+    def _deliver(self, delta: Delta) -> None:
+        if delta.get('origin') == self.origin:
+            return
+        try:
+            self._callback(delta)
+        except Exception as e:
+            print(f"[!] Error al aplicar un cambio de configuración: {e}")
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+
+class MongoChangeStreamNotifier(ConfigNotifier):
+    """Recibe los cambios de ``config`` y ``server_settings`` con un change stream
+
+    Cualquier proceso que escriba en MongoDB ya los dispara, así que
+    ``publish`` no hace nada. Requiere un replica set (Atlas lo es). Si el
+    stream se corta (red, cambio de primario) se vuelve a abrir con espera
+    exponencial, retomando desde el último ``resume_token``.
+    """
+
+    # Servidor standalone: no tiene change streams y reintentar no sirve
+    UNSUPPORTED = 40573
+    # El oplog ya no tiene el punto de reanudación
+    HISTORY_LOST = 286
+
+    def __init__(self, db, max_backoff: float = 60.0):
+        super().__init__()
+        self.db = db
+        self.max_backoff = max_backoff
+        self._stream = None
+
+    def publish(self, delta: Delta) -> None:
+        pass
+
+    def _run(self) -> None:
+        pipeline = [{'$match': {
+            'ns.coll': {'$in': ['config', 'server_settings']},
+            'operationType': {'$in': ['insert', 'update', 'replace']},
+        }}]
+        resume_token = None
+        espera = min(1.0, self.max_backoff)
+        while not self._stop.is_set():
+            try:
+                with self.db.watch(pipeline, full_document='updateLookup',
+                                   resume_after=resume_token) as stream:
+                    self._stream = stream
+                    espera = min(1.0, self.max_backoff)
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        self._dispatch(change)
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                code = getattr(e, 'code', None)
+                if code == self.UNSUPPORTED:
+                    # Sin change streams queda el refresco por TTL
+                    print(f"[!] Change stream de configuración no disponible: {e}")
+                    return
+                if code == self.HISTORY_LOST:
+                    resume_token = None
+                print(f"[!] Change stream de configuración cortado ({e}); "
+                      f"reintentando en {espera:.0f} s")
+            finally:
+                self._stream = None
+            if self._stop.wait(espera):
+                return
+            espera = min(espera * 2, self.max_backoff)
+
+    def _dispatch(self, change: dict) -> None:
+        doc = change.get('fullDocument')
+        if not doc:
+            return
+        # ``updated_by`` lo escribe ConfigManager con el origen del proceso
+        origin = doc.get('updated_by')
+        if change['ns']['coll'] == 'config' and doc.get('_id') == 'bot_config':
+            self._deliver({'scope': 'global', 'origin': origin,
+                           'settings': doc.get('settings', {})})
+        elif change['ns']['coll'] == 'server_settings' and 'guild_id' in doc:
+            self._deliver({'scope': 'guild', 'origin': origin, 'guild_id': doc['guild_id'],
+                           'settings': doc.get('settings', {}),
+                           'channels': doc.get('channels', {})})
+
+    def close(self) -> None:
+        self._stop.set()
+        stream = self._stream
+        if stream is not None:
+            stream.close()
+        super().close()
+
+
+class FileNotifier(ConfigNotifier):
+    """Canal por archivo compartido, para varios procesos en la misma máquina
+
+    Cada aviso es una línea JSON agregada al final de ``path``; los demás
+    procesos vigilan el tamaño del archivo cada ``interval`` segundos y leen
+    solo lo nuevo. Al superar ``max_bytes`` el archivo se vacía.
+    """
+
+    def __init__(self, path: str = 'data/config_changes.jsonl', interval: float = 0.05,
+                 max_bytes: int = 1024 * 1024):
+        super().__init__()
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Solo interesan los avisos posteriores al arranque
+        self._offset = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def publish(self, delta: Delta) -> None:
+        line = JSON.encode({**delta, 'origin': self.origin}) + b'\n'
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+            open(self.path, 'wb').close()
+        # Una sola escritura en modo append: las líneas de distintos procesos no se mezclan
+        with open(self.path, 'ab') as f:
+            f.write(line)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                size = os.path.getsize(self.path)
+            except FileNotFoundError:
+                continue
+            if size < self._offset:
+                # Otro proceso vació el archivo
+                self._offset = 0
+            if size == self._offset:
+                continue
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+            # Una línea a medio escribir se lee en la próxima vuelta
+            complete = data[:data.rfind(b'\n') + 1]
+            self._offset += len(complete)
+            for line in complete.splitlines():
+                try:
+                    delta = JSON.decode(line)
+                except ValueError:
+                    continue
+                self._deliver(delta)
+
+
+def create_notifier(kind: str, db=None) -> Optional[ConfigNotifier]:
+    """Crea el canal configurado (``mongo``, ``file`` o ninguno)"""
+    if kind == 'mongo' and db is not None:
+        return MongoChangeStreamNotifier(db)
+    if kind == 'file':
+        return FileNotifier(os.getenv('CONFIG_NOTIFY_FILE', 'data/config_changes.jsonl'))
+    return None
@@ -0,0 +1,2 @@
+# test_mongodb.py es un script manual que se conecta a MongoDB al importarlo
+collect_ignore = ['test_mongodb.py']
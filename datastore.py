@@ -1,98 +1,574 @@
-from typing import Dict, List, Any, Optional
-from datetime import datetime
+from typing import Dict, List, Any, Iterable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import asyncio
+import copy
+import functools
 import json
 import os
-from pymongo import MongoClient
+import shutil
+import threading
+import time
+from bson import ObjectId
+from pymongo import DeleteMany, InsertOne, UpdateMany, UpdateOne
 from pymongo.database import Database
+from pymongo.errors import BulkWriteError, ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.results import BulkWriteResult, DeleteResult
 
-class ProvisionalDataStore:
-    """Almacenamiento de datos provisional cuando MongoDB no está disponible"""
+import mongo_pool
+from bulk import BulkOperations, BulkTarget, DuplicateKeyError, update_result, execute, normalize_requests
+from metrics import LatencyStats
+from retention import DEFAULT_RETENTION, RetentionPolicy, apply_mongo_retention
+from query import Cursor, apply_modifiers, apply_update, compile_query, equality_value, get_value
+from storage_io import JSON, GroupCommitWriter, atomic_write, get_codec, quarantine, read_file
+
+# Colección interna con las operaciones que RouterDataStore debe repetir en MongoDB
+PENDING_OPS = '_pendientes'
+
+
+class ProvisionalDataStore(BulkOperations):
+    """Almacenamiento de datos provisional cuando MongoDB no está disponible
+
+    En modo journal (por defecto) cada mutación se agrega como una línea JSON al
+    final de ``provisional_data.journal`` en lugar de reescribir todo
+    ``provisional_data.json``. Cuando el journal supera ``compact_threshold``
+    bytes se rota y se escribe una nueva instantánea en segundo plano. Cada
+    registro lleva un número de secuencia y la instantánea guarda el último
+    aplicado, así que al arrancar se reproduce solo lo que falta.
+    
+    Sin journal, las reescrituras completas se agrupan durante ``write_window``
+    segundos. Todas las escrituras del archivo principal son atómicas (temporal,
+    fsync y rename), y ``flush()`` persiste lo pendiente al apagar el bot.
     
-    def __init__(self):
+    Cada colección tiene un índice hash sobre ``_id`` y ``create_index`` agrega
+    otros en memoria, de modo que las consultas de igualdad no recorren toda la
+    colección.
+    
+    La instantánea se guarda con el codec de ``codec`` (``STORAGE_CODEC`` por
+    defecto: JSON compacto o msgpack) y al cargar se detecta el formato; el
+    journal siempre es JSON de una línea por registro.
+    
+    Las colecciones con política de ``retention`` descartan sus documentos más
+    viejos al insertar y al cargar, para que los logs no crezcan sin límite.
+    """
+    
+    def __init__(self, data_file: str = 'provisional_data.json', journal: bool = True,
+                 compact_threshold: int = 4 * 1024 * 1024, sync_batch_size: int = 500,
+                 write_window: float = 0.2, retention: Dict[str, RetentionPolicy] = None,
+                 codec: str = None):
         self.data = {}
         self.using_mongodb = False
-        self.data_file = 'provisional_data.json'
+        self.data_file = data_file
+        self.journal = journal
+        self.journal_file = os.path.splitext(data_file)[0] + '.journal'
+        self.compact_threshold = compact_threshold
+        self.sync_batch_size = sync_batch_size
+        self.retention = DEFAULT_RETENTION if retention is None else retention
+        self.codec = get_codec(codec)
+        self._lock = threading.RLock()
+        self._seq = 0
+        self._journal_handle = None
+        self._journal_size = 0
+        self._compact_thread = None
+        self._writer = GroupCommitWriter(write_window, name='provisional-writer')
+        # {colección: {campos: {clave: {id(doc): doc}}}}
+        self._indexes = {}
+        # id(doc) -> cantidad de modificaciones; la sincronización detecta así los cambios en vuelo
+        self._versions = {}
         self._load_data()
     
+    @property
+    def _old_journal_file(self) -> str:
+        return self.journal_file + '.old'
+    
     def _load_data(self):
-        """Cargar datos desde el archivo si existe"""
+        """Cargar la instantánea y reproducir el journal si existen"""
+        snapshot_seq = 0
         if os.path.exists(self.data_file):
             try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    self.data = json.load(f)
+                contenido = read_file(self.data_file)
+                # Las instantáneas escritas por el journal guardan la última secuencia aplicada
+                if isinstance(contenido.get('data'), dict) and 'seq' in contenido:
+                    snapshot_seq = contenido['seq']
+                    contenido = contenido['data']
+                self.data = contenido
             except Exception as e:
-                print(f"Error al cargar datos provisionales: {e}")
+                # No sobrescribir un archivo dañado con datos vacíos
+                print(f"Error al cargar datos provisionales: {e}; "
+                      f"archivo apartado en {quarantine(self.data_file)}")
                 self.data = {}
+        
+        # Los datos anteriores a los índices pueden no tener _id; se les asigna uno
+        sin_id = 0
+        for collection, docs in self.data.items():
+            for doc in docs:
+                if '_id' not in doc:
+                    doc['_id'] = str(ObjectId())
+                    sin_id += 1
+            self._docs(collection)
+        
+        self._seq = snapshot_seq
+        aplicados = 0
+        for path in (self._old_journal_file, self.journal_file):
+            aplicados += self._replay_journal(path, snapshot_seq)
+        
+        # Lo que venció mientras el bot estaba apagado se descarta de una vez
+        descartados = sum(len(self._prune(c, persist=False)) for c in list(self.data))
+        
+        if self.journal:
+            if sin_id or descartados:
+                self.compact()
+        elif aplicados or sin_id or descartados:
+            # Si el journal está desactivado, consolidar lo reproducido en el archivo completo
+            self._save_data()
+            self._writer.flush()
+            self._remove_journal_files()
+    
+    def _replay_journal(self, path: str, snapshot_seq: int) -> int:
+        """Aplica los registros del journal posteriores a la instantánea"""
+        if not os.path.exists(path):
+            return 0
+        
+        aplicados = 0
+        valido = 0
+        with open(path, 'r+b') as f:
+            for linea in f:
+                try:
+                    registro = JSON.decode(linea)
+                except ValueError:
+                    # Solo la última línea puede quedar incompleta tras una caída:
+                    # se recorta para que los registros nuevos no queden pegados a ella
+                    print(f"Registro incompleto descartado en {path}")
+                    f.truncate(valido)
+                    break
+                valido += len(linea)
+                if registro['seq'] <= snapshot_seq:
+                    continue
+                self._apply(registro)
+                self._seq = max(self._seq, registro['seq'])
+                aplicados += 1
+        return aplicados
+    
+    def _apply(self, registro: dict):
+        """Aplica un registro del journal sobre los datos en memoria"""
+        collection = registro['c']
+        docs = self._docs(collection)
+        if registro['op'] == 'insert':
+            docs.append(registro['doc'])
+            self._index_add(collection, registro['doc'])
+        elif registro['op'] == 'update':
+            doc = self._by_id(collection, registro['id'])
+            if doc is not None:
+                # Los journals anteriores guardaban solo el $set en 'set'
+                self._update(collection, doc, registro['u'] if 'u' in registro else {'$set': registro['set']})
+        elif registro['op'] == 'replace':
+            doc = self._by_id(collection, registro['id'])
+            if doc is not None:
+                self._replace(collection, doc, registro['doc'])
+        elif registro['op'] == 'delete':
+            removed = (self._by_id(collection, doc_id) for doc_id in registro['ids'])
+            self._delete(collection, [doc for doc in removed if doc is not None])
+    
+    def _persist(self, op: str, collection: str, **campos):
+        """Registra una mutación en el journal o reescribe el archivo completo"""
+        self._persist_records([{'op': op, 'c': collection, **campos}])
+    
+    def _persist_records(self, registros: List[dict]):
+        """Persiste varias mutaciones con una sola escritura"""
+        if not registros:
+            return
+        if self.journal:
+            self._log(registros)
+        else:
+            self._save_data()
+    
+    def _log(self, registros: List[dict]):
+        """Agrega mutaciones al journal y compacta si se superó el umbral"""
+        lineas = []
+        for registro in registros:
+            self._seq += 1
+            lineas.append(JSON.encode({'seq': self._seq, **registro}) + b'\n')
+        linea = b''.join(lineas)
+        
+        if self._journal_handle is None:
+            self._journal_handle = open(self.journal_file, 'ab')
+            self._journal_size = self._journal_handle.tell()
+        self._journal_handle.write(linea)
+        self._journal_handle.flush()
+        self._journal_size += len(linea)
+        
+        if self._journal_size >= self.compact_threshold and not self._compacting():
+            contenido = self._rotate_journal()
+            self._compact_thread = threading.Thread(
+                target=self._write_snapshot, args=(contenido,),
+                name='provisional-compact', daemon=True
+            )
+            self._compact_thread.start()
+    
+    def _compacting(self) -> bool:
+        return self._compact_thread is not None and self._compact_thread.is_alive()
+    
+    def _rotate_journal(self) -> bytes:
+        """Cierra el journal actual, lo aparta y devuelve la instantánea codificada"""
+        if self._journal_handle is not None:
+            self._journal_handle.close()
+            self._journal_handle = None
+        
+        if os.path.exists(self.journal_file):
+            if os.path.exists(self._old_journal_file):
+                # Una compactación anterior falló: conservar ambos segmentos
+                with open(self.journal_file, 'rb') as src, open(self._old_journal_file, 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.journal_file)
+            else:
+                os.replace(self.journal_file, self._old_journal_file)
+        self._journal_size = 0
+        
+        # Se codifica bajo el lock ($set/$inc con puntos modifican subdocumentos en el
+        # lugar); codificar cuesta mucho menos que una copia profunda y en otro hilo
+        # solo quedan la escritura y el fsync
+        return self.codec.encode({'seq': self._seq, 'data': self.data})
+    
+    def _write_snapshot(self, contenido: bytes):
+        """Escribe la instantánea de forma atómica y descarta el journal rotado"""
+        try:
+            atomic_write(self.data_file, contenido)
+            if os.path.exists(self._old_journal_file):
+                os.remove(self._old_journal_file)
+        except Exception as e:
+            print(f"Error al compactar datos provisionales: {e}")
+    
+    def compact(self):
+        """Compacta el journal en una instantánea de forma síncrona"""
+        with self._lock:
+            if self._compact_thread is not None:
+                self._compact_thread.join()
+            self._write_snapshot(self._rotate_journal())
+    
+    def flush(self):
+        """Persiste las escrituras pendientes y sincroniza el journal con el disco"""
+        self._writer.flush()
+        with self._lock:
+            if self._journal_handle is not None:
+                self._journal_handle.flush()
+                os.fsync(self._journal_handle.fileno())
+    
+    def close(self):
+        """Cierra el journal abierto"""
+        with self._lock:
+            if self._journal_handle is not None:
+                self._journal_handle.close()
+                self._journal_handle = None
+    
+    def _remove_journal_files(self):
+        for path in (self.journal_file, self._old_journal_file):
+            if os.path.exists(path):
+                os.remove(path)
     
     def _save_data(self):
-        """Guardar datos en el archivo"""
+        """Programa la reescritura del archivo; el escritor agrupa las ráfagas"""
+        self._writer.schedule(self.data_file, self._write_data)
+    
+    def _write_data(self):
         try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2, default=str)
+            with self._lock:
+                contenido = self.codec.encode(self.data)
+            atomic_write(self.data_file, contenido)
         except Exception as e:
             print(f"Error al guardar datos provisionales: {e}")
     
-    def find_one(self, collection: str, query: dict = None) -> Optional[Dict]:
-        """Busca un documento en la colección especificada"""
-        if collection not in self.data:
-            self.data[collection] = []
-            return None
+    def _docs(self, collection: str) -> List[Dict]:
+        """Devuelve los documentos de la colección, creándola si no existe"""
+        with self._lock:
+            docs = self.data.get(collection)
+            if docs is None:
+                docs = self.data[collection] = []
+            if collection not in self._indexes:
+                self.create_index(collection, '_id')
+            return docs
+    
+    @staticmethod
+    def _index_value(value: Any) -> Any:
+        """Convierte un valor en una clave hashable para los índices"""
+        try:
+            hash(value)
+            return value
+        except TypeError:
+            return ('__json__', json.dumps(value, sort_keys=True, default=str))
+    
+    def _index_key(self, doc: dict, fields: tuple) -> tuple:
+        return tuple(self._index_value(get_value(doc, f)) for f in fields)
+    
+    def _index_add(self, collection: str, doc: dict, only: set = None):
+        for fields, buckets in self._indexes[collection].items():
+            if only is None or only.intersection(fields):
+                buckets.setdefault(self._index_key(doc, fields), {})[id(doc)] = doc
+    
+    def _index_remove(self, collection: str, doc: dict, only: set = None):
+        for fields, buckets in self._indexes[collection].items():
+            if only is None or only.intersection(fields):
+                key = self._index_key(doc, fields)
+                bucket = buckets.get(key)
+                if bucket is not None:
+                    bucket.pop(id(doc), None)
+                    if not bucket:
+                        del buckets[key]
+    
+    def _by_id(self, collection: str, doc_id: Any) -> Optional[Dict]:
+        bucket = self._indexes[collection][('_id',)].get((self._index_value(doc_id),))
+        return next(iter(bucket.values())) if bucket else None
+    
+    def _affected(self, collection: str, paths: Iterable[str]) -> set:
+        """Campos indexados que cambian al tocar esas rutas: la misma, un padre o un hijo"""
+        return {
+            f for fields in self._indexes[collection] for f in fields
+            if any(f == p or f.startswith(p + '.') or p.startswith(f + '.') for p in paths)
+        }
+    
+    def _update(self, collection: str, doc: dict, update: dict) -> bool:
+        """Aplica operadores de actualización manteniendo los índices afectados"""
+        affected = self._affected(collection, {path for fields in update.values() for path in fields})
+        self._index_remove(collection, doc, affected)
+        try:
+            changed = apply_update(doc, update)
+        finally:
+            self._index_add(collection, doc, affected)
+        if changed:
+            self._touch(doc)
+        return changed
+    
+    def _replace(self, collection: str, doc: dict, replacement: dict) -> bool:
+        """Reemplaza el contenido del documento conservando su _id"""
+        nuevo = {**replacement, '_id': doc['_id']}
+        if nuevo == doc:
+            return False
+        self._index_remove(collection, doc)
+        doc.clear()
+        doc.update(nuevo)
+        self._index_add(collection, doc)
+        self._touch(doc)
+        return True
+    
+    def _touch(self, doc: dict):
+        self._versions[id(doc)] = self._versions.get(id(doc), 0) + 1
+    
+    def _delete(self, collection: str, removed: List[Dict]):
+        """Quita documentos de la colección y de sus índices"""
+        if not removed:
+            return
+        docs = self.data[collection]
+        for doc in removed:
+            self._index_remove(collection, doc)
+            self._versions.pop(id(doc), None)
+        if all(a is b for a, b in zip(docs, removed)):
+            del docs[:len(removed)]
+        else:
+            ids = {id(doc) for doc in removed}
+            docs[:] = [doc for doc in docs if id(doc) not in ids]
+    
+    def create_index(self, collection: str, fields) -> str:
+        """Crea un índice hash en memoria sobre uno o varios campos
+        
+        Acepta un nombre de campo, una lista de campos o el formato de PyMongo
+        ``[('campo', 1), ...]``; la dirección se ignora.
+        """
+        if isinstance(fields, str):
+            fields = [fields]
+        fields = tuple(f[0] if isinstance(f, (tuple, list)) else f for f in fields)
+        
+        with self._lock:
+            indexes = self._indexes.setdefault(collection, {})
+            if fields not in indexes:
+                buckets = {}
+                for doc in self.data.get(collection, []):
+                    buckets.setdefault(self._index_key(doc, fields), {})[id(doc)] = doc
+                indexes[fields] = buckets
+            if ('_id',) not in indexes:
+                self.create_index(collection, '_id')
+        return '_'.join(f'{f}_1' for f in fields)
+    
+    def _candidates(self, collection: str, query: dict) -> Optional[List[Dict]]:
+        """Elige el índice más selectivo para la consulta; None si ninguno aplica
+        
+        Sirven los índices cuyos campos tienen todos una condición de igualdad, y
+        los de un solo campo consultado con ``$in`` (unión de sus grupos).
+        """
+        best = None
+        for fields, buckets in self._indexes[collection].items():
+            key = []
+            for f in fields:
+                exact, value = equality_value(query, f)
+                if not exact:
+                    break
+                key.append(self._index_value(value))
+            else:
+                groups = [buckets.get(tuple(key), {})]
+                if best is None or sum(map(len, groups)) < sum(map(len, best)):
+                    best = groups
+                continue
+            
+            condition = query.get(fields[0])
+            if len(fields) == 1 and isinstance(condition, dict) and set(condition) == {'$in'}:
+                keys = {(self._index_value(v),) for v in condition['$in']}
+                groups = [buckets[k] for k in keys if k in buckets]
+                if best is None or sum(map(len, groups)) < sum(map(len, best)):
+                    best = groups
         
-        if not query:
-            return self.data[collection][0] if self.data[collection] else None
+        if best is None:
+            return None
+        return [doc for group in best for doc in group.values()]
+    
+    def _scan(self, collection: str, query: dict):
+        """Recorre los documentos que coinciden, usando un índice si es posible"""
+        matches = compile_query(query)
+        docs = self._candidates(collection, query) if query else None
+        if docs is None:
+            docs = self.data[collection]
+        return (doc for doc in docs if matches(doc))
+    
+    def find_one(self, collection: str, query: dict = None) -> Optional[Dict]:
+        """Busca un documento en la colección especificada
         
-        for doc in self.data[collection]:
-            if all(doc.get(k) == v for k, v in query.items()):
-                return doc
-        return None
+        Devuelve una copia profunda: AsyncDataStore lee desde varios hilos
+        mientras otro puede estar modificando el documento (o sus subdocumentos).
+        """
+        with self._lock:
+            docs = self._docs(collection)
+            if not query:
+                doc = docs[0] if docs else None
+            else:
+                doc = next(self._scan(collection, query), None)
+            return copy.deepcopy(doc) if doc is not None else None
     
     def insert_one(self, collection: str, document: dict) -> Dict:
         """Inserta un documento en la colección especificada"""
-        if collection not in self.data:
-            self.data[collection] = []
+        with self._lock:
+            self._insert(collection, document)
+            self._persist('insert', collection, doc=document)
+            self._prune(collection)
+            return {'inserted_id': document['_id']}
+    
+    def _insert(self, collection: str, document: dict):
+        docs = self._docs(collection)
         
-        # Añadir timestamp si no existe
+        # Añadir timestamp e identificador si no existen
         if 'created_at' not in document:
             document['created_at'] = datetime.now(timezone.utc).isoformat()
+        if '_id' not in document:
+            document['_id'] = str(ObjectId())
         
-        self.data[collection].append(document)
-        self._save_data()
-        return {'inserted_id': len(self.data[collection]) - 1}
+        docs.append(document)
+        self._index_add(collection, document)
+    
+    def bulk_write(self, collection: str, requests: Iterable[Any], ordered: bool = True):
+        """Aplica varias operaciones de PyMongo y las registra en una sola escritura"""
+        with self._lock:
+            self._docs(collection)
+            return execute(requests, _ProvisionalBulk(self, collection), ordered)
     
-    def find(self, collection: str, query: dict = None) -> List[Dict]:
-        """Busca múltiples documentos en la colección especificada"""
-        if collection not in self.data:
-            self.data[collection] = []
+    def _prune(self, collection: str, persist: bool = True) -> List[Dict]:
+        """Aplica la política de retención descartando los documentos más viejos"""
+        policy = self.retention.get(collection)
+        docs = self.data.get(collection)
+        if policy is None or not docs:
             return []
+        removed = docs[:policy.prune_count(docs, len(docs))]
+        if removed:
+            self._delete(collection, removed)
+            if persist:
+                self._persist('delete', collection, ids=[doc['_id'] for doc in removed])
+        return removed
+    
+    def _to_mongo(self, collection: str, doc: dict) -> dict:
+        """Campos de un documento para el upsert, con la fecha TTL como datetime"""
+        campos = {k: v for k, v in doc.items() if k != '_id'}
+        policy = self.retention.get(collection)
+        if policy and policy.ttl_seconds and isinstance(campos.get(policy.ttl_field), str):
+            try:
+                campos[policy.ttl_field] = datetime.fromisoformat(campos[policy.ttl_field])
+            except ValueError:
+                pass
+        return campos
+    
+    def update_one(self, collection: str, filter: dict, update: dict) -> Dict:
+        """Aplica ``$set``/``$unset``/``$inc`` al primer documento que coincida con el filtro"""
+        with self._lock:
+            docs = self._docs(collection)
+            doc = next(self._scan(collection, filter), None) if filter else (docs[0] if docs else None)
+            if doc is None:
+                return {'matched_count': 0, 'modified_count': 0}
+            
+            changed = self._update(collection, doc, update)
+            if changed:
+                self._persist('update', collection, id=doc['_id'], u=update)
+            return {'matched_count': 1, 'modified_count': int(changed)}
+    
+    def find(self, collection: str, query: dict = None, projection=None,
+             sort=None, skip: int = 0, limit: int = 0) -> Iterable[Dict]:
+        """Busca múltiples documentos y los devuelve como un cursor perezoso"""
+        self._docs(collection)
         
-        if not query:
-            return self.data[collection].copy()
+        def fetch(sort, skip, limit):
+            # sort/skip/limit se aplican bajo el lock y solo se copian los documentos
+            # que se devuelven; proyectar ya no toca los datos compartidos
+            with self._lock:
+                selected = apply_modifiers(self._scan(collection, query or {}), sort, skip, limit)
+                return [copy.deepcopy(doc) for doc in selected]
         
-        return [doc for doc in self.data[collection] 
-                if all(doc.get(k) == v for k, v in query.items())]
+        return Cursor(fetch, projection, sort, skip, limit)
     
-    def sync_with_mongodb(self, mongo_db: Database) -> bool:
-        """Sincroniza los datos con MongoDB cuando esté disponible"""
+    def sync_with_mongodb(self, mongo_db: Database, batch_size: int = None) -> bool:
+        """Sincroniza los datos con MongoDB en lotes reanudables
+        
+        Cada lote se envía como un ``bulk_write`` no ordenado de upserts por
+        ``_id``. Al confirmarse, sus documentos se quitan de los datos locales y
+        el borrado queda registrado, lo que sirve de checkpoint por colección: si
+        la sincronización se interrumpe, la siguiente sigue con lo que quedó.
+        
+        El lote se serializa bajo el lock junto con la versión de cada documento;
+        los que se modificaron mientras viajaba a MongoDB no se borran y van en
+        el lote siguiente.
+        """
+        batch_size = batch_size or self.sync_batch_size
         try:
-            for collection_name, documents in self.data.items():
-                if not documents:
-                    continue
-                    
-                mongo_collection = mongo_db[collection_name]
+            while True:
+                with self._lock:
+                    pendientes = [c for c, docs in self.data.items() if docs and c != PENDING_OPS]
+                if not pendientes:
+                    # El escritor se vacía sin el lock: su hilo toma el lock del almacén
+                    # dentro de _write_data mientras tiene el suyo
+                    self._writer.flush()
+                    with self._lock:
+                        if not any(self.data.values()):
+                            self._clear_files()
+                    break
                 
-                # Insertar documentos que no existan en MongoDB
-                for doc in documents:
-                    query = {'_id': doc.get('_id')} if '_id' in doc else doc
-                    mongo_collection.update_one(
-                        query,
-                        {'$set': doc},
-                        upsert=True
-                    )
-            
-            # Limpiar datos locales después de sincronizar
-            self.data = {}
-            if os.path.exists(self.data_file):
-                os.remove(self.data_file)
+                for collection_name in pendientes:
+                    mongo_collection = mongo_db[collection_name]
+                    while True:
+                        with self._lock:
+                            batch = self.data[collection_name][:batch_size]
+                            versions = [self._versions.get(id(doc), 0) for doc in batch]
+                            requests = [
+                                UpdateOne(
+                                    {'_id': doc['_id']},
+                                    {'$set': copy.deepcopy(self._to_mongo(collection_name, doc))},
+                                    upsert=True
+                                )
+                                for doc in batch
+                            ]
+                        if not batch:
+                            break
+                        
+                        mongo_collection.bulk_write(requests, ordered=False)
+                        
+                        with self._lock:
+                            live = {id(doc) for doc in self.data[collection_name]}
+                            synced = [doc for doc, version in zip(batch, versions)
+                                      if id(doc) in live and self._versions.get(id(doc), 0) == version]
+                            if synced:
+                                self._delete(collection_name, synced)
+                                self._persist('delete', collection_name, ids=[doc['_id'] for doc in synced])
             
             self.using_mongodb = True
             return True
@@ -100,15 +576,394 @@ class ProvisionalDataStore:
         except Exception as e:
             print(f"Error al sincronizar con MongoDB: {e}")
             return False
+    
+    def _clear_files(self):
+        """Elimina la instantánea y el journal una vez sincronizado todo
+        
+        Se llama con el lock tomado y después de vaciar el escritor.
+        """
+        if self._compact_thread is not None:
+            self._compact_thread.join()
+        self.close()
+        if os.path.exists(self.data_file):
+            os.remove(self.data_file)
+        self._remove_journal_files()
+
+
+class _ProvisionalBulk(BulkTarget):
+    """Ejecuta un bulk_write en memoria acumulando los registros del journal"""
+    
+    def __init__(self, store: ProvisionalDataStore, collection: str):
+        self.store = store
+        self.collection = collection
+        self.registros = []
+    
+    def insert(self, doc):
+        if '_id' in doc and self.store._by_id(self.collection, doc['_id']) is not None:
+            raise DuplicateKeyError(f"_id duplicado: {doc['_id']}")
+        self.store._insert(self.collection, doc)
+        # Copia: operaciones posteriores del mismo lote pueden modificar el documento
+        self.registros.append({'op': 'insert', 'c': self.collection, 'doc': copy.deepcopy(doc)})
+        return doc['_id']
+    
+    def match(self, filter, multi):
+        docs = self.store._scan(self.collection, filter)
+        if multi:
+            return list(docs)
+        first = next(docs, None)
+        return [first] if first is not None else []
+    
+    def update(self, doc, update):
+        changed = self.store._update(self.collection, doc, update)
+        if changed:
+            self.registros.append({'op': 'update', 'c': self.collection, 'id': doc['_id'], 'u': update})
+        return changed
+    
+    def replace(self, doc, replacement):
+        changed = self.store._replace(self.collection, doc, replacement)
+        if changed:
+            self.registros.append({'op': 'replace', 'c': self.collection, 'id': doc['_id'],
+                                   'doc': copy.deepcopy(doc)})
+        return changed
+    
+    def delete(self, docs):
+        self.store._delete(self.collection, docs)
+        if docs:
+            self.registros.append({'op': 'delete', 'c': self.collection, 'ids': [doc['_id'] for doc in docs]})
+    
+    def commit(self):
+        self.store._persist_records(self.registros)
+        self.store._prune(self.collection)
+
+
+class RouterDataStore:
+    """Enruta las operaciones a MongoDB o al almacenamiento provisional en caliente
+    
+    Funciona como un circuit breaker: mientras el circuito está cerrado todo va
+    a ``primary`` (un ``config.MongoDataStore``); el primer ``ConnectionFailure``
+    lo abre, la operación se repite sobre ``fallback`` y desde ahí lecturas y
+    escrituras quedan en el almacenamiento provisional. Un hilo de fondo hace
+    ping cada ``probe_interval`` segundos y, cuando MongoDB responde, sube lo
+    acumulado con ``sync_with_mongodb`` y recién entonces vuelve a cerrar el
+    circuito. El circuito arranca abierto, así que el bot no espera a MongoDB
+    para empezar a responder.
+    
+    Mientras MongoDB no está, las lecturas solo ven los documentos escritos
+    localmente. Las actualizaciones y borrados se aplican sobre esos documentos
+    y además se guardan en ``PENDING_OPS`` (con el filtro excluyendo los
+    documentos locales que ya tocaron) para repetirlos en MongoDB antes de
+    subir lo acumulado, así que también alcanzan a los documentos que solo
+    existen en el servidor. Un upsert que crea el documento localmente no se
+    repite como upsert en MongoDB.
+    """
+    
+    def __init__(self, primary, fallback: ProvisionalDataStore, probe_interval: float = 15.0):
+        self.primary = primary
+        self.fallback = fallback
+        self.probe_interval = probe_interval
+        self._healthy = False
+        # Protege el cambio de destino frente a las escrituras locales
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._probe_thread = threading.Thread(target=self._probe_loop, name='datastore-probe', daemon=True)
+        self._probe_thread.start()
+    
+    @property
+    def using_mongodb(self) -> bool:
+        return self._healthy
+    
+    def _trip(self, error: Exception):
+        """Abre el circuito y despierta al hilo de sondeo"""
+        with self._lock:
+            if self._healthy:
+                print(f"[!] MongoDB dejó de responder ({error}); usando almacenamiento provisional")
+                self._healthy = False
+        self._wake.set()
+    
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            if not self._healthy and self._probe():
+                print("[+] MongoDB disponible de nuevo; datos provisionales sincronizados")
+            self._wake.wait(self.probe_interval)
+            self._wake.clear()
+    
+    def _probe(self) -> bool:
+        """Hace ping, vacía el almacenamiento provisional y cierra el circuito"""
+        try:
+            self.primary.client.admin.command('ping')
+            db = self.primary.db
+        except (ConnectionFailure, ServerSelectionTimeoutError):
+            return False
+        except Exception as e:
+            # Cualquier otro error es un fallo propio, no un corte: se informa y se reintenta
+            print(f"[!] Error inesperado al sondear MongoDB: {e!r}")
+            return False
+        while True:
+            # Primero las operaciones pendientes: así no alcanzan a los documentos que se suben después
+            if not self._replay_pending(db):
+                return False
+            # El grueso se sube sin bloquear a los comandos, que siguen escribiendo localmente
+            if not self.fallback.sync_with_mongodb(db):
+                return False
+            with self._lock:
+                # Solo se cambia de destino si no llegó nada mientras se sincronizaba
+                if not any(self.fallback.data.values()):
+                    self._healthy = True
+                    return True
+    
+    def _replay_pending(self, db, batch_size: int = 100) -> bool:
+        """Repite en MongoDB, en orden, las operaciones registradas durante el corte"""
+        try:
+            while True:
+                with self._lock:
+                    ops = self.fallback.find(PENDING_OPS, {}, limit=batch_size).to_list()
+                if not ops:
+                    return True
+                for op in ops:
+                    target = db[op['c']]
+                    if op['op'].startswith('delete'):
+                        getattr(target, op['op'])(op['filter'])
+                    else:
+                        getattr(target, op['op'])(op['filter'], op['update'])
+                    # Se quita una por una: si el sondeo se corta, no se repite lo ya aplicado
+                    with self._lock:
+                        self.fallback.delete_many(PENDING_OPS, {'_id': op['_id']})
+        except Exception as e:
+            print(f"Error al repetir operaciones pendientes en MongoDB: {e}")
+            return False
+    
+    def _queue(self, collection: str, op: str, filter: dict, update: Any = None,
+               exclude: List[Any] = ()) -> None:
+        if exclude:
+            excluded = {'_id': {'$nin': list(exclude)}}
+            filter = {**filter, **excluded} if '_id' not in filter else {'$and': [filter, excluded]}
+        self.fallback.insert_one(PENDING_OPS, {'c': collection, 'op': op, 'filter': filter, 'update': update})
+    
+    def _local_ids(self, collection: str, filter: dict, multi: bool) -> List[Any]:
+        docs = self.fallback.find(collection, filter, {'_id': 1}, limit=0 if multi else 1)
+        return [doc['_id'] for doc in docs]
+    
+    def _offline_write(self, collection: str, request: Any) -> BulkWriteResult:
+        """Aplica una operación localmente y registra lo que MongoDB todavía tiene que ver
+        
+        Se llama con ``self._lock`` tomado, así que los documentos locales no
+        cambian entre buscar los que coinciden y aplicar la operación.
+        """
+        kind, filter, doc, upsert, multi = normalize_requests([request])[0]
+        ids = self._local_ids(collection, filter, multi) if kind != 'insert' else []
+        result = self.fallback.bulk_write(collection, [request])
+        if kind == 'delete':
+            if multi:
+                self._queue(collection, 'delete_many', filter)
+            elif not ids:
+                self._queue(collection, 'delete_one', filter)
+        elif kind in ('update', 'replace') and (multi or not ids):
+            if not result.upserted_count:
+                op = 'update_many' if multi else ('update_one' if kind == 'update' else 'replace_one')
+                self._queue(collection, op, filter, doc, exclude=ids)
+            elif multi:
+                # El documento creado localmente se sube solo; en MongoDB se actualiza lo que coincida
+                self._queue(collection, 'update_many', filter, doc,
+                            exclude=ids + list(result.upserted_ids.values()))
+        return result
+    
+    def _call(self, method: str, collection: str, *args, offline=None):
+        while True:
+            if self._healthy:
+                try:
+                    return getattr(self.primary, method)(collection, *args)
+                except ConnectionFailure as e:
+                    self._trip(e)
+            with self._lock:
+                # El sondeo pudo cerrar el circuito mientras se esperaba el lock; lo que
+                # se escribiera ahora en el almacenamiento provisional ya no se subiría
+                if self._healthy:
+                    continue
+                if offline is not None:
+                    return offline()
+                return getattr(self.fallback, method)(collection, *args)
+    
+    def find_one(self, collection: str, query: dict = None) -> Optional[Dict]:
+        return self._call('find_one', collection, query or {})
+    
+    def insert_one(self, collection: str, document: dict) -> Any:
+        return self._call('insert_one', collection, document)
+    
+    def update_one(self, collection: str, filter: dict, update: dict) -> Any:
+        return self._call('update_one', collection, filter, update, offline=lambda: update_result(
+            self._offline_write(collection, UpdateOne(filter, update))))
+    
+    def insert_many(self, collection: str, documents: Iterable[Dict], ordered: bool = True) -> Any:
+        return self._call('insert_many', collection, list(documents), ordered)
+    
+    def update_many(self, collection: str, filter: dict, update: dict, upsert: bool = False) -> Any:
+        return self._call('update_many', collection, filter, update, upsert, offline=lambda: update_result(
+            self._offline_write(collection, UpdateMany(filter, update, upsert=upsert))))
+    
+    def delete_many(self, collection: str, filter: dict) -> Any:
+        return self._call('delete_many', collection, filter, offline=lambda: DeleteResult(
+            {'n': self._offline_write(collection, DeleteMany(filter)).deleted_count}, True))
+    
+    def bulk_write(self, collection: str, requests: Iterable[Any], ordered: bool = True) -> Any:
+        requests = list(requests)
+        return self._call('bulk_write', collection, requests, ordered,
+                          offline=lambda: self._offline_bulk(collection, requests, ordered))
+    
+    def _offline_bulk(self, collection: str, requests: List[Any], ordered: bool) -> BulkWriteResult:
+        if all(isinstance(request, InsertOne) for request in requests):
+            return self.fallback.bulk_write(collection, requests, ordered)
+        # Con actualizaciones o borrados se aplica de a una para saber qué tocó cada operación
+        total = {
+            'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0,
+            'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': [], 'insertedIds': {},
+        }
+        for index, request in enumerate(requests):
+            try:
+                raw = self._offline_write(collection, request).bulk_api_result
+            except BulkWriteError as e:
+                raw = e.details
+            for key in ('nInserted', 'nUpserted', 'nMatched', 'nModified', 'nRemoved'):
+                total[key] += raw.get(key, 0)
+            total['upserted'] += [{**u, 'index': index} for u in raw.get('upserted', [])]
+            total['insertedIds'].update({index: v for v in raw.get('insertedIds', {}).values()})
+            if raw.get('writeErrors'):
+                total['writeErrors'] += [{**error, 'index': index} for error in raw['writeErrors']]
+                if ordered:
+                    break
+        if total['writeErrors']:
+            raise BulkWriteError(total)
+        return BulkWriteResult(total, True)
+    
+    def find(self, collection: str, query: dict = None, projection=None,
+             sort=None, skip: int = 0, limit: int = 0) -> Iterable[Dict]:
+        """Cursor perezoso; el destino se decide al empezar a iterar"""
+        def fetch(sort, skip, limit):
+            while True:
+                if self._healthy:
+                    try:
+                        # Se materializa para que un corte a mitad de iteración no llegue al llamador
+                        return list(self.primary.find(collection, query or {}, None, sort, skip, limit))
+                    except ConnectionFailure as e:
+                        self._trip(e)
+                with self._lock:
+                    if not self._healthy:
+                        return list(self.fallback.find(collection, query or {}, None, sort, skip, limit))
+        
+        return Cursor(fetch, projection, sort, skip, limit)
+    
+    def flush(self):
+        self.fallback.flush()
+    
+    def close(self):
+        """Detiene el sondeo y cierra el almacenamiento provisional"""
+        self._stop.set()
+        self._wake.set()
+        self._probe_thread.join()
+        self.fallback.close()
+
+
+class AsyncDataStore:
+    """Fachada asíncrona para los almacenamientos síncronos
+    
+    Envuelve un ``ProvisionalDataStore``, un ``config.DataStore`` o una base de
+    datos de PyMongo (o el ``DBWrapper`` de ``setup_datastore``) y ejecuta cada
+    llamada en un ``ThreadPoolExecutor`` acotado para no bloquear el event loop
+    de discord.py. Las llamadas en espera también están acotadas por
+    ``max_pending`` y cada una registra su latencia en ``self.latency``.
+    """
+    
+    def __init__(self, backend, max_workers: int = 4, max_pending: int = 64):
+        self.backend = backend
+        self.latency = LatencyStats()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='datastore')
+        self._pending = asyncio.Semaphore(max_pending)
+    
+    @property
+    def using_mongodb(self) -> bool:
+        if callable(getattr(type(self.backend), 'find_one', None)):
+            return self.backend.using_mongodb
+        # El DBWrapper de setup_datastore envuelve el almacenamiento provisional
+        return 'store' not in vars(self.backend)
+    
+    def _bind(self, collection: str, method: str):
+        """Resuelve el método del backend según su API"""
+        # Las bases de PyMongo devuelven una colección para cualquier atributo,
+        # así que se mira la clase para distinguirlas de los DataStore
+        if callable(getattr(type(self.backend), method, None)):
+            return functools.partial(getattr(self.backend, method), collection)
+        return getattr(self.backend[collection], method)
+    
+    async def _run(self, collection: str, method: str, func):
+        loop = asyncio.get_running_loop()
+        async with self._pending:
+            start = time.perf_counter()
+            error = False
+            try:
+                return await loop.run_in_executor(self._executor, func)
+            except Exception:
+                error = True
+                raise
+            finally:
+                self.latency.record(f'{collection}.{method}', time.perf_counter() - start, error)
+    
+    async def find_one(self, collection: str, query: dict = None) -> Optional[Dict]:
+        func = self._bind(collection, 'find_one')
+        return await self._run(collection, 'find_one', lambda: func(query or {}))
+    
+    async def find(self, collection: str, query: dict = None, projection=None,
+                   sort=None, skip: int = 0, limit: int = 0) -> List[Dict]:
+        """Materializa en el executor el cursor del backend"""
+        func = self._bind(collection, 'find')
+        modifiers = {'skip': skip, 'limit': limit}
+        if sort:
+            modifiers['sort'] = sort
+        return await self._run(collection, 'find', lambda: list(func(query or {}, projection, **modifiers)))
+    
+    async def insert_one(self, collection: str, document: dict) -> Any:
+        func = self._bind(collection, 'insert_one')
+        return await self._run(collection, 'insert_one', lambda: func(document))
+    
+    async def update_one(self, collection: str, filter: dict, update: dict) -> Any:
+        func = self._bind(collection, 'update_one')
+        return await self._run(collection, 'update_one', lambda: func(filter, update))
+    
+    async def insert_many(self, collection: str, documents: Iterable[Dict], ordered: bool = True) -> Any:
+        func = self._bind(collection, 'insert_many')
+        return await self._run(collection, 'insert_many', lambda: func(list(documents), ordered=ordered))
+    
+    async def update_many(self, collection: str, filter: dict, update: dict, upsert: bool = False) -> Any:
+        func = self._bind(collection, 'update_many')
+        return await self._run(collection, 'update_many', lambda: func(filter, update, upsert=upsert))
+    
+    async def delete_many(self, collection: str, filter: dict) -> Any:
+        func = self._bind(collection, 'delete_many')
+        return await self._run(collection, 'delete_many', lambda: func(filter))
+    
+    async def bulk_write(self, collection: str, requests: Iterable[Any], ordered: bool = True) -> Any:
+        func = self._bind(collection, 'bulk_write')
+        return await self._run(collection, 'bulk_write', lambda: func(list(requests), ordered=ordered))
+    
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Latencias por colección y operación, en milisegundos"""
+        return self.latency.snapshot()
+    
+    async def close(self):
+        """Espera las operaciones pendientes y libera el executor"""
+        await asyncio.to_thread(self._executor.shutdown, True)
+        for name in ('flush', 'close'):
+            method = getattr(type(self.backend), name, None)
+            if callable(method):
+                await asyncio.to_thread(method, self.backend)
 
 
 def setup_datastore(mongodb_uri: str, db_name: str):
     """Configura el almacenamiento, intentando conectar a MongoDB primero"""
     # Primero intentar conectar a MongoDB
     try:
-        client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        db = client[db_name]
+        mongo_pool.ping(mongodb_uri)
+        db = mongo_pool.get_database(db_name, mongodb_uri)
+        apply_mongo_retention(db, DEFAULT_RETENTION)
         
         # Crear colecciones necesarias si no existen
         for collection in ['logs', 'preguntas']:
@@ -148,15 +1003,25 @@ def setup_datastore(mongodb_uri: str, db_name: str):
             def insert_one(self, document, **kwargs):
                 return self.store.insert_one(self.name, document)
                 
-            def find(self, query=None, **kwargs):
-                return self.store.find(self.name, query or {})
+            def find(self, query=None, projection=None, sort=None, skip=0, limit=0, **kwargs):
+                return self.store.find(self.name, query or {}, projection, sort, skip, limit)
+            
+            def create_index(self, keys, **kwargs):
+                return self.store.create_index(self.name, keys)
                 
             def update_one(self, filter, update, **kwargs):
-                # Implementación básica para update_one
-                doc = self.store.find_one(self.name, filter)
-                if doc and '$set' in update:
-                    doc.update(update['$set'])
-                    return {'matched_count': 1, 'modified_count': 1}
-                return {'matched_count': 0, 'modified_count': 0}
+                return self.store.update_one(self.name, filter, update)
+            
+            def insert_many(self, documents, ordered=True, **kwargs):
+                return self.store.insert_many(self.name, documents, ordered)
+            
+            def update_many(self, filter, update, upsert=False, **kwargs):
+                return self.store.update_many(self.name, filter, update, upsert)
+            
+            def delete_many(self, filter, **kwargs):
+                return self.store.delete_many(self.name, filter)
+            
+            def bulk_write(self, requests, ordered=True, **kwargs):
+                return self.store.bulk_write(self.name, requests, ordered)
         
         return DBWrapper(store), False
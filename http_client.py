@@ -0,0 +1,136 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from metrics import LatencyStats
+
+# Dependencia opcional: h2 habilita HTTP/2 en httpx
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+# Respuestas que vale la pena reintentar
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class HttpClient:
+    """Cliente HTTP compartido por todo el bot
+
+    Reutiliza las conexiones (keep-alive) en lugar de abrir una conexión TCP y
+    TLS nueva por pedido, limita las conexiones simultáneas por host y
+    reintenta los errores de red y las respuestas 429/5xx con espera
+    exponencial con jitter (respetando ``Retry-After``). Las latencias quedan
+    en ``latency`` por endpoint.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20, max_per_host: int = 10,
+                 http2: Optional[bool] = None, retries: int = 3, backoff: float = 0.5,
+                 max_backoff: float = 8.0, timeout: float = 30.0, **client_options):
+        if http2 is None:
+            http2 = os.getenv('HTTP2') == '1'
+        if http2 and h2 is None:
+            print("[!] HTTP/2 pedido pero el paquete h2 no está instalado; se usa HTTP/1.1")
+            http2 = False
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.latency = LatencyStats()
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        # client_options permite, por ejemplo, un transport o base_url para pruebas
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive),
+            **client_options
+        )
+
+    @property
+    def closed(self) -> bool:
+        return self._client.is_closed
+
+    def _semaforo(self, host: str) -> asyncio.Semaphore:
+        semaforo = self._hosts.get(host)
+        if semaforo is None:
+            semaforo = self._hosts[host] = asyncio.Semaphore(self.max_per_host)
+        return semaforo
+
+    def _espera(self, intento: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        # Jitter completo: evita que los reintentos de varios pedidos coincidan
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** intento))
+
+    async def request(self, method: str, url: str, *, endpoint: Optional[str] = None,
+                      retries: Optional[int] = None, **kwargs) -> httpx.Response:
+        """Hace el pedido con reintentos; devuelve la última respuesta aunque sea un error
+
+        ``endpoint`` es el nombre con el que se registra la latencia (por
+        defecto host y ruta). Si fallan todos los intentos por un error de
+        red se lanza la excepción de httpx.
+        """
+        request_url = self._client.base_url.join(url) if self._client.base_url else httpx.URL(url)
+        nombre = endpoint or f"{request_url.host}{request_url.path}"
+        retries = self.retries if retries is None else retries
+
+        for intento in range(retries + 1):
+            response, error = None, None
+            async with self._semaforo(request_url.host):
+                inicio = time.perf_counter()
+                try:
+                    response = await self._client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    error = e
+                fallo = error is not None or response.status_code in RETRY_STATUS
+                self.latency.record(nombre, time.perf_counter() - inicio, error=fallo)
+
+            if not fallo:
+                return response
+            if intento == retries:
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(self._espera(intento, response))
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+_client: Optional[HttpClient] = None
+_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """Devuelve el cliente compartido, creándolo (o recreándolo si se cerró) al pedirlo"""
+    global _client
+    with _lock:
+        if _client is None or _client.closed:
+            _client = HttpClient(
+                max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', '100')),
+                max_per_host=int(os.getenv('HTTP_MAX_PER_HOST', '10')),
+            )
+        return _client
+
+
+async def close() -> None:
+    """Cierra el cliente compartido (al apagar el bot)"""
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
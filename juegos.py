@@ -1,21 +1,70 @@
 import random
+import re
+import string
 import asyncio
-from typing import Dict, List, Optional, Tuple
-import httpx
+import functools
+import heapq
+import itertools
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 import os
 from enum import Enum
 
+import http_client
+from keyword_matcher import normalize
+from storage_io import JSON, atomic_write, read_file
+
 class EstadoJuego(Enum):
     EN_ESPERA = "en_espera"
     EN_CURSO = "en_curso"
     TERMINADO = "terminado"
     CANCELADO = "cancelado"
 
+# Letra -> bit en la máscara de letras intentadas. El alfabeto es fijo; otras
+# letras solo tienen bit si aparecen en la palabra de la partida (ver _indice_palabra)
+ALFABETO = string.ascii_uppercase + 'ÑÁÉÍÓÚÜ'
+_BITS_LETRAS: Dict[str, int] = {letra: i for i, letra in enumerate(ALFABETO)}
+
+
+@lru_cache(maxsize=1024)
+def _indice_palabra(palabra: str) -> Tuple[Dict[str, Tuple[int, ...]], int, Dict[str, int]]:
+    """Posiciones de cada letra, letras a adivinar y bits de las letras fuera del alfabeto
+    
+    Se comparte entre las partidas con la misma palabra.
+    """
+    posiciones: Dict[str, List[int]] = {}
+    for i, letra in enumerate(palabra):
+        if letra.isalpha():
+            posiciones.setdefault(letra, []).append(i)
+    extras = [letra for letra in posiciones if letra not in _BITS_LETRAS]
+    bits_extra = {letra: len(ALFABETO) + i for i, letra in enumerate(extras)}
+    return ({letra: tuple(pos) for letra, pos in posiciones.items()},
+            sum(map(len, posiciones.values())), bits_extra)
+
+
 class JuegoAhorcado:
+    __slots__ = ('palabra', 'palabra_oculta', '_posiciones', '_bits_extra', '_intentadas', '_faltan',
+                 'intentos_restantes', 'estado', 'ganador', 'pistas', 'pistas_mostradas', 'max_pistas')
+    
+    # Dibujo del ahorcado según los errores cometidos
+    DIBUJOS = (
+        "  ____\n  |  |\n  |  \n  |  \n  |  \n__|__",
+        "  ____\n  |  |\n  |  O\n  |  \n  |  \n__|__",
+        "  ____\n  |  |\n  |  O\n  |  |\n  |  \n__|__",
+        "  ____\n  |  |\n  |  O\n  | /|\n  |  \n__|__",
+        "  ____\n  |  |\n  |  O\n  | /|\\\n  |  \n__|__",
+        "  ____\n  |  |\n  |  O\n  | /|\\\n  | / \n__|__",
+        "  ____\n  |  |\n  |  O\n  | /|\\\n  | / \\\n__|__",
+    )
+    
     def __init__(self, palabra: str, pistas: List[str] = None):
         self.palabra = palabra.upper()
         self.palabra_oculta = ['_' if letra.isalpha() else letra for letra in self.palabra]
-        self.letras_intentadas = set()
+        # Índice letra -> posiciones y letras por adivinar: cada intento cuesta O(apariciones)
+        self._posiciones, self._faltan, self._bits_extra = _indice_palabra(self.palabra)
+        self._intentadas = 0
         self.intentos_restantes = 6
         self.estado = EstadoJuego.EN_ESPERA
         self.ganador = None
@@ -23,22 +72,42 @@ class JuegoAhorcado:
         self.pistas_mostradas = 0
         self.max_pistas = 2 if pistas else 0
     
+    @property
+    def letras_intentadas(self) -> Set[str]:
+        mascara = self._intentadas
+        letras = {letra for letra, bit in _BITS_LETRAS.items() if mascara >> bit & 1}
+        letras.update(letra for letra, bit in self._bits_extra.items() if mascara >> bit & 1)
+        return letras
+    
     def intentar_letra(self, letra: str) -> bool:
-        """Intenta adivinar una letra. Devuelve True si la letra está en la palabra."""
+        """Intenta adivinar una letra. Devuelve True si la letra está en la palabra.
+        
+        Devuelve None si ya se intentó o si no es una sola letra válida; en ese
+        caso no se descuenta ningún intento.
+        """
         letra = letra.upper()
-        if letra in self.letras_intentadas:
+        if len(letra) != 1 or not letra.isalpha():
+            return None
+        bit = _BITS_LETRAS.get(letra)
+        if bit is None:
+            bit = self._bits_extra.get(letra)
+            if bit is None:
+                return None  # Letra fuera del alfabeto que tampoco está en la palabra
+        bit = 1 << bit
+        if self._intentadas & bit:
             return None  # Ya se intentó esta letra
         
-        self.letras_intentadas.add(letra)
+        self._intentadas |= bit
         
-        if letra in self.palabra:
+        posiciones = self._posiciones.get(letra)
+        if posiciones:
             # Actualizar palabra oculta
-            for i, l in enumerate(self.palabra):
-                if l == letra:
-                    self.palabra_oculta[i] = letra
+            for i in posiciones:
+                self.palabra_oculta[i] = letra
+            self._faltan -= len(posiciones)
             
             # Verificar si ganó
-            if '_' not in self.palabra_oculta:
+            if self._faltan == 0:
                 self.estado = EstadoJuego.TERMINADO
                 self.ganador = True
             return True
@@ -51,8 +120,9 @@ class JuegoAhorcado:
     
     def intentar_palabra(self, palabra: str) -> bool:
         """Intenta adivinar la palabra completa. Devuelve True si es correcta."""
-        if palabra.upper() == self.palora:
+        if palabra.upper() == self.palabra:
             self.palabra_oculta = list(self.palabra)
+            self._faltan = 0
             self.estado = EstadoJuego.TERMINADO
             self.ganador = True
             return True
@@ -73,23 +143,15 @@ class JuegoAhorcado:
     
     def obtener_estado(self) -> str:
         """Devuelve una representación del estado actual del juego."""
-        # Dibujo del ahorcado
-        dibujo = [
-            "  ____\n  |  |\n  |  \n  |  \n  |  \n__|__",
-            "  ____\n  |  |\n  |  O\n  |  \n  |  \n__|__",
-            "  ____\n  |  |\n  |  O\n  |  |\n  |  \n__|__",
-            "  ____\n  |  |\n  |  O\n  | /|\n  |  \n__|__",
-            "  ____\n  |  |\n  |  O\n  | /|\\n  |  \n__|__",
-            "  ____\n  |  |\n  |  O\n  | /|\\n  | / \n__|__",
-            "  ____\n  |  |\n  |  O\n  | /|\\n  | / \\n__|__"
-        ]
-        
+        letras_intentadas = self.letras_intentadas
         intentos_restantes = min(max(0, self.intentos_restantes), 6)
-        return f"```{dibujo[6 - intentos_restantes]}\n\n{' '.join(self.palabra_oculta)}\n" \
-               f"\nLetras intentadas: {', '.join(sorted(self.letras_intentadas)) if self.letras_intentadas else 'Ninguna'}" \
+        return f"```{self.DIBUJOS[6 - intentos_restantes]}\n\n{' '.join(self.palabra_oculta)}\n" \
+               f"\nLetras intentadas: {', '.join(sorted(letras_intentadas)) if letras_intentadas else 'Ninguna'}" \
                f"\nIntentos restantes: {self.intentos_restantes}```"
 
 class JuegoPiedraPapelTijeras:
+    __slots__ = ('jugador1', 'jugador2', 'eleccion1', 'eleccion2', 'estado', 'ganador')
+    
     OPCIONES = ["piedra", "papel", "tijeras"]
     RESULTADOS = {
         "piedra": {"piedra": 0, "papel": -1, "tijeras": 1},
@@ -146,6 +208,9 @@ class JuegoPiedraPapelTijeras:
         self.estado = EstadoJuego.TERMINADO
 
 class JuegoTrivia:
+    __slots__ = ('pregunta', 'opciones', 'respuesta_correcta', 'categoria', 'dificultad',
+                 'respuestas', 'estado', 'temporizador')
+    
     def __init__(self, pregunta: str, opciones: List[str], respuesta_correcta: int, categoria: str = "General", dificultad: str = "Media"):
         self.pregunta = pregunta
         self.opciones = opciones
@@ -169,72 +234,490 @@ class JuegoTrivia:
         return {jugador: (respuesta == self.respuesta_correcta) 
                 for jugador, respuesta in self.respuestas.items()}
 
-async def generar_palabra_ahorcado() -> Tuple[str, List[str]]:
-    """Genera una palabra y pistas usando la API de DeepSeek."""
+# (servidor, canal, usuario); usuario es None en las partidas de todo el canal
+ClaveJuego = Tuple[Optional[int], int, Optional[int]]
+FINALIZADOS = (EstadoJuego.TERMINADO, EstadoJuego.CANCELADO)
+
+
+class _Sesion:
+    __slots__ = ('juego', 'timeout', 'vence', 'al_expirar')
+    
+    def __init__(self, juego, timeout: float, vence: float, al_expirar):
+        self.juego = juego
+        self.timeout = timeout
+        self.vence = vence
+        self.al_expirar = al_expirar
+
+
+class GameSessionManager:
+    """Partidas activas indexadas por (servidor, canal, usuario)
+    
+    Todos los vencimientos se atienden desde una sola tarea con un heap de
+    plazos, en lugar de una tarea o un ``wait_for`` por partida. Renovar una
+    partida solo agrega su nuevo plazo al heap; las entradas viejas se
+    descartan al salir. Las partidas terminadas o canceladas se quitan al
+    consultarlas o renovarlas, y cualquier partida sin actividad se quita al
+    vencer su plazo, así que la memoria queda acotada.
+    """
+    
+    def __init__(self, timeout: float = None):
+        self.timeout = timeout if timeout is not None else float(os.getenv('JUEGOS_TIMEOUT', '300'))
+        self._sesiones: Dict[ClaveJuego, _Sesion] = {}
+        self._heap: List[Tuple[float, int, ClaveJuego]] = []
+        self._orden = itertools.count()
+        self._tarea = None
+        self._despertar = None
+        # Referencias a los al_expirar asíncronos en curso (el loop solo guarda referencias débiles)
+        self._avisos: Set[asyncio.Task] = set()
+        self.creadas = 0
+        self.expiradas = 0
+        self.desalojadas = 0
+        # Desalojos por segundo de los últimos 60 segundos: [(segundo, cantidad), ...]
+        self._ventana = deque()
+    
+    def __len__(self) -> int:
+        return len(self._sesiones)
+    
+    @staticmethod
+    def _ahora() -> float:
+        return time.monotonic()
+    
+    def start(self) -> None:
+        """Lanza la tarea que atiende los vencimientos (requiere un loop en marcha)"""
+        if self._tarea is None or self._tarea.done():
+            self._despertar = asyncio.Event()
+            self._tarea = asyncio.create_task(self._programador())
+    
+    async def close(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        if self._avisos:
+            await asyncio.gather(*self._avisos, return_exceptions=True)
+    
+    def agregar(self, guild_id: Optional[int], channel_id: int, user_id: Optional[int], juego,
+                timeout: float = None, al_expirar: Callable = None):
+        """Registra una partida (reemplaza la anterior con la misma clave)
+        
+        ``al_expirar(clave, juego)`` se llama si la partida vence sin
+        actividad; puede ser una corrutina.
+        """
+        clave = (guild_id, channel_id, user_id)
+        timeout = self.timeout if timeout is None else timeout
+        sesion = _Sesion(juego, timeout, self._ahora() + timeout, al_expirar)
+        self._sesiones[clave] = sesion
+        self.creadas += 1
+        self._programar(clave, sesion)
+        return juego
+    
+    def obtener(self, guild_id: Optional[int], channel_id: int, user_id: Optional[int] = None):
+        """Partida activa de la clave, o None si no hay o ya terminó"""
+        clave = (guild_id, channel_id, user_id)
+        sesion = self._sesiones.get(clave)
+        if sesion is None:
+            return None
+        if sesion.juego.estado in FINALIZADOS:
+            self._desalojar(clave)
+            return None
+        return sesion.juego
+    
+    def renovar(self, guild_id: Optional[int], channel_id: int, user_id: Optional[int] = None) -> bool:
+        """Reinicia el plazo tras una jugada; si la partida terminó, la quita"""
+        clave = (guild_id, channel_id, user_id)
+        sesion = self._sesiones.get(clave)
+        if sesion is None:
+            return False
+        if sesion.juego.estado in FINALIZADOS:
+            self._desalojar(clave)
+            return False
+        sesion.vence = self._ahora() + sesion.timeout
+        self._programar(clave, sesion)
+        return True
+    
+    def quitar(self, guild_id: Optional[int], channel_id: int, user_id: Optional[int] = None):
+        """Quita la partida y la devuelve (o None si no había)"""
+        clave = (guild_id, channel_id, user_id)
+        if clave not in self._sesiones:
+            return None
+        return self._desalojar(clave).juego
+    
+    def _programar(self, clave: ClaveJuego, sesion: _Sesion) -> None:
+        adelanta = not self._heap or sesion.vence < self._heap[0][0]
+        heapq.heappush(self._heap, (sesion.vence, next(self._orden), clave))
+        if len(self._heap) > 2 * len(self._sesiones) + 64:
+            # Demasiadas entradas viejas por renovaciones: se reconstruye
+            self._heap = [(s.vence, next(self._orden), c) for c, s in self._sesiones.items()]
+            heapq.heapify(self._heap)
+        if adelanta and self._despertar is not None:
+            self._despertar.set()
+    
+    def _desalojar(self, clave: ClaveJuego) -> _Sesion:
+        sesion = self._sesiones.pop(clave)
+        self.desalojadas += 1
+        segundo = int(self._ahora())
+        if self._ventana and self._ventana[-1][0] == segundo:
+            self._ventana[-1][1] += 1
+        else:
+            self._ventana.append([segundo, 1])
+            while self._ventana[0][0] <= segundo - 60:
+                self._ventana.popleft()
+        return sesion
+    
+    def _vencer(self, ahora: float) -> None:
+        while self._heap and self._heap[0][0] <= ahora:
+            vence, _, clave = heapq.heappop(self._heap)
+            sesion = self._sesiones.get(clave)
+            if sesion is None or sesion.vence != vence:
+                continue  # Entrada vieja: la partida se quitó o se renovó
+            self._desalojar(clave)
+            if sesion.juego.estado in FINALIZADOS:
+                continue
+            sesion.juego.estado = EstadoJuego.CANCELADO
+            self.expiradas += 1
+            if sesion.al_expirar is not None:
+                try:
+                    resultado = sesion.al_expirar(clave, sesion.juego)
+                    if asyncio.iscoroutine(resultado):
+                        tarea = asyncio.create_task(resultado)
+                        self._avisos.add(tarea)
+                        tarea.add_done_callback(functools.partial(self._aviso_terminado, clave))
+                except Exception as e:
+                    print(f"[!] Error al expirar la partida {clave}: {e}")
+    
+    def _aviso_terminado(self, clave: ClaveJuego, tarea: asyncio.Task) -> None:
+        self._avisos.discard(tarea)
+        if not tarea.cancelled() and tarea.exception() is not None:
+            print(f"[!] Error al expirar la partida {clave}: {tarea.exception()}")
+    
+    async def _programador(self) -> None:
+        while True:
+            self._vencer(self._ahora())
+            espera = self._heap[0][0] - self._ahora() if self._heap else None
+            self._despertar.clear()
+            try:
+                await asyncio.wait_for(self._despertar.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+    
+    def estadisticas(self) -> Dict[str, float]:
+        """Partidas activas y desalojos, para vigilar la memoria bajo carga"""
+        limite = int(self._ahora()) - 60
+        recientes = sum(cantidad for segundo, cantidad in self._ventana if segundo > limite)
+        return {
+            'activas': len(self._sesiones),
+            'creadas': self.creadas,
+            'expiradas': self.expiradas,
+            'desalojadas': self.desalojadas,
+            'desalojos_por_segundo': recientes / 60,
+            'plazos_pendientes': len(self._heap),
+        }
+
+
+PALABRAS_PREDEFINIDAS = [
+    ("PYTHON", ["Lenguaje de programación", "Creado por Guido van Rossum"]),
+    ("JAVA", ["Lenguaje de programación", "Desarrollado por Sun Microsystems"]),
+    ("JAVASCRIPT", ["Lenguaje de programación", "Usado en navegadores web"]),
+    ("PROGRAMACION", ["Proceso de crear software", "Involucra escribir código"]),
+    ("ALGORITMO", ["Secuencia de pasos", "Usado para resolver problemas"]),
+]
+
+TEMAS = [
+    "ciudades del mundo", "animales", "frutas", "países", "deportes",
+    "películas famosas", "libros clásicos", "inventos importantes",
+    "elementos químicos", "instrumentos musicales"
+]
+
+
+# Viñetas o numeración que el modelo a veces agrega al principio de cada línea
+_PREFIJO_LINEA = re.compile(r'^\s*(?:[-*•]+|\d+[.)])\s*')
+
+
+def parsear_lote(contenido: str) -> List[Tuple[str, List[str]]]:
+    """Extrae los pares ``(PALABRA, [pista1, pista2])`` de una respuesta ``PALABRA|Pista 1|Pista 2``
+    
+    Acepta una o varias líneas, ignora las que no tienen el formato (texto
+    extra, encabezados, palabras con números o símbolos) y descarta las
+    palabras repetidas dentro del mismo lote.
+    """
+    pares = []
+    vistas = set()
+    for linea in contenido.splitlines():
+        linea = _PREFIJO_LINEA.sub('', linea.strip().strip('`'))
+        partes = [p.strip().strip('*"') for p in linea.split('|')]
+        if len(partes) < 3 or not all(partes[:3]):
+            continue
+        palabra = partes[0].upper()
+        clave = normalize(palabra)
+        if not palabra.replace(' ', '').isalpha() or clave in vistas:
+            continue
+        vistas.add(clave)
+        pares.append((palabra, partes[1:3]))
+    return pares
+
+
+async def _pedir_palabras(tema: str, cantidad: int = 10,
+                          evitar: Iterable[str] = ()) -> List[Tuple[str, List[str]]]:
+    """Pide ``cantidad`` palabras con sus pistas en una sola llamada a la API"""
     openrouter_key = os.getenv('OPENROUTER_API_KEY')
     if not openrouter_key:
-        # Si no hay API key, usamos una lista de palabras predefinidas
-        palabras_predefinidas = [
-            ("PYTHON", ["Lenguaje de programación", "Creado por Guido van Rossum"]),
-            ("JAVA", ["Lenguaje de programación", "Desarrollado por Sun Microsystems"]),
-            ("JAVASCRIPT", ["Lenguaje de programación", "Usado en navegadores web"]),
-            ("PROGRAMACION", ["Proceso de crear software", "Involucra escribir código"]),
-            ("ALGORITMO", ["Secuencia de pasos", "Usado para resolver problemas"]),
-        ]
-        return random.choice(palabras_predefinidas)
-    
-    temas = [
-        "ciudades del mundo", "animales", "frutas", "países", "deportes",
-        "películas famosas", "libros clásicos", "inventos importantes",
-        "elementos químicos", "instrumentos musicales"
-    ]
-    tema = random.choice(temas)
+        return []
     
+    evitar = list(evitar)[-100:]
+    excluidas = f"\n    No uses ninguna de estas palabras: {', '.join(evitar)}\n" if evitar else ""
     prompt = f"""
-    Necesito una palabra para un juego del ahorcado sobre {tema}.
-    La palabra debe tener entre 5 y 12 letras y ser común en español.
-    También necesito 2 pistas cortas (máximo 20 caracteres cada una) que ayuden a adivinarla.
-    
-    Por favor, responde SOLO con el siguiente formato, sin explicaciones adicionales:
+    Necesito {cantidad} palabras distintas para un juego del ahorcado sobre {tema}.
+    Cada palabra debe tener entre 5 y 12 letras y ser común en español.
+    Para cada una necesito 2 pistas cortas (máximo 20 caracteres cada una) que ayuden a adivinarla.
+    {excluidas}
+    Por favor, responde SOLO con una palabra por línea en el siguiente formato, sin explicaciones adicionales:
     PALABRA|Pista 1|Pista 2
     
     Ejemplo:
     ELEFANTE|Animal grande|Tiene trompa
+    JIRAFA|Cuello largo|Come hojas altas
     """
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {openrouter_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "deepseek/deepseek-chat",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                    "max_tokens": 100
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                resultado = response.json()
-                contenido = resultado['choices'][0]['message']['content'].strip()
-                if '|' in contenido:
-                    partes = [p.strip() for p in contenido.split('|')]
-                    if len(partes) >= 3:
-                        return partes[0].upper(), partes[1:3]
+        # Cliente compartido: reutiliza la conexión y reintenta los 429/5xx
+        response = await http_client.get_client().post(
+            "https://openrouter.ai/api/v1/chat/completions",
+            endpoint='openrouter.chat',
+            headers={
+                "Authorization": f"Bearer {openrouter_key}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "model": "deepseek/deepseek-chat",
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.7,
+                "max_tokens": 40 * cantidad + 50
+            },
+            timeout=30.0
+        )
+        
+        if response.status_code == 200:
+            resultado = response.json()
+            return parsear_lote(resultado['choices'][0]['message']['content'])
     except Exception as e:
-        print(f"Error al generar palabra con DeepSeek: {e}")
-    
-    # En caso de error, usar una palabra predefinida
-    palabras_predefinidas = [
-        ("PYTHON", ["Lenguaje de programación", "Creado por Guido van Rossum"]),
-        ("JAVA", ["Lenguaje de programación", "Desarrollado por Sun Microsystems"]),
-        ("JAVASCRIPT", ["Lenguaje de programación", "Usado en navegadores web"]),
-        ("PROGRAMACION", ["Proceso de crear software", "Involucra escribir código"]),
-        ("ALGORITMO", ["Secuencia de pasos", "Usado para resolver problemas"]),
-    ]
-    return random.choice(palabras_predefinidas)
+        print(f"Error al generar palabras con DeepSeek: {e}")
+    return []
+
+
+class _ArchivoDiferido:
+    """Guarda una instantánea en JSON agrupando los cambios seguidos en una escritura"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._guardado = None
+        self._pendiente = False
+    
+    def _instantanea(self) -> Any:
+        raise NotImplementedError
+    
+    def _leer(self) -> Any:
+        if os.path.exists(self.path):
+            try:
+                return read_file(self.path)
+            except (OSError, ValueError) as e:
+                print(f"[!] No se pudo leer {self.path}: {e}")
+        return {}
+    
+    def _programar_guardado(self) -> None:
+        # Los cambios que llegan mientras se escribe se agrupan en la próxima escritura
+        self._pendiente = True
+        if self._guardado is None or self._guardado.done():
+            self._guardado = asyncio.create_task(self._guardar())
+    
+    async def _guardar(self) -> None:
+        while self._pendiente:
+            self._pendiente = False
+            try:
+                await asyncio.to_thread(self._escribir, self._instantanea())
+            except OSError as e:
+                print(f"[!] No se pudo guardar {self.path}: {e}")
+    
+    def _escribir(self, datos: Any) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        atomic_write(self.path, JSON.encode(datos))
+    
+    async def close(self) -> None:
+        if self._guardado is not None:
+            await asyncio.gather(self._guardado, return_exceptions=True)
+
+
+class BancoPalabras(_ArchivoDiferido):
+    """Banco persistente de palabras generadas, por tema
+    
+    Cada palabra se guarda una sola vez por tema (comparando sin acentos ni
+    mayúsculas) junto con la cantidad de partidas en las que se usó; al
+    elegir se prefieren las menos usadas, así que no se repiten mientras
+    queden palabras nuevas.
+    """
+    
+    def __init__(self, path: str = 'data/banco_palabras.json'):
+        super().__init__(path)
+        # tema -> {palabra normalizada: {'palabra': ..., 'pistas': [...], 'usos': n}}
+        self._temas: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+    
+    def _cargar(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        if self._temas is None:
+            self._temas = self._leer()
+        return self._temas
+    
+    def _instantanea(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        return {tema: {clave: dict(entrada) for clave, entrada in palabras.items()}
+                for tema, palabras in self._temas.items()}
+    
+    def palabras(self, tema: str) -> List[str]:
+        return [entrada['palabra'] for entrada in self._cargar().get(tema, {}).values()]
+    
+    def sin_usar(self, tema: str, excluir: Iterable[str] = ()) -> int:
+        excluir = {normalize(palabra) for palabra in excluir}
+        return sum(1 for clave, entrada in self._cargar().get(tema, {}).items()
+                   if entrada['usos'] == 0 and clave not in excluir)
+    
+    def agregar(self, tema: str, pares: Iterable[Tuple[str, List[str]]]) -> int:
+        """Agrega las palabras que el tema todavía no tiene; devuelve cuántas eran nuevas"""
+        palabras = self._cargar().setdefault(tema, {})
+        nuevas = 0
+        for palabra, pistas in pares:
+            clave = normalize(palabra)
+            if clave not in palabras:
+                palabras[clave] = {'palabra': palabra, 'pistas': list(pistas), 'usos': 0}
+                nuevas += 1
+        if nuevas:
+            self._programar_guardado()
+        return nuevas
+    
+    def tomar(self, tema: str, excluir: Iterable[str] = ()) -> Optional[Tuple[str, List[str]]]:
+        """Elige al azar entre las palabras menos usadas y cuenta el uso"""
+        excluir = {normalize(palabra) for palabra in excluir}
+        candidatas = [entrada for clave, entrada in self._cargar().get(tema, {}).items()
+                      if clave not in excluir]
+        if not candidatas:
+            return None
+        menos_usos = min(entrada['usos'] for entrada in candidatas)
+        entrada = random.choice([e for e in candidatas if e['usos'] == menos_usos])
+        entrada['usos'] += 1
+        self._programar_guardado()
+        return entrada['palabra'], list(entrada['pistas'])
+
+
+class PrefetchPalabras(_ArchivoDiferido):
+    """Reserva por tema de palabras ya generadas para empezar partidas al instante
+    
+    Cada tema guarda hasta ``capacidad`` pares ``(palabra, pistas)``. Al
+    bajar de ``minimo`` se rellena en segundo plano (una tarea por tema como
+    máximo) desde el banco de palabras; solo cuando el banco se queda sin
+    palabras sin usar se pide a la API un lote de ``lote`` palabras nuevas.
+    La reserva se guarda en ``path`` para que un arranque en frío no tenga
+    que llamar a la API.
+    """
+    
+    def __init__(self, path: str = 'data/palabras_prefetch.json', capacidad: int = 8, minimo: int = 3,
+                 lote: int = None, banco: BancoPalabras = None, generador: Callable = None):
+        super().__init__(path)
+        self.capacidad = capacidad
+        self.minimo = minimo
+        self.lote = lote if lote is not None else int(os.getenv('PALABRAS_POR_LOTE', '10'))
+        self.banco = banco or BancoPalabras()
+        # generador(tema, cantidad, evitar) -> lista de pares
+        self.generador = generador or _pedir_palabras
+        self._colas: Optional[Dict[str, deque]] = None
+        self._rellenos: Dict[str, asyncio.Task] = {}
+    
+    def _cargar(self) -> Dict[str, deque]:
+        if self._colas is None:
+            self._colas = {
+                tema: deque(((palabra, list(pistas)) for palabra, pistas in pares), maxlen=self.capacidad)
+                for tema, pares in self._leer().items()
+            }
+        return self._colas
+    
+    def _instantanea(self) -> Dict[str, list]:
+        return {tema: list(cola) for tema, cola in self._colas.items() if cola}
+    
+    def disponibles(self, tema: str) -> int:
+        cola = self._cargar().get(tema)
+        return len(cola) if cola else 0
+    
+    def tomar(self, tema: str) -> Optional[Tuple[str, List[str]]]:
+        """Saca una palabra del tema sin esperar; pide reponer si quedan pocas"""
+        cola = self._cargar().get(tema)
+        par = cola.popleft() if cola else None
+        if par is not None:
+            self._programar_guardado()
+        if self.disponibles(tema) < self.minimo:
+            self.rellenar(tema)
+        return par
+    
+    def rellenar(self, tema: str) -> None:
+        tarea = self._rellenos.get(tema)
+        if tarea is None or tarea.done():
+            self._rellenos[tema] = asyncio.create_task(self._rellenar(tema))
+    
+    def start(self, temas: List[str] = None) -> None:
+        """Completa en segundo plano los temas que estén por debajo del mínimo"""
+        for tema in temas or TEMAS:
+            if self.disponibles(tema) < self.minimo:
+                self.rellenar(tema)
+    
+    async def _rellenar(self, tema: str) -> None:
+        cola = self._cargar().setdefault(tema, deque(maxlen=self.capacidad))
+        pedido = False
+        agregadas = 0
+        while len(cola) < self.capacidad:
+            en_cola = [palabra for palabra, _ in cola]
+            if not pedido and self.banco.sin_usar(tema, excluir=en_cola) == 0:
+                # Un solo pedido por relleno; si falla se reusan las palabras menos usadas
+                pedido = True
+                self.banco.agregar(tema, await self.generador(tema, self.lote, self.banco.palabras(tema)))
+            par = self.banco.tomar(tema, excluir=en_cola)
+            if par is None:
+                # Banco vacío y sin API: se reintenta en el próximo pedido
+                break
+            cola.append(par)
+            agregadas += 1
+        if agregadas:
+            self._programar_guardado()
+    
+    async def close(self) -> None:
+        """Cancela los rellenos en curso y guarda la reserva y el banco"""
+        for tarea in self._rellenos.values():
+            tarea.cancel()
+        await asyncio.gather(*self._rellenos.values(), return_exceptions=True)
+        self._rellenos.clear()
+        await super().close()
+        await self.banco.close()
+
+
+# Reserva compartida de palabras del ahorcado
+prefetch_palabras = PrefetchPalabras()
+
+
+async def generar_palabra_ahorcado(tema: Optional[str] = None) -> Tuple[str, List[str]]:
+    """Devuelve una palabra y pistas sin esperar a la API
+    
+    Sale de la reserva del tema (o de cualquier otro si no se eligió tema y
+    ese está vacío); solo si no hay nada generado se usa la lista predefinida.
+    """
+    if not os.getenv('OPENROUTER_API_KEY'):
+        # Si no hay API key, usamos una lista de palabras predefinidas
+        return random.choice(PALABRAS_PREDEFINIDAS)
+    
+    elegido = tema or random.choice(TEMAS)
+    par = prefetch_palabras.tomar(elegido)
+    if par is None and tema is None:
+        for otro in TEMAS:
+            if prefetch_palabras.disponibles(otro):
+                par = prefetch_palabras.tomar(otro)
+                break
+    if par is not None:
+        return par
+    
+    # Reserva vacía (se está rellenando): usar una palabra predefinida
+    return random.choice(PALABRAS_PREDEFINIDAS)
@@ -0,0 +1,101 @@
+import re
+import threading
+import unicodedata
+from typing import Iterable, List, Optional, Tuple
+
+
+def normalize(text: str) -> str:
+    """Pasa a minúsculas y quita los acentos ("Código" -> "codigo")"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Arma una expresión regular con forma de trie a partir de las palabras
+
+    Los prefijos comunes se comparten ("func(?:ion|tion)"), así que el motor de
+    expresiones regulares descarta ramas enteras con un solo carácter en lugar
+    de probar cada palabra por separado.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        end = '' in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        if len(branches) == 1 and not end:
+            return branches[0]
+        group = '(?:' + '|'.join(branches) + ')'
+        return group + '?' if end else group
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Busca palabras clave en un texto con una sola expresión compilada
+
+    Las palabras se normalizan (minúsculas, sin acentos, espacios colapsados)
+    y se eliminan las repetidas. Solo coinciden palabras completas: "app" no
+    coincide dentro de "apple", pero sí "c++" o "c#" seguidas de un espacio.
+    El costo por mensaje depende del largo del mensaje y no de la cantidad
+    de palabras clave.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        unique = {}
+        for keyword in keywords:
+            key = ' '.join(normalize(keyword).split())
+            if key:
+                unique.setdefault(key, keyword)
+        self.keywords: Tuple[str, ...] = tuple(unique)
+        pattern = _trie_pattern(self.keywords)
+        self._regex = re.compile(rf'(?<!\w)(?:{pattern})(?!\w)') if pattern else None
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def search(self, text: str) -> Optional[str]:
+        """Devuelve la primera palabra clave (normalizada) encontrada, o None"""
+        if self._regex is None:
+            return None
+        match = self._regex.search(' '.join(normalize(text).split()))
+        return match.group(0) if match else None
+
+    def find_all(self, text: str) -> List[str]:
+        if self._regex is None:
+            return []
+        return self._regex.findall(' '.join(normalize(text).split()))
+
+
+_cache_lock = threading.Lock()
+_cache = {}
+
+
+def get_matcher(keywords: List[str], name: str = 'default') -> KeywordMatcher:
+    """Matcher compilado para la lista, reconstruido solo cuando la lista cambia
+
+    La comparación por identidad cubre el caso habitual (la misma lista de la
+    configuración en cada mensaje); si llega otra lista con el mismo contenido
+    se reutiliza el matcher sin recompilar.
+    """
+    with _cache_lock:
+        cached = _cache.get(name)
+        if cached is not None:
+            source, key, matcher = cached
+            if source is keywords:
+                return matcher
+            key_now = tuple(keywords)
+            if key_now == key:
+                _cache[name] = (keywords, key, matcher)
+                return matcher
+        else:
+            key_now = tuple(keywords)
+        matcher = KeywordMatcher(key_now)
+        _cache[name] = (keywords, key_now, matcher)
+        return matcher
@@ -46,7 +46,12 @@ def format_dt_argentina(dt):
 
 # Importar módulos locales
 try:
-    from datastore import ProvisionalDataStore as DataStore
+    import http_client
+    import mongo_pool
+    from config_manager import config_manager
+    from config import MongoDataStore
+    from datastore import AsyncDataStore, ProvisionalDataStore as DataStore, RouterDataStore
+    from juegos import GameSessionManager, prefetch_palabras
     from commands.ahorcado import AhorcadoCog
     from commands.ping import PingCog
     from commands.rbxlookup import RobloxLookupCog
@@ -73,11 +78,29 @@ class MiBot(commands.Bot):
         )
         
         self.start_time = datetime.now(timezone.utc)
-        self.datastore = DataStore()
+        # Con MongoDB configurado, el router cambia entre Mongo y el almacenamiento
+        # provisional según su disponibilidad, sin reiniciar el bot
+        backend = DataStore()
+        mongo_uri = os.getenv('MONGODB_URI')
+        if mongo_uri:
+            backend = RouterDataStore(MongoDataStore(mongo_uri, os.getenv('DB_NAME', 'discord_bot')), backend)
+        self.datastore = AsyncDataStore(backend)
+        # Partidas activas de todos los servidores, con un único temporizador
+        self.juegos = GameSessionManager()
+        # Cliente HTTP compartido (keep-alive, límites por host y reintentos) para las APIs externas;
+        # no se llama `http` porque discord.py usa ese atributo para su propio cliente
+        self.http_client = http_client.get_client()
         self.logger = logging.getLogger('bot')
     
     async def setup_hook(self):
         """Configura los cogs y comandos al iniciar el bot."""
+        # Conecta la configuración en segundo plano; mientras tanto rigen los valores por defecto
+        await config_manager.start()
+        self.juegos.start()
+        if os.getenv('OPENROUTER_API_KEY'):
+            # Palabras del ahorcado generadas de antemano para no esperar a la API
+            prefetch_palabras.start()
+        
         try:
             self.logger.info("Iniciando carga de cogs...")
             
@@ -113,12 +136,25 @@ class MiBot(commands.Bot):
             self.logger.error(f"Error en setup_hook: {e}")
             self.logger.error(traceback.format_exc())
     
+    async def close(self):
+        """Cierra el almacenamiento antes de desconectar el bot."""
+        await self.juegos.close()
+        await prefetch_palabras.close()
+        await http_client.close()
+        await self.datastore.close()
+        await config_manager.close()
+        mongo_pool.close_all()
+        await super().close()
+    
     async def on_ready(self):
         """Evento que se dispara cuando el bot está listo."""
         self.logger.info(f'Conectado como {self.user.name} (ID: {self.user.id})')
         self.logger.info(f'Conectado a {len(self.guilds)} servidores')
         self.logger.info('¡Bot listo y funcionando!')
         
+        # Configuración de todos los servidores en una sola consulta
+        await config_manager.preload_guilds(guild.id for guild in self.guilds)
+        
         # Establecer estado personalizado
         await self.change_presence(
             activity=discord.Game(name="¡Usa /ayuda"),
@@ -0,0 +1,42 @@
+import threading
+from collections import deque
+from typing import Dict
+
+
+class LatencyStats:
+    """Acumula latencias por operación: cantidad, errores, promedio, p95 y máximo"""
+    
+    def __init__(self, samples: int = 256):
+        self._samples = samples
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def record(self, name: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {
+                    'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+                    'recent': deque(maxlen=self._samples)
+                }
+            stats['count'] += 1
+            stats['errors'] += int(error)
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            stats['recent'].append(seconds)
+    
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Devuelve las métricas en milisegundos"""
+        with self._lock:
+            resultado = {}
+            for name, stats in self._stats.items():
+                recientes = sorted(stats['recent'])
+                p95 = recientes[min(len(recientes) - 1, int(len(recientes) * 0.95))]
+                resultado[name] = {
+                    'count': stats['count'],
+                    'errors': stats['errors'],
+                    'avg_ms': stats['total'] / stats['count'] * 1000,
+                    'p95_ms': p95 * 1000,
+                    'max_ms': stats['max'] * 1000,
+                }
+            return resultado
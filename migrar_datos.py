@@ -0,0 +1,61 @@
+"""Convierte los datos locales al codec indicado
+
+Uso:
+    python migrar_datos.py msgpack
+    python migrar_datos.py json --data-dir data --provisional provisional_data.json
+
+Reescribe ``provisional_data.json`` (consolidando antes su journal) y cada
+``data/**/*.json``, incluidas las particiones. Los nombres de archivo no
+cambian: al leer se detecta el formato por el contenido.
+"""
+import argparse
+import os
+from pathlib import Path
+
+from datastore import ProvisionalDataStore
+from storage_io import CODECS, atomic_write, get_codec, read_file
+
+
+def migrar_provisional(path: str, codec: str) -> bool:
+    journal = os.path.splitext(path)[0] + '.journal'
+    if not any(os.path.exists(p) for p in (path, journal, journal + '.old')):
+        return False
+    # Cargar reproduce el journal; compactar escribe la instantánea con el nuevo codec.
+    # Sin retención: la migración no debe descartar los logs viejos
+    store = ProvisionalDataStore(path, codec=codec, retention={})
+    store.compact()
+    store.close()
+    return True
+
+
+def migrar_directorio(data_dir: str, codec: str) -> int:
+    encoder = get_codec(codec)
+    convertidos = 0
+    for path in sorted(Path(data_dir).rglob('*.json')):
+        try:
+            data = read_file(str(path))
+        except ValueError as e:
+            print(f"[!] {path} ilegible, se omite: {e}")
+            continue
+        atomic_write(str(path), encoder.encode(data))
+        convertidos += 1
+    return convertidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte los datos locales a otro codec")
+    parser.add_argument('codec', choices=sorted(CODECS))
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--provisional', default='provisional_data.json')
+    args = parser.parse_args()
+    # get_codec cae a JSON si falta msgpack: se informa el que se usa de verdad
+    args.codec = get_codec(args.codec).name
+
+    if migrar_provisional(args.provisional, args.codec):
+        print(f"[+] {args.provisional} convertido a {args.codec}")
+    convertidos = migrar_directorio(args.data_dir, args.codec)
+    print(f"[+] {convertidos} colecciones de {args.data_dir} convertidas a {args.codec}")
+
+
+if __name__ == '__main__':
+    main()
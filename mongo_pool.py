@@ -0,0 +1,54 @@
+import os
+import threading
+from typing import Dict, Optional
+
+from pymongo import MongoClient
+from pymongo.database import Database
+
+# Opciones compartidas por todos los consumidores (config, datastore, config_manager)
+POOL_OPTIONS = {
+    'maxPoolSize': int(os.getenv('MONGODB_MAX_POOL_SIZE', '50')),
+    'serverSelectionTimeoutMS': int(os.getenv('MONGODB_SELECTION_TIMEOUT_MS', '5000')),
+    'connectTimeoutMS': 10000,
+    'socketTimeoutMS': 30000,
+    'retryWrites': True,
+}
+
+_clients: Dict[str, MongoClient] = {}
+_lock = threading.Lock()
+
+
+def get_client(uri: Optional[str] = None) -> MongoClient:
+    """Devuelve el cliente compartido para ``uri`` (por defecto ``MONGODB_URI``)
+
+    El cliente se crea con ``connect=False``: no abre conexiones ni resuelve el
+    registro SRV hasta la primera operación, así que importar los módulos que lo
+    usan no bloquea el arranque aunque MongoDB no esté disponible.
+    """
+    uri = uri or os.getenv('MONGODB_URI')
+    if not uri:
+        raise ValueError("No se encontró la variable de entorno MONGODB_URI")
+    with _lock:
+        client = _clients.get(uri)
+        if client is None:
+            client = _clients[uri] = MongoClient(uri, connect=False, **POOL_OPTIONS)
+        return client
+
+
+def get_database(name: str, uri: Optional[str] = None, **options) -> Database:
+    """Atajo para obtener una base de datos del cliente compartido"""
+    return get_client(uri).get_database(name, **options)
+
+
+def ping(uri: Optional[str] = None) -> None:
+    """Fuerza la conexión; lanza la excepción de PyMongo si el servidor no responde"""
+    get_client(uri).admin.command('ping')
+
+
+def close_all() -> None:
+    """Cierra todos los clientes abiertos (al apagar el bot)"""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
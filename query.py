@@ -0,0 +1,320 @@
+import heapq
+import json
+import operator
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import InvalidOperation
+
+SortSpec = List[Tuple[str, int]]
+QueryShape = Tuple[Tuple[str, str], ...]
+
+MISSING = object()
+
+
+def get_path(doc: Dict[str, Any], path: str) -> Any:
+    """Resuelve un campo con notación de puntos; devuelve MISSING si no existe"""
+    if '.' not in path:
+        return doc.get(path, MISSING)
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return MISSING
+        if value is MISSING:
+            break
+    return value
+
+
+def get_value(doc: Dict[str, Any], path: str) -> Any:
+    """Como ``get_path`` pero con None para los campos ausentes (igual que ``dict.get``)"""
+    value = get_path(doc, path)
+    return None if value is MISSING else value
+
+
+def _compare(op):
+    def test(value, expected):
+        if value is MISSING or value is None:
+            return False
+        try:
+            return op(value, expected)
+        except TypeError:
+            return False
+    return test
+
+
+def _in(value, expected):
+    try:
+        return (None if value is MISSING else value) in expected
+    except TypeError:
+        # Un valor no hashable nunca es igual a los elementos de un frozenset
+        return False
+
+
+# Cada operador recibe el valor del documento (o MISSING) y el de la consulta ya preparado
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    '$eq': lambda value, expected: (None if value is MISSING else value) == expected,
+    '$ne': lambda value, expected: (None if value is MISSING else value) != expected,
+    '$gt': _compare(operator.gt),
+    '$gte': _compare(operator.ge),
+    '$lt': _compare(operator.lt),
+    '$lte': _compare(operator.le),
+    '$in': _in,
+    '$nin': lambda value, expected: not _in(value, expected),
+    '$exists': lambda value, expected: (value is not MISSING) == expected,
+}
+
+
+def is_operator_expression(condition: Any) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(k.startswith('$') for k in condition)
+
+
+def query_shape(query: Dict[str, Any]) -> Tuple[QueryShape, List[Any]]:
+    """Separa la forma de la consulta (campos y operadores) de sus valores"""
+    shape = []
+    values = []
+    for path, condition in query.items():
+        if is_operator_expression(condition):
+            for op, value in condition.items():
+                if op not in OPERATORS:
+                    raise ValueError(f"Operador de consulta no soportado: {op}")
+                shape.append((path, op))
+                values.append(value)
+        else:
+            shape.append((path, '$eq'))
+            values.append(condition)
+    return tuple(shape), values
+
+
+def _prepare(op: str, value: Any) -> Any:
+    if op in ('$in', '$nin'):
+        # Con valores hashables la pertenencia es O(1)
+        try:
+            return frozenset(value)
+        except TypeError:
+            return list(value)
+    if op == '$exists':
+        return bool(value)
+    return value
+
+
+@lru_cache(maxsize=512)
+def _compile_shape(shape: QueryShape) -> Callable[[Dict[str, Any], Tuple[Any, ...]], bool]:
+    tests = tuple((path, OPERATORS[op]) for path, op in shape)
+    if len(tests) == 1:
+        (path, test), = tests
+        return lambda doc, values: test(get_path(doc, path), values[0])
+    
+    def predicate(doc, values):
+        for (path, test), value in zip(tests, values):
+            if not test(get_path(doc, path), value):
+                return False
+        return True
+    return predicate
+
+
+def compile_query(query: Optional[Dict[str, Any]]) -> Callable[[Dict[str, Any]], bool]:
+    """Convierte una consulta en un predicado ``doc -> bool``
+    
+    Soporta igualdad, ``$eq``, ``$ne``, ``$gt``, ``$gte``, ``$lt``, ``$lte``,
+    ``$in``, ``$nin``, ``$exists`` y campos con notación de puntos. La forma de
+    la consulta se compila una sola vez y queda en caché, así que las consultas
+    repetidas con otros valores solo preparan los valores.
+    """
+    if not query:
+        return lambda doc: True
+    shape, values = query_shape(query)
+    predicate = _compile_shape(shape)
+    values = tuple(_prepare(op, value) for (_, op), value in zip(shape, values))
+    return lambda doc: predicate(doc, values)
+
+
+def equality_value(query: Dict[str, Any], path: str) -> Tuple[bool, Any]:
+    """Devuelve ``(True, valor)`` si la consulta exige igualdad exacta sobre el campo"""
+    if path not in query:
+        return False, None
+    condition = query[path]
+    if not is_operator_expression(condition):
+        return True, condition
+    if set(condition) == {'$eq'}:
+        return True, condition['$eq']
+    return False, None
+
+
+UPDATE_OPERATORS = ('$set', '$unset', '$inc')
+
+
+def set_path(doc: Dict[str, Any], path: str, value: Any) -> None:
+    """Asigna un campo con notación de puntos, creando los subdocumentos que falten"""
+    *parents, last = path.split('.')
+    for part in parents:
+        child = doc.get(part)
+        if not isinstance(child, dict):
+            child = doc[part] = {}
+        doc = child
+    doc[last] = value
+
+
+def unset_path(doc: Dict[str, Any], path: str) -> bool:
+    *parents, last = path.split('.')
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return False
+    return doc.pop(last, MISSING) is not MISSING
+
+
+def update_roots(update: Dict[str, Any]) -> set:
+    """Campos de primer nivel que toca una actualización"""
+    return {path.split('.', 1)[0] for fields in update.values() for path in fields}
+
+
+def apply_update(doc: Dict[str, Any], update: Dict[str, Any]) -> bool:
+    """Aplica ``$set``, ``$unset`` e ``$inc`` sobre el documento; devuelve si cambió"""
+    unsupported = set(update).difference(UPDATE_OPERATORS)
+    if unsupported or not update:
+        raise ValueError(f"Operador de actualización no soportado: {', '.join(sorted(unsupported)) or '{}'}")
+    if '_id' in update_roots(update):
+        raise ValueError("No se puede modificar el campo _id")
+    for path, amount in update.get('$inc', {}).items():
+        current = get_path(doc, path)
+        numbers = (int, float)
+        if not isinstance(amount, numbers) or not (current is MISSING or isinstance(current, numbers)):
+            raise ValueError(f"$inc solo se aplica a valores numéricos: {path}")
+    
+    modified = False
+    for path, value in update.get('$set', {}).items():
+        if get_path(doc, path) != value:
+            set_path(doc, path, value)
+            modified = True
+    for path in update.get('$unset', {}):
+        modified = unset_path(doc, path) or modified
+    for path, amount in update.get('$inc', {}).items():
+        current = get_path(doc, path)
+        set_path(doc, path, (0 if current is MISSING else current) + amount)
+        modified = modified or current is MISSING or amount != 0
+    return modified
+
+
+def upsert_document(filter: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Documento nuevo de un upsert: las igualdades del filtro más la actualización"""
+    doc = {}
+    for path in filter:
+        found, value = equality_value(filter, path)
+        if found:
+            set_path(doc, path, value)
+    apply_update(doc, update)
+    return doc
+
+
+def normalize_sort(key_or_list, direction: int = None) -> SortSpec:
+    """Acepta ``'campo'``, ``('campo', dir)`` o ``[('campo', dir), ...]`` como en PyMongo"""
+    if not key_or_list:
+        return []
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or ASCENDING)]
+    return [(field, dir_) for field, dir_ in key_or_list]
+
+
+def sort_value(value: Any) -> tuple:
+    """Clave de orden que tolera tipos mezclados, aproximando el orden de MongoDB"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (5, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, json.dumps(value, sort_keys=True, default=str))
+
+
+def project(doc: Dict[str, Any], projection) -> Dict[str, Any]:
+    """Aplica una proyección de inclusión o exclusión al estilo de MongoDB"""
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    
+    include = [field for field, value in projection.items() if value and field != '_id']
+    if include:
+        result = {field: doc[field] for field in include if field in doc}
+        if projection.get('_id', 1) and '_id' in doc:
+            result['_id'] = doc['_id']
+        return result
+    return {field: value for field, value in doc.items() if projection.get(field, 1)}
+
+
+def apply_modifiers(docs: Iterable[Dict[str, Any]], sort: SortSpec, skip: int, limit: int) -> Iterator[Dict[str, Any]]:
+    """Aplica sort/skip/limit sobre un iterable sin materializarlo si no hace falta
+    
+    Sin ``sort`` todo es perezoso. Con ``sort`` y ``limit`` en una sola dirección
+    se usa un heap de ``skip + limit`` elementos en lugar de ordenar todo.
+    """
+    if sort:
+        if limit and len({direction for _, direction in sort}) == 1:
+            pick = heapq.nlargest if sort[0][1] == DESCENDING else heapq.nsmallest
+            docs = pick(skip + limit, docs,
+                        key=lambda doc: tuple(sort_value(get_value(doc, field)) for field, _ in sort))
+        else:
+            docs = list(docs)
+            # Ordenamientos estables sucesivos, del último criterio al primero
+            for field, direction in reversed(sort):
+                docs.sort(key=lambda doc: sort_value(get_value(doc, field)), reverse=direction == DESCENDING)
+    return islice(docs, skip, skip + limit if limit else None)
+
+
+class Cursor:
+    """Cursor perezoso con la parte de la API de PyMongo que usa el bot
+    
+    ``fetch(sort, skip, limit)`` produce los documentos ya filtrados; cada backend
+    decide cuánto de eso resuelve él mismo (SQLite lo hace en la consulta, los
+    almacenes en memoria con ``apply_modifiers``). Nada se lee hasta iterar.
+    """
+    
+    def __init__(self, fetch: Callable[[SortSpec, int, int], Iterable[Dict[str, Any]]],
+                 projection=None, sort=None, skip: int = 0, limit: int = 0):
+        self._fetch = fetch
+        self._projection = projection
+        self._sort = normalize_sort(sort)
+        self._skip = skip
+        self._limit = limit
+        self._iterator = None
+    
+    def _check_not_started(self):
+        if self._iterator is not None:
+            raise InvalidOperation("No se puede modificar un cursor que ya empezó a iterarse")
+    
+    def sort(self, key_or_list, direction: int = None) -> 'Cursor':
+        self._check_not_started()
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+    
+    def skip(self, skip: int) -> 'Cursor':
+        self._check_not_started()
+        self._skip = skip
+        return self
+    
+    def limit(self, limit: int) -> 'Cursor':
+        self._check_not_started()
+        self._limit = limit
+        return self
+    
+    def __iter__(self) -> 'Cursor':
+        return self
+    
+    def __next__(self) -> Dict[str, Any]:
+        if self._iterator is None:
+            docs = self._fetch(self._sort, self._skip, self._limit)
+            if self._projection:
+                docs = (project(doc, self._projection) for doc in docs)
+            self._iterator = iter(docs)
+        return next(self._iterator)
+    
+    def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        return list(islice(self, length)) if length else list(self)
@@ -0,0 +1,113 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+
+
+class RetentionPolicy:
+    """Límites de crecimiento de una colección
+    
+    ``max_docs`` la convierte en un buffer circular (se descartan los documentos
+    más viejos) y ``ttl_seconds`` descarta los que tengan ``ttl_field`` más
+    antiguo que ese plazo. Los almacenes locales los aplican al insertar; en
+    MongoDB se traducen a una colección capped o a un índice TTL.
+    """
+    
+    def __init__(self, max_docs: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 ttl_field: str = 'created_at'):
+        self.max_docs = max_docs
+        self.ttl_seconds = ttl_seconds
+        self.ttl_field = ttl_field
+    
+    def __repr__(self):
+        return (f"RetentionPolicy(max_docs={self.max_docs}, ttl_seconds={self.ttl_seconds}, "
+                f"ttl_field={self.ttl_field!r})")
+    
+    def cutoff(self) -> Optional[datetime]:
+        if not self.ttl_seconds:
+            return None
+        return datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+    
+    def is_expired(self, doc: dict, cutoff: datetime) -> bool:
+        value = doc.get(self.ttl_field)
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                return False
+        if not isinstance(value, datetime):
+            return False
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value < cutoff
+    
+    def prune_count(self, oldest_first: Iterable[dict], total: int) -> int:
+        """Cuántos documentos del principio (los más viejos) hay que descartar"""
+        excess = total - self.max_docs if self.max_docs else 0
+        cutoff = self.cutoff()
+        count = 0
+        for doc in oldest_first:
+            if count < excess or (cutoff is not None and self.is_expired(doc, cutoff)):
+                count += 1
+            else:
+                break
+        return count
+
+
+def _env_number(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return float(value) if value else None
+
+
+DEFAULT_RETENTION: Dict[str, RetentionPolicy] = {
+    'logs': RetentionPolicy(
+        max_docs=int(_env_number('LOGS_MAX_DOCS', 50000) or 0) or None,
+        ttl_seconds=(_env_number('LOGS_TTL_DAYS', 30) or 0) * 86400 or None,
+    ),
+}
+
+
+def apply_mongo_retention(db: Database, policies: Dict[str, RetentionPolicy]) -> None:
+    """Traduce las políticas a colecciones capped o índices TTL de MongoDB
+    
+    MongoDB no admite índices TTL en colecciones capped, así que si la política
+    tiene ambos límites gana ``max_docs`` al crear la colección. Una colección
+    existente que no sea capped no se convierte automáticamente: en ese caso se
+    le crea el índice TTL para que al menos los documentos venzan. Si el índice
+    TTL ya existe con otro plazo se ajusta con ``collMod``.
+    """
+    existing = set(db.list_collection_names())
+    for name, policy in policies.items():
+        if policy.max_docs:
+            if name not in existing:
+                # MongoDB exige un tamaño en bytes; se estima 1 KiB por documento
+                db.create_collection(name, capped=True, max=policy.max_docs,
+                                     size=policy.max_docs * 1024)
+                continue
+            if db[name].options().get('capped'):
+                continue
+            print(f"[!] La colección {name} no es capped; el límite de {policy.max_docs} "
+                  f"documentos no se aplica en MongoDB (usar convertToCapped)")
+        if policy.ttl_seconds:
+            _ensure_ttl_index(db[name], policy.ttl_field, int(policy.ttl_seconds))
+
+
+def _ensure_ttl_index(collection: Collection, field: str, seconds: int) -> None:
+    """Crea el índice TTL o cambia su plazo; create_index falla si ya existe con otro"""
+    try:
+        for info in collection.index_information().values():
+            if info.get('key') == [(field, 1)]:
+                if info.get('expireAfterSeconds') != seconds:
+                    collection.database.command('collMod', collection.name, index={
+                        'keyPattern': {field: 1}, 'expireAfterSeconds': seconds,
+                    })
+                return
+        collection.create_index(field, expireAfterSeconds=seconds)
+    except OperationFailure as e:
+        # Un índice que no se puede ajustar no debe impedir que arranque el almacenamiento
+        print(f"[!] No se pudo ajustar el índice TTL de {collection.name}: {e}")
@@ -0,0 +1,170 @@
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+# Dependencias opcionales: orjson acelera JSON y msgpack habilita el formato binario
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Escribe en un archivo temporal, hace fsync y lo renombra sobre el destino"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class JsonCodec:
+    """JSON compacto (sin indentación); usa orjson si está instalado"""
+    
+    name = 'json'
+    
+    def encode(self, obj: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    
+    def decode(self, data: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    """Formato binario msgpack, más chico y rápido de leer que JSON"""
+    
+    name = 'msgpack'
+    
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError("El codec msgpack requiere el paquete msgpack")
+    
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=str, use_bin_type=True)
+    
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+CODECS = {'json': JsonCodec, 'msgpack': MsgpackCodec}
+JSON = JsonCodec()
+
+
+def get_codec(name: Optional[str] = None):
+    """Codec configurado (``STORAGE_CODEC``, por defecto ``json``)"""
+    name = (name or os.getenv('STORAGE_CODEC') or 'json').lower()
+    if name not in CODECS:
+        raise ValueError(f"Codec de almacenamiento desconocido: {name}")
+    if name == 'msgpack' and msgpack is None:
+        print("[!] msgpack no está instalado; se usa JSON")
+        return JSON
+    return CODECS[name]()
+
+
+def decode_any(data: bytes) -> Any:
+    """Decodifica detectando el formato por el contenido
+    
+    Los archivos conservan su nombre aunque cambie el codec: un documento JSON
+    siempre empieza con ``{`` o ``[`` y cualquier otra cosa se lee como msgpack.
+    Los errores de formato se lanzan como ``ValueError``.
+    """
+    inicio = data.lstrip()[:1]
+    if data.startswith(b'\xef\xbb\xbf') or inicio in (b'{', b'['):
+        return JSON.decode(data.decode('utf-8-sig'))
+    if not inicio:
+        raise ValueError("archivo vacío")
+    return MsgpackCodec().decode(data)
+
+
+def read_file(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return decode_any(f.read())
+
+
+def quarantine(path: str) -> str:
+    """Aparta un archivo ilegible para no sobrescribirlo con datos vacíos"""
+    destino = f"{path}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    os.replace(path, destino)
+    return destino
+
+
+class GroupCommitWriter:
+    """Agrupa las escrituras de archivos completos dentro de una ventana de tiempo
+    
+    ``schedule(key, write)`` marca una clave como sucia; un hilo en segundo plano
+    espera ``window`` segundos desde la primera marca y ejecuta una sola vez la
+    última función registrada para cada clave. Con ``window=0`` se escribe en el
+    momento. ``flush()`` escribe todo lo pendiente y se llama también al salir.
+    """
+    
+    def __init__(self, window: float = 0.2, name: str = 'group-commit'):
+        self.window = window
+        self.name = name
+        self._pending: Dict[str, Callable[[], None]] = {}
+        self._writing = set()
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.flush)
+    
+    def schedule(self, key: str, write: Callable[[], None]) -> None:
+        if self.window <= 0:
+            with self._io_lock:
+                write()
+            return
+        
+        with self._cond:
+            self._pending[key] = write
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+    
+    def pending(self) -> set:
+        """Claves con escrituras pendientes o en curso"""
+        with self._cond:
+            return set(self._pending) | self._writing
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.window)
+            self.flush()
+    
+    def flush(self) -> None:
+        """Escribe todo lo pendiente y espera a que termine"""
+        with self._io_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+                self._writing = set(pending)
+            for key, write in pending.items():
+                try:
+                    write()
+                except Exception as e:
+                    print(f"Error al escribir {key}: {e}")
+                finally:
+                    with self._cond:
+                        self._writing.discard(key)
@@ -0,0 +1,217 @@
+"""Pruebas de ConfigManager con una base de MongoDB falsa en memoria"""
+import asyncio
+import copy
+
+import pytest
+
+from config_manager import ConfigManager
+from query import compile_query, set_path
+
+
+class Coleccion:
+    """Lo que ConfigManager usa de una colección de PyMongo; cuenta las lecturas"""
+
+    def __init__(self):
+        self.docs = {}
+        self.lecturas = 0
+        self.error = None
+
+    def _leer(self, filter):
+        self.lecturas += 1
+        if self.error is not None:
+            raise self.error
+        matches = compile_query(filter)
+        return [copy.deepcopy(doc) for doc in self.docs.values() if matches(doc)]
+
+    def find_one(self, filter, projection=None):
+        docs = self._leer(filter)
+        return docs[0] if docs else None
+
+    def find(self, filter, projection=None):
+        return self._leer(filter)
+
+    def update_one(self, filter, update, upsert=False):
+        doc = self.docs.setdefault(filter['_id'], {'_id': filter['_id']})
+        for path, value in update['$set'].items():
+            set_path(doc, path, value)
+
+
+class DB:
+    def __init__(self, settings=None):
+        self.config = Coleccion()
+        self.server_settings = Coleccion()
+        if settings is not None:
+            self.config.docs['bot_config'] = {'_id': 'bot_config', 'settings': settings}
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.delenv('MONGODB_URI', raising=False)
+    monkeypatch.delenv('CONFIG_NOTIFIER', raising=False)
+    monkeypatch.delenv('CONFIG_CHANGE_STREAM', raising=False)
+    # Una instancia nueva por prueba, sin pasar por el singleton
+    manager = object.__new__(ConfigManager)
+    manager._initialize()
+    return manager
+
+
+def _conectar(manager, db):
+    manager.db = db
+    manager._db_checked = True
+    return db
+
+
+def test_arranca_con_los_valores_por_defecto(manager):
+    assert asyncio.run(manager.get_config('bloquear_programacion')) is True
+    assert asyncio.run(manager.get_config('inexistente', 'x')) == 'x'
+
+
+def test_las_lecturas_salen_de_la_copia_mientras_dura_el_ttl(manager):
+    db = _conectar(manager, DB({'bloquear_programacion': False}))
+
+    async def main():
+        await manager._refresh()
+        return [await manager.get_config('bloquear_programacion') for _ in range(100)]
+
+    assert asyncio.run(main()) == [False] * 100
+    assert db.config.lecturas == 1
+
+
+def test_al_vencer_el_ttl_se_sirve_la_copia_y_se_recarga_de_fondo(manager):
+    db = _conectar(manager, DB({'prefijo': '!'}))
+    manager.ttl = 0.05
+
+    async def main():
+        await manager._refresh()
+        db.config.docs['bot_config']['settings']['prefijo'] = '?'
+        await asyncio.sleep(0.06)
+        vencida = await manager.get_config('prefijo')
+        await manager._refresh_task
+        return vencida, await manager.get_config('prefijo')
+
+    assert asyncio.run(main()) == ('!', '?')
+    assert db.config.lecturas == 2
+
+
+def test_las_recargas_simultaneas_se_agrupan(manager):
+    db = _conectar(manager, DB({'prefijo': '!'}))
+
+    async def main():
+        await asyncio.gather(*(manager._refresh() for _ in range(5)))
+
+    asyncio.run(main())
+    assert db.config.lecturas == 1
+
+
+def test_set_config_actualiza_la_copia_y_la_base(manager):
+    db = _conectar(manager, DB({'prefijo': '!'}))
+
+    async def main():
+        await manager._refresh()
+        assert await manager.set_config('prefijo', '?')
+        return await manager.get_config('prefijo')
+
+    assert asyncio.run(main()) == '?'
+    assert db.config.lecturas == 1
+    assert db.config.docs['bot_config']['settings']['prefijo'] == '?'
+
+
+def test_un_cambio_remoto_se_aplica_sin_leer_la_base(manager):
+    db = _conectar(manager, DB({'prefijo': '!'}))
+
+    async def main():
+        await manager._refresh()
+        manager._apply_delta({'scope': 'global', 'key': 'prefijo', 'value': '$'})
+        antes = await manager.get_config('prefijo')
+        manager._apply_delta({'scope': 'global', 'settings': {'prefijo': '%'}})
+        return antes, await manager.get_config('prefijo')
+
+    assert asyncio.run(main()) == ('$', '%')
+    assert db.config.lecturas == 1
+
+
+def _servidor(guild_id, settings=None, channels=None):
+    return {'_id': f'guild:{guild_id}', 'guild_id': guild_id,
+            'settings': settings or {}, 'channels': channels or {}}
+
+
+def test_resuelve_global_servidor_y_canal(manager):
+    db = _conectar(manager, DB({'prefijo': '!', 'idioma': 'es'}))
+    db.server_settings.docs = {
+        'guild:1': _servidor(1, {'prefijo': '?'}, {'10': {'idioma': 'en'}}),
+    }
+
+    async def main():
+        await manager._refresh()
+        assert await manager.preload_guilds([1, 2]) == 2
+        return [
+            await manager.get_config('prefijo', guild_id=1),
+            await manager.get_config('idioma', guild_id=1),
+            await manager.get_config('idioma', guild_id=1, channel_id=10),
+            await manager.get_config('prefijo', guild_id=1, channel_id=10),
+            await manager.get_config('prefijo', guild_id=2),
+        ]
+
+    assert asyncio.run(main()) == ['?', 'es', 'en', '?', '!']
+    # Una sola consulta para todos los servidores; las vistas quedan cacheadas
+    assert db.server_settings.lecturas == 1
+
+
+def test_la_precarga_antes_de_conectar_se_hace_al_conectar(manager):
+    db = DB({'prefijo': '!'})
+    db.server_settings.docs = {'guild:1': _servidor(1, {'prefijo': '?'})}
+
+    async def main():
+        assert await manager.preload_guilds([1]) == 0
+        # Sin conexión no se cachea ninguna vista del servidor
+        assert await manager.get_config('prefijo', 'x', guild_id=1) == 'x'
+        assert 1 not in manager._guild_overlays
+        _conectar(manager, db)
+        await manager._connect()
+        return await manager.get_config('prefijo', guild_id=1)
+
+    assert asyncio.run(main()) == '?'
+    assert db.server_settings.lecturas == 1
+
+
+def test_un_servidor_nuevo_se_lee_en_su_primer_uso(manager):
+    db = _conectar(manager, DB({'prefijo': '!'}))
+    db.server_settings.docs = {'guild:3': _servidor(3, {'prefijo': '>'})}
+
+    async def main():
+        await manager._refresh()
+        return [await manager.get_config('prefijo', guild_id=3) for _ in range(3)]
+
+    assert asyncio.run(main()) == ['>'] * 3
+    assert db.server_settings.lecturas == 1
+
+
+def test_un_error_de_lectura_no_se_reintenta_en_cada_mensaje(manager):
+    db = _conectar(manager, DB({'prefijo': '!'}))
+    db.server_settings.error = RuntimeError('MongoDB no responde')
+
+    async def main():
+        await manager._refresh()
+        return [await manager.get_config('prefijo', guild_id=4) for _ in range(3)]
+
+    assert asyncio.run(main()) == ['!'] * 3
+    assert db.server_settings.lecturas == 1
+
+
+def test_set_config_de_un_servidor_solo_invalida_ese_servidor(manager):
+    db = _conectar(manager, DB({'prefijo': '!'}))
+    db.server_settings.docs = {'guild:1': _servidor(1), 'guild:2': _servidor(2)}
+
+    async def main():
+        await manager._refresh()
+        await manager.preload_guilds([1, 2])
+        vista_2 = await manager._resolve(2, None)
+        assert await manager.set_config('prefijo', '#', guild_id=1, channel_id=10)
+        assert await manager._resolve(2, None) is vista_2
+        return [
+            await manager.get_config('prefijo', guild_id=1),
+            await manager.get_config('prefijo', guild_id=1, channel_id=10),
+        ]
+
+    assert asyncio.run(main()) == ['!', '#']
+    assert db.server_settings.docs['guild:1']['channels'] == {'10': {'prefijo': '#'}}
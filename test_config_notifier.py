@@ -0,0 +1,91 @@
+"""Pruebas de los canales de aviso de cambios de configuración"""
+import threading
+import time
+
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from config_notifier import FileNotifier, MongoChangeStreamNotifier
+
+
+def _esperar(condicion, timeout=2.0):
+    limite = time.monotonic() + timeout
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.01)
+    return condicion()
+
+
+class Stream:
+    """Change stream falso: entrega sus cambios y después falla con ``error``"""
+
+    def __init__(self, cambios, error):
+        self.cambios = cambios
+        self.error = error
+        self.resume_token = None
+        self.cerrado = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        for token, cambio in self.cambios:
+            self.resume_token = token
+            yield cambio
+        if self.error is not None:
+            raise self.error
+        self.cerrado.wait()
+
+    def close(self):
+        self.cerrado.set()
+
+
+class DB:
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.resume_after = []
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.resume_after.append(resume_after)
+        return self.streams.pop(0)
+
+
+def _cambio(valor):
+    return {'ns': {'coll': 'config'},
+            'fullDocument': {'_id': 'bot_config', 'settings': {'prefix': valor}, 'updated_by': 'otro'}}
+
+
+def test_change_stream_se_reconecta_y_retoma_desde_el_token():
+    db = DB(Stream([('t1', _cambio('!'))], AutoReconnect('primario caído')),
+            Stream([('t2', _cambio('?'))], None))
+    notifier = MongoChangeStreamNotifier(db, max_backoff=0.01)
+    recibidos = []
+    notifier.start(recibidos.append)
+    assert _esperar(lambda: len(recibidos) == 2)
+    notifier.close()
+    assert [delta['settings']['prefix'] for delta in recibidos] == ['!', '?']
+    assert db.resume_after == [None, 't1']
+
+
+def test_change_stream_no_reintenta_en_un_servidor_standalone():
+    db = DB(Stream([], OperationFailure('sin replica set', code=40573)))
+    notifier = MongoChangeStreamNotifier(db, max_backoff=0.01)
+    notifier.start(lambda delta: None)
+    notifier._thread.join(timeout=2)
+    assert not notifier._thread.is_alive()
+    assert db.resume_after == [None]
+
+
+def test_file_notifier_entre_procesos(tmp_path):
+    path = str(tmp_path / 'cambios.jsonl')
+    emisor, receptor = FileNotifier(path, interval=0.01), FileNotifier(path, interval=0.01)
+    recibidos = []
+    emisor.start(lambda delta: recibidos.append(('emisor', delta)))
+    receptor.start(lambda delta: recibidos.append(('receptor', delta)))
+    emisor.publish({'scope': 'global', 'key': 'prefix', 'value': '$'})
+    assert _esperar(lambda: recibidos)
+    time.sleep(0.05)
+    emisor.close()
+    receptor.close()
+    assert [(quien, delta['value']) for quien, delta in recibidos] == [('receptor', '$')]
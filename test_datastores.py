@@ -0,0 +1,193 @@
+"""Pruebas compartidas por los almacenes locales (archivos, SQLite y provisional)
+
+Cada prueba corre contra los tres con los mismos datos, así cualquier
+diferencia de comportamiento con MongoDB salta en todos por igual.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import FileDataStore, SqliteDataStore
+from datastore import ProvisionalDataStore
+from retention import RetentionPolicy
+
+USUARIOS = [
+    {'_id': 'u1', 'nombre': 'ana', 'edad': 31, 'guild': 1, 'perfil': {'nivel': 3}},
+    {'_id': 'u2', 'nombre': 'beto', 'edad': 25, 'guild': 1, 'perfil': {'nivel': 7}},
+    {'_id': 'u3', 'nombre': 'carla', 'edad': 40, 'guild': 2, 'perfil': {'nivel': 5}},
+    {'_id': 'u4', 'nombre': 'dani', 'edad': 25, 'guild': 2},
+]
+
+
+def _crear(tipo, path, retention=None):
+    if tipo == 'file':
+        return FileDataStore(str(path / 'data'), write_window=0, retention=retention)
+    if tipo == 'sqlite':
+        return SqliteDataStore(str(path / 'bot.db'), retention=retention)
+    return ProvisionalDataStore(str(path / 'provisional.json'), write_window=0, retention=retention)
+
+
+@pytest.fixture(params=['file', 'sqlite', 'provisional'])
+def store(request, tmp_path):
+    store = _crear(request.param, tmp_path, retention={})
+    yield store
+    if hasattr(store, 'close'):
+        store.close()
+
+
+@pytest.fixture
+def usuarios(store):
+    store.insert_many('usuarios', [dict(doc) for doc in USUARIOS])
+    return store
+
+
+def _ids(docs):
+    return [doc['_id'] for doc in docs]
+
+
+def test_find_one_devuelve_copia(usuarios):
+    doc = usuarios.find_one('usuarios', {'nombre': 'ana'})
+    assert doc['_id'] == 'u1'
+    doc['edad'] = 99
+    assert usuarios.find_one('usuarios', {'_id': 'u1'})['edad'] == 31
+    assert usuarios.find_one('usuarios', {'nombre': 'nadie'}) is None
+
+
+def test_find_igualdad_y_campos_anidados(usuarios):
+    assert sorted(_ids(usuarios.find('usuarios', {'guild': 1}))) == ['u1', 'u2']
+    assert _ids(usuarios.find('usuarios', {'perfil.nivel': 5})) == ['u3']
+    assert len(list(usuarios.find('usuarios'))) == 4
+
+
+@pytest.mark.parametrize('query, esperado', [
+    ({'edad': {'$gt': 25}}, ['u1', 'u3']),
+    ({'edad': {'$gte': 31, '$lt': 40}}, ['u1']),
+    ({'edad': {'$lte': 25}}, ['u2', 'u4']),
+    ({'edad': {'$ne': 25}}, ['u1', 'u3']),
+    ({'nombre': {'$in': ['ana', 'dani', 'otro']}}, ['u1', 'u4']),
+    ({'nombre': {'$nin': ['ana', 'dani']}}, ['u2', 'u3']),
+    ({'perfil': {'$exists': False}}, ['u4']),
+    ({'perfil.nivel': {'$gt': 4}}, ['u2', 'u3']),
+    ({'perfil.nivel': None}, ['u4']),
+])
+def test_operadores(usuarios, query, esperado):
+    assert sorted(_ids(usuarios.find('usuarios', query))) == esperado
+
+
+@pytest.mark.parametrize('query, esperado', [
+    ({'v': {'$gt': 1}}, ['a', 'h']),
+    ({'v': {'$gte': 1}}, ['a', 'g', 'h']),
+    ({'v': {'$lt': 'z'}}, ['b']),
+    ({'v': {'$gt': {'k': 0}}}, []),
+    ({'v': {'$lte': None}}, []),
+])
+def test_rangos_solo_comparan_el_mismo_tipo(store, query, esperado):
+    store.insert_many('mezcla', [
+        {'_id': 'a', 'v': 5}, {'_id': 'b', 'v': 'x'}, {'_id': 'c', 'v': [1]}, {'_id': 'd', 'v': None},
+        {'_id': 'e', 'v': {'k': 1}}, {'_id': 'f'}, {'_id': 'g', 'v': True}, {'_id': 'h', 'v': 1.5},
+    ])
+    assert sorted(_ids(store.find('mezcla', query))) == esperado
+
+
+def test_sort_skip_limit_y_proyeccion(usuarios):
+    cursor = usuarios.find('usuarios', sort=[('edad', 1), ('nombre', -1)])
+    assert _ids(cursor) == ['u4', 'u2', 'u1', 'u3']
+    cursor = usuarios.find('usuarios').sort('edad', -1).skip(1).limit(2)
+    assert _ids(cursor) == ['u1', 'u2']
+    docs = usuarios.find('usuarios', {'_id': 'u3'}, projection={'nombre': 1})
+    assert list(docs) == [{'_id': 'u3', 'nombre': 'carla'}]
+
+
+def test_update_one(usuarios):
+    resultado = usuarios.update_one('usuarios', {'edad': 25}, {'$set': {'edad': 26, 'activo': True}})
+    assert resultado['matched_count'] == 1
+    assert len(list(usuarios.find('usuarios', {'activo': True, 'edad': 26}))) == 1
+    assert usuarios.update_one('usuarios', {'_id': 'u9'}, {'$set': {'edad': 1}})['matched_count'] == 0
+
+
+def test_update_many_y_delete_many(usuarios):
+    resultado = usuarios.update_many('usuarios', {'edad': 25}, {'$set': {'joven': True}})
+    assert resultado.matched_count == 2 and resultado.modified_count == 2
+    assert sorted(_ids(usuarios.find('usuarios', {'joven': True}))) == ['u2', 'u4']
+    resultado = usuarios.update_many('usuarios', {'_id': 'u9'}, {'$set': {'edad': 1}}, upsert=True)
+    assert resultado.upserted_id == 'u9'
+    assert usuarios.delete_many('usuarios', {'guild': 2}).deleted_count == 2
+    assert sorted(_ids(usuarios.find('usuarios'))) == ['u1', 'u2', 'u9']
+
+
+def test_bulk_write_mezclado(usuarios):
+    resultado = usuarios.bulk_write('usuarios', [
+        InsertOne({'_id': 'u5', 'nombre': 'eva', 'edad': 22, 'guild': 3}),
+        UpdateOne({'_id': 'u1'}, {'$set': {'edad': 50}}),
+        UpdateMany({'guild': 2}, {'$inc': {'edad': 1}}),
+        ReplaceOne({'_id': 'u2'}, {'nombre': 'beto', 'edad': 26}),
+        DeleteOne({'_id': 'u4'}),
+        DeleteMany({'guild': 99}),
+    ])
+    assert resultado.inserted_count == 1
+    assert resultado.matched_count == 4
+    assert resultado.deleted_count == 1
+    edades = {doc['_id']: doc['edad'] for doc in usuarios.find('usuarios')}
+    assert edades == {'u1': 50, 'u2': 26, 'u3': 41, 'u5': 22}
+
+
+def test_bulk_write_ordenado_se_detiene_en_duplicado(usuarios):
+    with pytest.raises(BulkWriteError) as error:
+        usuarios.bulk_write('usuarios', [
+            InsertOne({'_id': 'u6', 'nombre': 'fer'}),
+            InsertOne({'_id': 'u1', 'nombre': 'repetido'}),
+            InsertOne({'_id': 'u7', 'nombre': 'gabi'}),
+        ])
+    assert error.value.details['nInserted'] == 1
+    assert usuarios.find_one('usuarios', {'_id': 'u6'}) is not None
+    assert usuarios.find_one('usuarios', {'_id': 'u7'}) is None
+    assert usuarios.find_one('usuarios', {'_id': 'u1'})['nombre'] == 'ana'
+
+
+def test_bulk_write_desordenado_sigue_tras_duplicado(usuarios):
+    with pytest.raises(BulkWriteError) as error:
+        usuarios.bulk_write('usuarios', [
+            InsertOne({'_id': 'u1', 'nombre': 'repetido'}),
+            InsertOne({'_id': 'u7', 'nombre': 'gabi'}),
+        ], ordered=False)
+    assert error.value.details['nInserted'] == 1
+    assert usuarios.find_one('usuarios', {'_id': 'u7'}) is not None
+
+
+@pytest.mark.parametrize('tipo', ['file', 'sqlite', 'provisional'])
+def test_retencion_max_docs(tmp_path, tipo):
+    store = _crear(tipo, tmp_path, retention={'logs': RetentionPolicy(max_docs=3)})
+    for i in range(5):
+        store.insert_one('logs', {'n': i})
+    assert sorted(doc['n'] for doc in store.find('logs')) == [2, 3, 4]
+    if hasattr(store, 'close'):
+        store.close()
+
+
+@pytest.mark.parametrize('tipo', ['file', 'sqlite', 'provisional'])
+def test_retencion_ttl(tmp_path, tipo):
+    store = _crear(tipo, tmp_path, retention={'logs': RetentionPolicy(ttl_seconds=60)})
+    ahora = datetime.now(timezone.utc)
+    store.insert_one('logs', {'n': 'viejo', 'created_at': (ahora - timedelta(hours=1)).isoformat()})
+    store.insert_one('logs', {'n': 'nuevo', 'created_at': ahora.isoformat()})
+    assert [doc['n'] for doc in store.find('logs')] == ['nuevo']
+    if hasattr(store, 'close'):
+        store.close()
+
+
+@pytest.mark.parametrize('tipo', ['file', 'sqlite', 'provisional'])
+def test_datos_persisten_al_reabrir(tmp_path, tipo):
+    store = _crear(tipo, tmp_path, retention={})
+    store.insert_many('usuarios', [dict(doc) for doc in USUARIOS])
+    store.update_one('usuarios', {'_id': 'u2'}, {'$set': {'edad': 30}})
+    store.delete_many('usuarios', {'_id': 'u4'})
+    if hasattr(store, 'close'):
+        store.close()
+    else:
+        store.flush()
+    store = _crear(tipo, tmp_path, retention={})
+    assert {doc['_id']: doc['edad'] for doc in store.find('usuarios')} == {'u1': 31, 'u2': 30, 'u3': 40}
+    if hasattr(store, 'close'):
+        store.close()
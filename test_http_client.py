@@ -0,0 +1,109 @@
+"""Pruebas de los reintentos y la espera de HttpClient con un transporte falso"""
+import asyncio
+
+import httpx
+import pytest
+
+import http_client
+from http_client import HttpClient
+
+
+class Servidor:
+    """Responde en orden las respuestas dadas (un status, un par status/headers o una excepción)"""
+
+    def __init__(self, *respuestas):
+        self.respuestas = list(respuestas)
+        self.pedidos = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.pedidos.append(request)
+        respuesta = self.respuestas.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        if isinstance(respuesta, tuple):
+            status, headers = respuesta
+            return httpx.Response(status, headers=headers, json={})
+        return httpx.Response(respuesta, json={'ok': respuesta == 200})
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Registra las esperas entre reintentos en lugar de dormir"""
+    registradas = []
+
+    async def sleep(segundos):
+        registradas.append(segundos)
+
+    monkeypatch.setattr(http_client.asyncio, 'sleep', sleep)
+    return registradas
+
+
+def _pedir(servidor, retries=3, **kwargs):
+    async def main():
+        client = HttpClient(retries=retries, backoff=0.5, max_backoff=8.0,
+                            transport=httpx.MockTransport(servidor))
+        try:
+            return await client.get('https://api.test/v1/palabras', **kwargs)
+        finally:
+            await client.close()
+    return asyncio.run(main())
+
+
+def test_reintenta_5xx_hasta_responder(esperas):
+    servidor = Servidor(503, 502, 200)
+    response = _pedir(servidor)
+    assert response.status_code == 200
+    assert len(servidor.pedidos) == 3
+    assert len(esperas) == 2
+    # Jitter completo: cada espera está entre 0 y backoff * 2 ** intento
+    assert 0 <= esperas[0] <= 0.5 and 0 <= esperas[1] <= 1.0
+
+
+def test_respeta_retry_after(esperas):
+    servidor = Servidor((429, {'Retry-After': '3'}), (429, {'Retry-After': '120'}), 200)
+    response = _pedir(servidor)
+    assert response.status_code == 200
+    # El valor del servidor se usa tal cual, acotado por max_backoff
+    assert esperas == [3.0, 8.0]
+
+
+def test_devuelve_la_ultima_respuesta_al_agotar_reintentos(esperas):
+    servidor = Servidor(500, 500, 500)
+    response = _pedir(servidor, retries=2)
+    assert response.status_code == 500
+    assert len(servidor.pedidos) == 3 and len(esperas) == 2
+
+
+def test_no_reintenta_errores_del_cliente(esperas):
+    servidor = Servidor(404)
+    response = _pedir(servidor)
+    assert response.status_code == 404
+    assert len(servidor.pedidos) == 1 and esperas == []
+
+
+def test_errores_de_red(esperas):
+    servidor = Servidor(httpx.ConnectError('sin red'), 200)
+    response = _pedir(servidor)
+    assert response.status_code == 200
+
+    servidor = Servidor(*[httpx.ReadTimeout('lento')] * 2)
+    with pytest.raises(httpx.ReadTimeout):
+        _pedir(servidor, retries=1)
+
+
+def test_latencias_por_endpoint(esperas):
+    servidor = Servidor(503, 200, 200)
+
+    async def main():
+        client = HttpClient(transport=httpx.MockTransport(servidor))
+        try:
+            await client.get('https://api.test/v1/palabras', endpoint='palabras')
+            await client.get('https://api.test/v1/otro')
+        finally:
+            await client.close()
+        return client.latency.snapshot()
+
+    stats = asyncio.run(main())
+    assert stats['palabras']['count'] == 2
+    assert stats['palabras']['errors'] == 1
+    assert stats['api.test/v1/otro']['count'] == 1
@@ -0,0 +1,221 @@
+"""Pruebas de los vencimientos de GameSessionManager y de la reserva de palabras"""
+import asyncio
+
+import pytest
+
+from juegos import BancoPalabras, EstadoJuego, GameSessionManager, JuegoAhorcado, PrefetchPalabras
+from storage_io import read_file
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj():
+    return Reloj()
+
+
+@pytest.fixture
+def sesiones(reloj):
+    manager = GameSessionManager(timeout=10)
+    manager._ahora = reloj
+    return manager
+
+
+def test_vence_sin_actividad(sesiones, reloj):
+    vencidas = []
+    juego = sesiones.agregar(1, 2, 3, JuegoAhorcado('PYTHON'),
+                             al_expirar=lambda clave, j: vencidas.append(clave))
+    reloj.ahora += 9
+    sesiones._vencer(reloj())
+    assert sesiones.obtener(1, 2, 3) is juego and vencidas == []
+    reloj.ahora += 1
+    sesiones._vencer(reloj())
+    assert sesiones.obtener(1, 2, 3) is None
+    assert juego.estado == EstadoJuego.CANCELADO
+    assert vencidas == [(1, 2, 3)]
+    assert sesiones.estadisticas()['expiradas'] == 1
+
+
+def test_renovar_corre_el_plazo(sesiones, reloj):
+    juego = sesiones.agregar(1, 2, None, JuegoAhorcado('PYTHON'))
+    for _ in range(3):
+        reloj.ahora += 8
+        assert sesiones.renovar(1, 2)
+        sesiones._vencer(reloj())
+    assert sesiones.obtener(1, 2) is juego
+    # Las entradas viejas del heap se descartan sin desalojar la partida
+    assert sesiones.estadisticas()['desalojadas'] == 0
+    reloj.ahora += 10
+    sesiones._vencer(reloj())
+    assert sesiones.obtener(1, 2) is None
+    assert sesiones.expiradas == 1
+
+
+def test_partidas_terminadas_se_quitan_sin_avisar(sesiones, reloj):
+    vencidas = []
+    juego = sesiones.agregar(1, 2, 3, JuegoAhorcado('PYTHON'),
+                             al_expirar=lambda clave, j: vencidas.append(clave))
+    juego.estado = EstadoJuego.TERMINADO
+    assert not sesiones.renovar(1, 2, 3)
+    assert len(sesiones) == 0
+
+    juego = sesiones.agregar(1, 2, 4, JuegoAhorcado('PYTHON'),
+                             al_expirar=lambda clave, j: vencidas.append(clave))
+    juego.estado = EstadoJuego.TERMINADO
+    reloj.ahora += 10
+    sesiones._vencer(reloj())
+    assert len(sesiones) == 0 and vencidas == [] and sesiones.expiradas == 0
+
+
+def test_reemplazar_y_quitar(sesiones, reloj):
+    vieja = sesiones.agregar(1, 2, 3, JuegoAhorcado('PYTHON'))
+    reloj.ahora += 5
+    nueva = sesiones.agregar(1, 2, 3, JuegoAhorcado('JAVA'))
+    reloj.ahora += 5
+    sesiones._vencer(reloj())
+    # El plazo de la partida reemplazada no afecta a la nueva
+    assert sesiones.obtener(1, 2, 3) is nueva
+    assert vieja.estado != EstadoJuego.CANCELADO
+    assert sesiones.quitar(1, 2, 3) is nueva
+    assert sesiones.quitar(1, 2, 3) is None
+
+
+def test_el_programador_vence_y_espera_los_avisos():
+    avisos = []
+
+    async def al_expirar(clave, juego):
+        await asyncio.sleep(0)
+        avisos.append(clave)
+
+    async def fallar(clave, juego):
+        raise RuntimeError('canal borrado')
+
+    async def main():
+        sesiones = GameSessionManager(timeout=60)
+        sesiones.start()
+        sesiones.agregar(1, 1, None, JuegoAhorcado('PYTHON'))
+        # Un plazo más cercano despierta al programador antes de tiempo
+        sesiones.agregar(1, 2, None, JuegoAhorcado('PYTHON'), timeout=0.02, al_expirar=al_expirar)
+        sesiones.agregar(1, 3, None, JuegoAhorcado('PYTHON'), timeout=0.02, al_expirar=fallar)
+        await asyncio.sleep(0.1)
+        await sesiones.close()
+        return sesiones
+
+    sesiones = asyncio.run(main())
+    assert avisos == [(1, 2, None)]
+    assert sesiones._avisos == set()
+    assert len(sesiones) == 1 and sesiones.expiradas == 2
+
+
+class Generador:
+    """Devuelve lotes de palabras numeradas y registra cada pedido"""
+
+    def __init__(self, falla=False):
+        self.falla = falla
+        self.pedidos = []
+
+    async def __call__(self, tema, cantidad, evitar):
+        self.pedidos.append((tema, cantidad, list(evitar)))
+        if self.falla:
+            return []
+        inicio = len(self.pedidos) * 100
+        return [(f'PALABRA{chr(65 + i)}{inicio}', ['pista uno', 'pista dos']) for i in range(cantidad)]
+
+
+def _prefetch(tmp_path, generador, **kwargs):
+    banco = BancoPalabras(str(tmp_path / 'banco.json'))
+    return PrefetchPalabras(str(tmp_path / 'prefetch.json'), capacidad=4, minimo=2, lote=6,
+                            banco=banco, generador=generador, **kwargs)
+
+
+def test_rellena_hasta_la_capacidad_con_un_solo_pedido(tmp_path):
+    generador = Generador()
+
+    async def main():
+        prefetch = _prefetch(tmp_path, generador)
+        prefetch.start(['animales'])
+        await prefetch._rellenos['animales']
+        disponibles = prefetch.disponibles('animales')
+        await prefetch.close()
+        return prefetch, disponibles
+
+    prefetch, disponibles = asyncio.run(main())
+    assert disponibles == 4
+    assert generador.pedidos == [('animales', 6, [])]
+    # Las palabras en la reserva ya cuentan como usadas en el banco
+    assert prefetch.banco.sin_usar('animales') == 2
+
+
+def test_sirve_de_la_reserva_y_repone_al_bajar_del_minimo(tmp_path):
+    generador = Generador()
+
+    async def main():
+        prefetch = _prefetch(tmp_path, generador)
+        prefetch.start(['animales'])
+        await prefetch._rellenos['animales']
+        servidas = [prefetch.tomar('animales') for _ in range(3)]
+        assert prefetch.disponibles('animales') == 1
+        await prefetch._rellenos['animales']
+        disponibles = prefetch.disponibles('animales')
+        await prefetch.close()
+        return servidas, disponibles
+
+    servidas, disponibles = asyncio.run(main())
+    assert len({palabra for palabra, _ in servidas}) == 3
+    assert disponibles == 4
+    # El relleno usó las palabras sin usar del banco antes de volver a pedir
+    assert len(generador.pedidos) == 2
+    assert len(generador.pedidos[1][2]) == 6
+
+
+def test_la_reserva_sobrevive_al_reinicio(tmp_path):
+    generador = Generador()
+
+    async def llenar():
+        prefetch = _prefetch(tmp_path, generador)
+        prefetch.start(['frutas'])
+        await prefetch._rellenos['frutas']
+        await prefetch.close()
+        return list(prefetch._colas['frutas'])
+
+    guardadas = asyncio.run(llenar())
+    assert [tuple(par) for par in read_file(str(tmp_path / 'prefetch.json'))['frutas']] == \
+        [(palabra, pistas) for palabra, pistas in guardadas]
+
+    async def reabrir():
+        prefetch = _prefetch(tmp_path, generador)
+        # Con la reserva llena, arrancar no lanza ningún relleno
+        prefetch.start(['frutas'])
+        par = prefetch.tomar('frutas')
+        await prefetch.close()
+        return prefetch, par
+
+    prefetch, par = asyncio.run(reabrir())
+    assert par == guardadas[0]
+    assert len(generador.pedidos) == 1
+
+
+def test_sin_api_reusa_las_palabras_menos_usadas_del_banco(tmp_path):
+    generador = Generador(falla=True)
+    banco = BancoPalabras(str(tmp_path / 'banco.json'))
+
+    async def main():
+        banco.agregar('deportes', [('FUTBOL', ['Once jugadores', 'Con pelota'])])
+        banco.tomar('deportes')
+        prefetch = _prefetch(tmp_path, generador)
+        prefetch.banco = banco
+        prefetch.start(['deportes', 'vacio'])
+        await asyncio.gather(*prefetch._rellenos.values())
+        resultado = prefetch.tomar('deportes'), prefetch.tomar('vacio')
+        await prefetch.close()
+        return resultado
+
+    assert asyncio.run(main()) == (('FUTBOL', ['Once jugadores', 'Con pelota']), None)
+    # Un pedido por tema y relleno; el fallo no deja la reserva reintentando en bucle
+    assert sorted(tema for tema, _, _ in generador.pedidos) == ['deportes', 'vacio']
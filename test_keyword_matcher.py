@@ -0,0 +1,44 @@
+"""Pruebas del matcher compilado de palabras clave"""
+from keyword_matcher import KeywordMatcher, get_matcher
+
+
+def test_ignora_mayusculas_acentos_y_espacios():
+    matcher = KeywordMatcher(['Código', 'base de datos', 'función'])
+    assert matcher.search('Mirá este CODIGO') == 'codigo'
+    assert matcher.search('una   Base  de\tdatos') == 'base de datos'
+    assert matcher.search('la funcion main') == 'funcion'
+
+
+def test_solo_palabras_completas():
+    matcher = KeywordMatcher(['app', 'c++', 'c#', 'if'])
+    assert matcher.search('me gusta apple') is None
+    assert matcher.search('una app nueva') == 'app'
+    assert matcher.search('sé c++ y c#') == 'c++'
+    assert matcher.find_all('sé c++ y c#') == ['c++', 'c#']
+    assert matcher.search('el gif') is None
+
+
+def test_prefijos_comunes_y_repetidas():
+    matcher = KeywordMatcher(['nodo', 'nodo hoja', 'nodo', 'Nodo Hoja', 'java', 'javascript'])
+    assert len(matcher) == 4
+    assert matcher.search('un nodo hoja suelto') == 'nodo hoja'
+    assert matcher.search('javascript o java') == 'javascript'
+    assert matcher.find_all('javascript o java') == ['javascript', 'java']
+
+
+def test_lista_vacia():
+    matcher = KeywordMatcher(['', '   '])
+    assert len(matcher) == 0
+    assert matcher.search('cualquier cosa') is None
+    assert matcher.find_all('cualquier cosa') == []
+
+
+def test_get_matcher_recompila_solo_si_cambia_la_lista():
+    palabras = ['python', 'sql']
+    matcher = get_matcher(palabras, name='prueba')
+    assert get_matcher(palabras, name='prueba') is matcher
+    # Otra lista con el mismo contenido reutiliza el matcher
+    assert get_matcher(list(palabras), name='prueba') is matcher
+    nuevo = get_matcher(palabras + ['docker'], name='prueba')
+    assert nuevo is not matcher
+    assert nuevo.search('uso docker') == 'docker'
@@ -1,9 +1,10 @@
 import os
 import sys
 import datetime
-from pymongo import MongoClient
 from dotenv import load_dotenv
 
+import mongo_pool
+
 def print_safe(text):
     """Función para imprimir texto seguro en la consola de Windows"""
     try:
@@ -40,7 +41,7 @@ try:
         print_safe(f"[i] URI: {MONGODB_URI}")
     
     # Conectar a MongoDB
-    client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=10000)  # 10 segundos de timeout
+    client = mongo_pool.get_client(MONGODB_URI)
     
     # Verificar la conexión
     client.server_info()
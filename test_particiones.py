@@ -0,0 +1,79 @@
+"""Pruebas de FileDataStore con colecciones particionadas por campo"""
+import json
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from config import FileDataStore
+from retention import RetentionPolicy
+
+
+def _store(path, **kwargs):
+    return FileDataStore(str(path), write_window=0, retention={}, partitions={'logs': 'guild_id'}, **kwargs)
+
+
+def test_migra_el_archivo_unico_al_activar_particiones(tmp_path):
+    sin_particiones = FileDataStore(str(tmp_path), write_window=0, retention={})
+    sin_particiones.insert_many('logs', [
+        {'_id': 'a', 'guild_id': 1, 'msg': 'hola'},
+        {'_id': 'b', 'guild_id': 2, 'msg': 'chau'},
+        {'_id': 'c', 'guild_id': 1, 'msg': 'otra'},
+    ])
+    
+    store = _store(tmp_path)
+    assert sorted(doc['_id'] for doc in store.find('logs')) == ['a', 'b', 'c']
+    assert [doc['_id'] for doc in store.find('logs', {'guild_id': 2})] == ['b']
+    assert not (tmp_path / 'logs.json').exists()
+    assert (tmp_path / 'logs.json.migrado').exists()
+    assert set(json.loads((tmp_path / 'logs' / '1.json').read_text())) == {'a', 'c'}
+    
+    # Un almacén nuevo lee directamente las particiones
+    reabierto = _store(tmp_path)
+    assert reabierto.find_one('logs', {'_id': 'b'})['msg'] == 'chau'
+    assert len(list(reabierto.find('logs'))) == 3
+
+
+def test_migra_antes_de_la_primera_escritura(tmp_path):
+    FileDataStore(str(tmp_path), write_window=0, retention={}).insert_many(
+        'logs', [{'_id': 'a', 'guild_id': 1}])
+    store = _store(tmp_path)
+    store.insert_many('logs', [{'_id': 'b', 'guild_id': 1}])
+    assert sorted(doc['_id'] for doc in store.find('logs', {'guild_id': 1})) == ['a', 'b']
+
+
+def test_cada_valor_se_guarda_en_su_archivo(tmp_path):
+    store = _store(tmp_path)
+    store.insert_many('logs', [{'_id': 'a', 'guild_id': 1}, {'_id': 'b', 'guild_id': 2},
+                               {'_id': 'c', 'guild_id': 'x/y'}])
+    assert sorted(p.name for p in (tmp_path / 'logs').iterdir()) == ['1.json', '2.json', 'x_y.json']
+    # Una igualdad sobre la clave lee una sola partición
+    assert store._units('logs', {'guild_id': 2, 'nivel': 3}) == ['logs/2']
+    assert store._units('logs', {'guild_id': {'$in': [1, 2]}}) == ['logs/1', 'logs/2', 'logs/x_y']
+    assert [doc['_id'] for doc in store.find('logs', {'guild_id': 'x/y'})] == ['c']
+
+
+def test_cambiar_la_clave_mueve_el_documento(tmp_path):
+    store = _store(tmp_path)
+    store.insert_many('logs', [{'_id': 'a', 'guild_id': 1, 'n': 0}])
+    store.update_many('logs', {'_id': 'a'}, {'$set': {'guild_id': 2}, '$inc': {'n': 1}})
+    
+    reabierto = _store(tmp_path)
+    assert list(reabierto.find('logs', {'guild_id': 1})) == []
+    assert reabierto.find_one('logs', {'guild_id': 2}) == {'_id': 'a', 'guild_id': 2, 'n': 1}
+
+
+def test_id_duplicado_en_otra_particion(tmp_path):
+    store = _store(tmp_path)
+    store.insert_many('logs', [{'_id': 'a', 'guild_id': 1}])
+    with pytest.raises(BulkWriteError):
+        store.insert_many('logs', [{'_id': 'a', 'guild_id': 2}])
+    assert [doc['guild_id'] for doc in store.find('logs')] == [1]
+
+
+def test_la_retencion_rige_por_particion(tmp_path):
+    store = FileDataStore(str(tmp_path), write_window=0, partitions={'logs': 'guild_id'},
+                          retention={'logs': RetentionPolicy(max_docs=2)})
+    for i in range(3):
+        store.insert_one('logs', {'guild_id': 1, 'n': i})
+        store.insert_one('logs', {'guild_id': 2, 'n': i})
+    assert sorted((doc['guild_id'], doc['n']) for doc in store.find('logs')) == [(1, 1), (1, 2), (2, 1), (2, 2)]
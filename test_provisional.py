@@ -0,0 +1,118 @@
+"""Pruebas propias de ProvisionalDataStore: índices en memoria y journal"""
+import pytest
+
+from datastore import ProvisionalDataStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ProvisionalDataStore(str(tmp_path / 'provisional.json'), write_window=0, retention={})
+    yield store
+    store.close()
+
+
+def test_update_one_mantiene_indices_anidados(store):
+    store.create_index('usuarios', 'perfil.nivel')
+    store.insert_one('usuarios', {'_id': 'u1', 'perfil': {'nivel': 3}})
+    store.update_one('usuarios', {'_id': 'u1'}, {'$set': {'perfil': {'nivel': 9}}})
+    assert store.find_one('usuarios', {'perfil.nivel': 9})['_id'] == 'u1'
+    assert store.find_one('usuarios', {'perfil.nivel': 3}) is None
+    
+    store.update_one('usuarios', {'_id': 'u1'}, {'$inc': {'perfil.nivel': 1}})
+    assert store.find_one('usuarios', {'perfil.nivel': 10})['_id'] == 'u1'
+
+
+def test_update_one_usa_rutas_con_puntos(store):
+    store.create_index('usuarios', 'perfil')
+    store.insert_one('usuarios', {'_id': 'u1', 'perfil': {'nivel': 3, 'xp': 0}})
+    resultado = store.update_one('usuarios', {'_id': 'u1'}, {'$set': {'perfil.nivel': 4}, '$inc': {'puntos': 2}})
+    assert resultado == {'matched_count': 1, 'modified_count': 1}
+    doc = store.find_one('usuarios', {'perfil': {'nivel': 4, 'xp': 0}})
+    assert doc['puntos'] == 2 and 'perfil.nivel' not in doc
+    
+    assert store.update_one('usuarios', {'_id': 'u1'}, {'$set': {'puntos': 2}})['modified_count'] == 0
+    with pytest.raises(ValueError):
+        store.update_one('usuarios', {'_id': 'u1'}, {'$push': {'tags': 'x'}})
+
+
+def test_update_one_se_reproduce_desde_el_journal(tmp_path, store):
+    store.insert_one('usuarios', {'_id': 'u1', 'perfil': {'nivel': 3}})
+    store.update_one('usuarios', {'_id': 'u1'}, {'$set': {'perfil.nivel': 5}, '$inc': {'puntos': 1}})
+    store.close()
+    
+    reabierto = ProvisionalDataStore(str(tmp_path / 'provisional.json'), retention={})
+    doc = reabierto.find_one('usuarios', {'_id': 'u1'})
+    assert doc['perfil'] == {'nivel': 5} and doc['puntos'] == 1
+    reabierto.close()
+
+
+def test_find_copia_solo_lo_devuelto_y_en_profundidad(store):
+    store.insert_many('logs', [{'n': i, 'meta': {'a': i}} for i in range(5)])
+    docs = store.find('logs', sort=[('n', -1)], skip=1, limit=2).to_list()
+    assert [doc['n'] for doc in docs] == [3, 2]
+    docs[0]['meta']['a'] = 'cambiado'
+    store.find_one('logs', {'n': 2})['meta']['a'] = 'cambiado'
+    assert [doc['meta']['a'] for doc in store.find('logs', {'n': {'$in': [2, 3]}})] == [2, 3]
+
+
+def _reabrir(tmp_path, **kwargs):
+    return ProvisionalDataStore(str(tmp_path / 'provisional.json'), retention={}, **kwargs)
+
+
+def test_journal_se_reproduce_al_reabrir(tmp_path, store):
+    store.insert_many('usuarios', [{'_id': 'u1', 'xp': 1}, {'_id': 'u2', 'xp': 2}])
+    store.update_one('usuarios', {'_id': 'u1'}, {'$inc': {'xp': 10}})
+    store.delete_many('usuarios', {'_id': 'u2'})
+    store.close()
+    # Las mutaciones solo se agregan al journal; la instantánea no se reescribe
+    assert not (tmp_path / 'provisional.json').exists()
+    assert (tmp_path / 'provisional.journal').exists()
+    
+    reabierto = _reabrir(tmp_path)
+    assert [(doc['_id'], doc['xp']) for doc in reabierto.find('usuarios')] == [('u1', 11)]
+    reabierto.close()
+
+
+def test_linea_incompleta_del_journal_se_recorta(tmp_path, store):
+    store.insert_one('usuarios', {'_id': 'u1', 'xp': 1})
+    store.close()
+    # Caída a mitad de una escritura: queda una línea sin terminar
+    with open(tmp_path / 'provisional.journal', 'ab') as f:
+        f.write(b'{"seq": 2, "op": "insert", "c": "usu')
+    
+    reabierto = _reabrir(tmp_path)
+    assert [doc['_id'] for doc in reabierto.find('usuarios')] == ['u1']
+    # Lo escrito después no queda pegado a la línea rota
+    reabierto.insert_one('usuarios', {'_id': 'u2', 'xp': 2})
+    reabierto.close()
+    
+    otra_vez = _reabrir(tmp_path)
+    assert [doc['_id'] for doc in otra_vez.find('usuarios')] == ['u1', 'u2']
+    otra_vez.close()
+
+
+def test_compactacion_no_reaplica_lo_que_ya_esta_en_la_instantanea(tmp_path):
+    store = _reabrir(tmp_path, compact_threshold=1)
+    store.insert_one('contadores', {'_id': 'c', 'n': 0})
+    for _ in range(5):
+        store.update_one('contadores', {'_id': 'c'}, {'$inc': {'n': 1}})
+    store.compact()
+    store.update_one('contadores', {'_id': 'c'}, {'$inc': {'n': 1}})
+    store.close()
+    
+    reabierto = _reabrir(tmp_path)
+    assert reabierto.find_one('contadores', {'_id': 'c'})['n'] == 6
+    reabierto.close()
+
+
+def test_segmento_rotado_sin_instantanea_se_reproduce(tmp_path, store):
+    store.insert_one('usuarios', {'_id': 'u1'})
+    # Caída entre rotar el journal y escribir la instantánea
+    store._rotate_journal()
+    store.insert_one('usuarios', {'_id': 'u2'})
+    store.close()
+    assert (tmp_path / 'provisional.journal.old').exists()
+    
+    reabierto = _reabrir(tmp_path)
+    assert [doc['_id'] for doc in reabierto.find('usuarios')] == ['u1', 'u2']
+    reabierto.close()
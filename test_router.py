@@ -0,0 +1,172 @@
+"""Pruebas del circuit breaker de RouterDataStore con un MongoDB falso"""
+import time
+
+import pytest
+from pymongo import DeleteMany, DeleteOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import ConnectionFailure
+
+from datastore import PENDING_OPS, ProvisionalDataStore, RouterDataStore
+
+
+def _esperar(condicion, timeout=3.0):
+    limite = time.monotonic() + timeout
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.01)
+    return condicion()
+
+
+class Mongo:
+    """MongoDB falso sobre un ProvisionalDataStore; con ``up = False`` todo falla
+
+    Hace de ``config.MongoDataStore`` (métodos con la colección como primer
+    argumento) y de su ``client``/``db`` de PyMongo para el sondeo y la
+    sincronización.
+    """
+
+    def __init__(self, path):
+        self.store = ProvisionalDataStore(str(path / 'mongo.json'), retention={})
+        self.up = True
+        self.client = self
+        self.admin = self
+
+    def _check(self):
+        if not self.up:
+            raise ConnectionFailure('MongoDB caído')
+
+    def command(self, name):
+        self._check()
+
+    @property
+    def db(self):
+        self._check()
+        return self
+
+    def __getitem__(self, name):
+        return Coleccion(self, name)
+
+    def __getattr__(self, method):
+        func = getattr(self.store, method)
+
+        def call(*args):
+            self._check()
+            return func(*args)
+        return call
+
+    def docs(self, collection):
+        return {doc['_id']: doc for doc in self.store.find(collection)}
+
+
+class Coleccion:
+    """La parte de la API de colecciones de PyMongo que usa el router"""
+
+    def __init__(self, mongo, name):
+        self.mongo = mongo
+        self.name = name
+
+    def bulk_write(self, requests, ordered=True):
+        self.mongo._check()
+        return self.mongo.store.bulk_write(self.name, requests, ordered)
+
+    def update_one(self, filter, update):
+        return self.bulk_write([UpdateOne(filter, update)])
+
+    def update_many(self, filter, update):
+        return self.bulk_write([UpdateMany(filter, update)])
+
+    def replace_one(self, filter, replacement):
+        return self.bulk_write([ReplaceOne(filter, replacement)])
+
+    def delete_one(self, filter):
+        return self.bulk_write([DeleteOne(filter)])
+
+    def delete_many(self, filter):
+        return self.bulk_write([DeleteMany(filter)])
+
+
+@pytest.fixture
+def mongo(tmp_path):
+    mongo = Mongo(tmp_path)
+    yield mongo
+    mongo.store.close()
+
+
+@pytest.fixture
+def router(tmp_path, mongo):
+    fallback = ProvisionalDataStore(str(tmp_path / 'provisional.json'), retention={})
+    router = RouterDataStore(mongo, fallback, probe_interval=0.02)
+    assert _esperar(lambda: router.using_mongodb)
+    yield router
+    router.close()
+
+
+def _caer(router, mongo):
+    mongo.up = False
+    router._trip(ConnectionFailure('prueba'))
+    assert not router.using_mongodb
+
+
+def _volver(router, mongo):
+    mongo.up = True
+    router._wake.set()
+    assert _esperar(lambda: router.using_mongodb)
+
+
+def test_arranca_abierto_y_cierra_al_responder_mongo(tmp_path, mongo):
+    mongo.up = False
+    fallback = ProvisionalDataStore(str(tmp_path / 'provisional.json'), retention={})
+    router = RouterDataStore(mongo, fallback, probe_interval=0.02)
+    try:
+        router.insert_one('logs', {'_id': 'l1'})
+        assert not router.using_mongodb
+        assert router.find_one('logs', {'_id': 'l1'}) is not None
+        _volver(router, mongo)
+        assert 'l1' in mongo.docs('logs')
+    finally:
+        router.close()
+
+
+def test_un_corte_pasa_las_escrituras_al_almacenamiento_local(router, mongo):
+    router.insert_one('logs', {'_id': 'antes'})
+    mongo.up = False
+    # La primera operación que falla abre el circuito y se repite en local
+    router.insert_one('logs', {'_id': 'durante'})
+    assert not router.using_mongodb
+    assert [doc['_id'] for doc in router.find('logs')] == ['durante']
+    assert 'durante' not in mongo.store.data.get('logs', [])
+    
+    _volver(router, mongo)
+    assert set(mongo.docs('logs')) == {'antes', 'durante'}
+    assert not router.fallback.data['logs']
+
+
+def test_actualizaciones_y_borrados_del_corte_se_repiten_en_mongo(router, mongo):
+    router.insert_many('jugadores', [{'_id': 'm1', 'puntos': 10, 'g': 1}, {'_id': 'm2', 'puntos': 1, 'g': 1}])
+    _caer(router, mongo)
+    
+    router.insert_one('jugadores', {'_id': 'l1', 'puntos': 0, 'g': 1})
+    router.update_one('jugadores', {'_id': 'm1'}, {'$inc': {'puntos': 5}})
+    router.update_many('jugadores', {'g': 1}, {'$inc': {'puntos': 1}})
+    router.delete_many('jugadores', {'_id': 'm2'})
+    assert len(router.fallback.data[PENDING_OPS]) == 3
+    
+    _volver(router, mongo)
+    docs = mongo.docs('jugadores')
+    assert {_id: doc['puntos'] for _id, doc in docs.items()} == {'m1': 16, 'l1': 1}
+    assert not router.fallback.data[PENDING_OPS]
+
+
+def test_operaciones_pendientes_sobreviven_un_reinicio(tmp_path, router, mongo):
+    router.insert_one('jugadores', {'_id': 'm1', 'puntos': 1})
+    _caer(router, mongo)
+    router.update_one('jugadores', {'_id': 'm1'}, {'$set': {'puntos': 7}})
+    router.close()
+    
+    fallback = ProvisionalDataStore(str(tmp_path / 'provisional.json'), retention={})
+    assert len(fallback.data[PENDING_OPS]) == 1
+    mongo.up = True
+    nuevo = RouterDataStore(mongo, fallback, probe_interval=0.02)
+    try:
+        assert _esperar(lambda: nuevo.using_mongodb)
+        assert mongo.docs('jugadores')['m1']['puntos'] == 7
+    finally:
+        nuevo.close()